@@ -0,0 +1,371 @@
+import asyncio
+import functools
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+from telebot import asyncio_helper
+import config
+from dispatcher import get_chat_key
+from outbound import (
+    CHAT_LIMITED_METHODS, OUTBOUND_METHODS, PRIORITY_ADMIN, PRIORITY_USER, RateLimitedBot, TokenBucket,
+    file_positions, observe_api_call, rewind_files
+)
+
+
+# ===== Пулы потоков для блокирующей работы =====
+# SQLite и синхронные обработчики не должны останавливать цикл событий: они выполняются в ограниченных пулах.
+# Пул базы небольшой — запись в SQLite всё равно идёт по одному писателю, а лишние потоки только ждут блокировку.
+_executors = {}
+
+
+def _executor(name, workers):
+    executor = _executors.get(name)
+    if executor is None:
+        executor = _executors[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"async-{name}")
+    return executor
+
+
+async def run_db(func, *args, **kwargs):
+    """Выполняет функцию db.py в пуле базы (ASYNC_DB_WORKERS потоков) и возвращает её результат."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor("db", config.ASYNC_DB_WORKERS), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_sync(func, *args, **kwargs):
+    """Выполняет синхронный обработчик в пуле обработчиков (ASYNC_HANDLER_WORKERS потоков)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _executor("handlers", config.ASYNC_HANDLER_WORKERS), functools.partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_executors():
+    """Дожидается уже начатой работы в пулах и закрывает их."""
+    for executor in _executors.values():
+        executor.shutdown(wait=True)
+    _executors.clear()
+
+
+class _ChatLane:
+    """Состояние отправки в один чат: очередь (блокировка FIFO), корзина токенов и пауза после 429."""
+    __slots__ = ("lock", "bucket", "blocked_until", "users")
+
+    def __init__(self, rate, capacity):
+        self.lock = asyncio.Lock()
+        self.bucket = TokenBucket(rate, capacity)
+        self.blocked_until = 0
+        self.users = 0
+
+
+class AsyncOutboundScheduler:
+    """
+    Асинхронный аналог OutboundScheduler: те же лимиты Telegram (общий и по чатам), повтор после 429
+    и сетевых ошибок, но запросы выполняются корутинами AsyncTeleBot через одну общую HTTP-сессию aiohttp.
+    - В чат в полёте не больше одного запроса: запросы чата проходят через его блокировку по очереди (FIFO).
+    - Общую корзину ждёт только один запрос за раз, остальные стоят в очереди блокировки, а не просыпаются
+      все сразу. Сообщения администратору берут общий токен без очереди (корзина может уйти в минус,
+      тогда следующие клиентские сообщения подождут дольше).
+    - submit() — потокобезопасный вход с тем же интерфейсом, что у OutboundScheduler: синхронные обработчики
+      в пуле потоков, напоминания и RateLimitedBot продолжают работать без изменений.
+    """
+    def __init__(self, bot, global_rate=30, global_burst=1, chat_rate=1, chat_burst=3, max_retries=5):
+        self.bot = bot  # telebot.async_telebot.AsyncTeleBot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.stats = {"sent": 0, "failed": 0, "rate_limited": 0, "retried": 0, "max_queued": 0}
+        self.loop = None
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._global_blocked_until = 0
+        self._global_lock = None
+        self._lanes = {}  # chat_id -> _ChatLane
+        self._queued = 0
+        self._idle = None
+        self._next_prune = 0
+
+    def start(self):
+        """Привязывает планировщик к текущему циклу событий (вызывать из корутины)."""
+        self.loop = asyncio.get_running_loop()
+        self._global_lock = asyncio.Lock()
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def stop(self, timeout=30):
+        """Дожидается отправки всего, что уже поставлено в очередь."""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f"Не отправлено {self._queued} исходящих запросов к Bot API")
+
+    def submit(self, method, args=(), kwargs=None, chat_id=None, priority=PRIORITY_USER):
+        """Потокобезопасно ставит вызов в очередь; возвращает concurrent.futures.Future с результатом."""
+        return asyncio.run_coroutine_threadsafe(self.call(method, args, kwargs, chat_id, priority), self.loop)
+
+    async def call(self, method, args=(), kwargs=None, chat_id=None, priority=PRIORITY_USER):
+        """Выполняет вызов метода бота с учётом лимитов и повторов; возвращает результат Bot API."""
+        self._queued += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self._queued)
+        self._idle.clear()
+        try:
+            if chat_id is None:
+                return await self._send(method, args, kwargs or {}, None, priority)
+
+            lane = self._lane(chat_id)
+            lane.users += 1
+            try:
+                async with lane.lock:
+                    return await self._send(method, args, kwargs or {}, lane, priority)
+            finally:
+                lane.users -= 1
+        finally:
+            self._queued -= 1
+            if not self._queued:
+                self._idle.set()
+
+    def _lane(self, chat_id):
+        now = time.monotonic()
+        if now >= self._next_prune:
+            # Раз в минуту забываем чаты, которым нечего отправлять и чья корзина уже полна
+            self._next_prune = now + 60
+            for key in [key for key, lane in self._lanes.items()
+                        if not lane.users and lane.blocked_until <= now and lane.bucket.is_full(now)]:
+                del self._lanes[key]
+
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = _ChatLane(self.chat_rate, self.chat_burst)
+        return lane
+
+    async def _wait_turn(self, method, lane, priority):
+        """Ждёт токен чата (для ограниченных методов), конец паузы после 429 и общий токен."""
+        limited = lane is not None and method in CHAT_LIMITED_METHODS
+        while True:
+            now = time.monotonic()
+            delay = 0
+            if lane is not None:
+                delay = lane.blocked_until - now
+                if limited:
+                    delay = max(delay, lane.bucket.delay(now))
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        if priority == PRIORITY_ADMIN:
+            while self._global_blocked_until > time.monotonic():
+                await asyncio.sleep(self._global_blocked_until - time.monotonic())
+            self._global_bucket.take(time.monotonic())
+        else:
+            async with self._global_lock:
+                while True:
+                    now = time.monotonic()
+                    delay = max(self._global_bucket.delay(now), self._global_blocked_until - now)
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self._global_bucket.take(now)
+        if limited:
+            lane.bucket.take(time.monotonic())
+
+    async def _send(self, method, args, kwargs, lane, priority):
+        attempts = 0
+        files = file_positions(args, kwargs)  # Перематываются перед повтором, как в OutboundScheduler
+        while True:
+            await self._wait_turn(method, lane, priority)
+            started = time.perf_counter()
+            try:
+                result = await getattr(self.bot, method)(*args, **kwargs)
+            except asyncio_helper.ApiTelegramException as e:
+                observe_api_call(method, started, failed=True)
+                if e.error_code != 429 or attempts >= self.max_retries or not rewind_files(files):
+                    self.stats["failed"] += 1
+                    raise
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                retry_at = time.monotonic() + retry_after
+                if lane is not None:
+                    lane.blocked_until = retry_at
+                else:
+                    # 429 без привязки к чату тормозит все отправки
+                    self._global_blocked_until = max(self._global_blocked_until, retry_at)
+                self.stats["rate_limited"] += 1
+                logging.warning(f"Telegram ограничил отправку ({method}), повтор через {retry_after} с")
+            except (asyncio_helper.RequestTimeout, aiohttp.ClientError, asyncio.TimeoutError, OSError) as e:
+                observe_api_call(method, started, failed=True)
+                if attempts >= self.max_retries or not rewind_files(files):
+                    logging.error(f"Не удалось выполнить {method}: {e}")
+                    self.stats["failed"] += 1
+                    raise
+                self.stats["retried"] += 1
+                await asyncio.sleep(min(0.5 * 2 ** attempts, 10))
+            except Exception:
+                observe_api_call(method, started, failed=True)
+                self.stats["failed"] += 1
+                raise
+            else:
+                observe_api_call(method, started)
+                self.stats["sent"] += 1
+                return result
+            attempts += 1
+
+
+class AsyncRateLimitedBot(RateLimitedBot):
+    """
+    Бот для корутин-обработчиков: исходящие методы — корутины (await bot.send_message(...)),
+    которые идут через AsyncOutboundScheduler; остальные атрибуты берутся у AsyncTeleBot.
+    Готовые экраны (Screen.send) работают и с ним: они возвращают то, что вернул bot.send_message.
+    """
+    def __getattr__(self, name):
+        attr = getattr(self.bot, name)
+        if name not in OUTBOUND_METHODS:
+            return attr
+
+        async def call(*args, **kwargs):
+            chat_id, priority = self._route(name, args, kwargs)
+            return await self.scheduler.call(name, args, kwargs, chat_id=chat_id, priority=priority)
+        return call
+
+    def submit(self, method, *args, priority=None, **kwargs):
+        """Ставит вызов без ожидания результата; возвращает asyncio.Task (вызывать из цикла событий)."""
+        chat_id, priority = self._route(method, args, kwargs, priority)
+        return asyncio.ensure_future(self.scheduler.call(method, args, kwargs, chat_id=chat_id, priority=priority))
+
+
+class AsyncChatDispatcher:
+    """
+    Асинхронный аналог ChatDispatcher: порядок внутри чата сохраняется, разные чаты обрабатываются
+    конкурентно в одном потоке.
+    - У чата с работой есть одна задача asyncio, которая по очереди обрабатывает его обновления.
+    - Одновременно выполняется не больше max_concurrency обработчиков; ожидание ответа Bot API или базы
+      не занимает поток, поэтому тысячи чатов обслуживаются без тысяч потоков.
+    - Ограничения очередей те же: chat_queue_size на чат и max_pending всего.
+    - submit() потокобезопасен и совместим с ChatDispatcher.submit (используется WebhookServer).
+    """
+    def __init__(self, process, max_concurrency=1000, chat_queue_size=100, max_pending=10000):
+        self.process = process  # Корутина process(update)
+        self.max_concurrency = max_concurrency
+        self.chat_queue_size = chat_queue_size
+        self.max_pending = max_pending
+        self.stats = {
+            "submitted": 0, "processed": 0, "failed": 0, "rejected": 0,
+            "max_pending": 0, "max_chat_depth": 0
+        }
+        self.loop = None
+        self._chats = {}  # Ключ чата -> очередь его обновлений; чат есть в словаре, пока у него есть работа
+        self._pending = 0
+        self._semaphore = None
+        self._changed = None
+
+    def start(self):
+        """Привязывает диспетчер к текущему циклу событий (повторный вызов, в том числе из другого потока, ничего не делает)."""
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._changed = asyncio.Condition()
+
+    async def join(self, timeout=None):
+        """Ждёт, пока все принятые обновления не будут обработаны."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(self._changed.wait_for(lambda: not self._pending), timeout)
+            except asyncio.TimeoutError:
+                return False
+        return True
+
+    async def stop(self, timeout=10):
+        """Дожидается обработки уже принятых обновлений."""
+        await self.join(timeout)
+
+    def depth(self):
+        return {
+            "pending": self._pending,
+            "chats": len(self._chats),
+            "max_chat_depth": max((len(q) for q in self._chats.values()), default=0)
+        }
+
+    def submit(self, update, block=True, timeout=None):
+        """Потокобезопасная постановка обновления (для потоков HTTP-сервера webhook)."""
+        future = asyncio.run_coroutine_threadsafe(self.put(update, block, timeout), self.loop)
+        return future.result()
+
+    async def put(self, update, block=True, timeout=None):
+        """
+        Ставит обновление в очередь его чата.
+        - block=True: при заполненной очереди ждёт освобождения места (торможение long polling).
+        - block=False или истёк timeout: возвращает False, обновление не принято.
+        """
+        key = get_chat_key(update)
+        async with self._changed:
+            if self._is_full(key):
+                if not block:
+                    self.stats["rejected"] += 1
+                    return False
+                try:
+                    await asyncio.wait_for(self._changed.wait_for(lambda: not self._is_full(key)), timeout)
+                except asyncio.TimeoutError:
+                    self.stats["rejected"] += 1
+                    return False
+
+            chat_queue = self._chats.get(key)
+            if chat_queue is None:
+                chat_queue = self._chats[key] = deque()
+                asyncio.ensure_future(self._drain(key, chat_queue))
+            chat_queue.append(update)
+            self._pending += 1
+
+            self.stats["submitted"] += 1
+            self.stats["max_pending"] = max(self.stats["max_pending"], self._pending)
+            self.stats["max_chat_depth"] = max(self.stats["max_chat_depth"], len(chat_queue))
+        return True
+
+    def _is_full(self, key):
+        chat_queue = self._chats.get(key)
+        return (
+            self._pending >= self.max_pending
+            or (chat_queue is not None and len(chat_queue) >= self.chat_queue_size)
+        )
+
+    async def _drain(self, key, chat_queue):
+        """Обрабатывает обновления чата по одному, пока очередь не опустеет."""
+        while chat_queue:
+            update = chat_queue[0]
+            async with self._semaphore:
+                try:
+                    await self.process(update)
+                    failed = False
+                except Exception as e:
+                    failed = True
+                    logging.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+
+            chat_queue.popleft()
+            if not chat_queue:
+                # Между проверкой и удалением нет await, поэтому новое обновление не потеряется
+                del self._chats[key]
+            async with self._changed:
+                self._pending -= 1
+                self.stats["failed" if failed else "processed"] += 1
+                self._changed.notify_all()
+
+
+async def run_async_polling(bot, dispatcher, timeout=20, retry_delay=3):
+    """
+    Long polling через AsyncTeleBot: обновления раскладываются по очередям чатов AsyncChatDispatcher.
+    Если очереди заполнены, put ждёт, и новые обновления не запрашиваются, пока обработчики не разгрузятся.
+    """
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=timeout, request_timeout=timeout + 10)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"Ошибка при получении обновлений: {e}")
+            await asyncio.sleep(retry_delay)
+            continue
+
+        for update in updates:
+            await dispatcher.put(update)
+            offset = update.update_id + 1
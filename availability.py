@@ -0,0 +1,147 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+import clock
+import config
+from db import get_upcoming_appointments
+
+
+def _minutes(hhmm):
+    hours, minutes = map(int, hhmm.split(":"))
+    return hours * 60 + minutes
+
+
+class AvailabilityIndex:
+    """
+    Занятость по дням в виде битовых масок: бит i дня — слот [i*slot_minutes, (i+1)*slot_minutes).
+    - Для каждого дня недели заранее построена маска рабочих часов, для каждого дня с записями — маска занятых слотов.
+      Свободные слоты дня — одна операция working & ~busy над целым числом, без запросов к базе.
+    - Индекс строится один раз из подтверждённых записей (load) и дальше обновляется точечно:
+      book() при подтверждении записи, release() при отклонении.
+    - Маски хранятся по каждой записи отдельно, поэтому снятие записи не затрагивает пересекающиеся с ней.
+    - С наступлением нового дня прошедшие дни удаляются, так что индекс долго работающего процесса не растёт.
+    """
+    def __init__(self, working_hours, slot_minutes=15, default_duration=60, search_days=30):
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = 24 * 60 // slot_minutes
+        self.default_duration = default_duration
+        self.search_days = search_days
+        # День недели -> маска рабочих слотов
+        self.working_masks = {
+            weekday: self._mask(_minutes(start), _minutes(end) - _minutes(start))
+            for weekday, (start, end) in working_hours.items()
+        }
+        self._bookings = {}  # ID записи -> (день, маска)
+        self._day_bookings = {}  # День -> {ID записи: маска}
+        self._busy = {}  # День -> объединение масок записей дня
+        self._today = None  # День, на который индекс последний раз очищен от прошедших дней
+        self._lock = threading.Lock()
+
+    def _mask(self, start_minute, duration):
+        """Маска слотов, которые задевает интервал [start_minute, start_minute + duration) в пределах суток."""
+        first = start_minute // self.slot_minutes
+        last = min(self.slots_per_day, -(-(start_minute + duration) // self.slot_minutes))
+        return ((1 << (last - first)) - 1) << first if last > first else 0
+
+    def _span(self, appointment_at, duration):
+        start = clock.to_local(appointment_at)
+        return start.date(), self._mask(start.hour * 60 + start.minute, duration or self.default_duration)
+
+    def load(self):
+        """Строит индекс по подтверждённым записям, начиная с сегодняшнего дня."""
+        appointments = get_upcoming_appointments(clock.day_start(clock.today()))
+        for record_id, _, appointment_at in appointments:
+            self.book(record_id, appointment_at)
+        logging.info(f"Индекс свободных окон построен по {len(appointments)} записям")
+
+    def _prune_past_days(self):
+        """При смене дня удаляет записи прошедших дней (вызывается под блокировкой)."""
+        today = clock.today()
+        if today == self._today:
+            return
+        self._today = today
+        for day in [day for day in self._day_bookings if day < today]:
+            for record_id in self._day_bookings.pop(day):
+                del self._bookings[record_id]
+            del self._busy[day]
+
+    def book(self, record_id, appointment_at, duration=None):
+        """Отмечает время записи (секунды Unix) занятым; повторный вызов переносит запись."""
+        day, mask = self._span(appointment_at, duration)
+        with self._lock:
+            self._prune_past_days()
+            self._release(record_id)
+            self._bookings[record_id] = (day, mask)
+            self._day_bookings.setdefault(day, {})[record_id] = mask
+            self._busy[day] = self._busy.get(day, 0) | mask
+
+    def release(self, record_id):
+        """Освобождает время записи."""
+        with self._lock:
+            self._release(record_id)
+
+    def _release(self, record_id):
+        booking = self._bookings.pop(record_id, None)
+        if booking is None:
+            return
+        day = booking[0]
+        day_bookings = self._day_bookings[day]
+        del day_bookings[record_id]
+        if not day_bookings:
+            del self._day_bookings[day]
+            del self._busy[day]
+            return
+        busy = 0
+        for mask in day_bookings.values():
+            busy |= mask
+        self._busy[day] = busy
+
+    def conflicts(self, appointment_at, duration=None, ignore_record_id=None):
+        """Проверяет, пересекается ли время с другой подтверждённой записью (ignore_record_id — сама переносимая запись)."""
+        day, mask = self._span(appointment_at, duration)
+        with self._lock:
+            for record_id, booked in self._day_bookings.get(day, {}).items():
+                if record_id != ignore_record_id and booked & mask:
+                    return True
+        return False
+
+    def next_free_slots(self, count, duration=None, since=None):
+        """
+        Возвращает до count ближайших непересекающихся свободных окон (datetime начала) в рабочие часы.
+        Для каждого дня начала окон находятся сдвигами маски: бит j остаётся, только если свободны слоты j..j+k-1.
+        """
+        since = since or clock.local_now().replace(tzinfo=None)
+        k = -(-(duration or self.default_duration) // self.slot_minutes)
+        # Окно нельзя начать в уже начавшемся слоте
+        first_slot = -(-(since.hour * 60 + since.minute) // self.slot_minutes)
+
+        slots = []
+        with self._lock:
+            self._prune_past_days()
+            for offset in range(self.search_days):
+                day = since.date() + timedelta(days=offset)
+                free = self.working_masks.get(day.weekday(), 0) & ~self._busy.get(day, 0)
+                if offset == 0:
+                    free &= ~((1 << first_slot) - 1)
+
+                starts = free
+                for shift in range(1, k):
+                    starts &= free >> shift
+
+                while starts and len(slots) < count:
+                    j = (starts & -starts).bit_length() - 1
+                    slots.append(datetime.combine(day, datetime.min.time()) + timedelta(minutes=j * self.slot_minutes))
+                    # Следующее предложение — не раньше конца этого окна
+                    starts &= ~((1 << (j + k)) - 1)
+                if len(slots) >= count:
+                    break
+        return slots
+
+
+# Общий индекс свободных окон; заполняется в bot.py при старте
+availability = AvailabilityIndex(
+    config.WORKING_HOURS,
+    slot_minutes=config.SLOT_MINUTES,
+    default_duration=config.DEFAULT_APPOINTMENT_MINUTES,
+    search_days=config.FREE_SLOTS_SEARCH_DAYS
+)
@@ -0,0 +1,77 @@
+"""
+Сравнение задержки вызовов db.py: соединение на каждый вызов против долгоживущего соединения потока.
+
+Запуск из корня репозитория:
+    python benchmarks/db_connections.py [количество_вызовов]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock  # noqa: E402
+import db  # noqa: E402
+
+
+def connect_per_call_insert(user_id):
+    """Старая схема: connect/INSERT/commit/close на каждый вызов."""
+    conn = sqlite3.connect(db.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO user_visits (telegram_user_id, username, first_name, last_name, visited_at, action_type, action_details)
+        VALUES (?, ?, ?, ?, ?, ?, ?);
+    """, (user_id, "bench", "Bench", None, clock.now(), "menu_click", "bench"))
+    conn.commit()
+    conn.close()
+
+
+def connect_per_call_select(record_id):
+    """Старая схема: connect/SELECT/close на каждый вызов."""
+    conn = sqlite3.connect(db.DB_NAME)
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM records WHERE id = ?;", (record_id,))
+    cursor.fetchone()
+    conn.close()
+
+
+def pooled_insert(user_id):
+    db.log_user_action(user_id, "bench", "Bench", None, "menu_click", "bench")
+
+
+def pooled_select(record_id):
+    db.check_appointment_exists(record_id)
+
+
+def measure(func, calls):
+    """Возвращает среднюю задержку вызова в микросекундах."""
+    started = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - started) / calls * 1_000_000
+
+
+def main():
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_NAME = os.path.join(tmp_dir, "bench.db")
+        db.create_tables()
+
+        results = [
+            ("INSERT, connect на вызов", measure(connect_per_call_insert, calls)),
+            ("INSERT, соединение потока", measure(pooled_insert, calls)),
+            ("SELECT, connect на вызов", measure(connect_per_call_select, calls)),
+            ("SELECT, соединение потока", measure(pooled_select, calls)),
+        ]
+        db.close_connections()
+
+    print(f"Вызовов на сценарий: {calls}")
+    for name, latency in results:
+        print(f"{name:<28} {latency:10.1f} мкс/вызов")
+
+
+if __name__ == "__main__":
+    main()
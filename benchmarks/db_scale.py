@@ -0,0 +1,280 @@
+"""
+Время функций db.py на больших объёмах данных.
+
+Для каждого уровня объёма (количество строк user_visits; заявок в records — около 4% от него)
+база заполняется генератором benchmarks/synthetic_data.py, после чего каждая функция чтения и записи
+db.py вызывается несколько раз с реалистичными аргументами (существующие пользователи и записи,
+окна дат относительно сегодняшнего дня). Записывающие сценарии выполняются после читающих
+на рабочей копии базы, поэтому сгенерированная база не меняется и её можно переиспользовать (--data-dir).
+
+Результаты печатаются таблицей и сохраняются в JSON (--output) вместе с версиями Python/SQLite и коммитом,
+чтобы прогоны разных версий можно было сравнить (--compare прошлый_результат.json).
+Если в db.py появилась функция, для которой нет сценария, скрипт сообщает об этом.
+
+Запуск из корня репозитория:
+    python benchmarks/db_scale.py [--tiers 100000,1000000,10000000] [--repeat 10]
+                                  [--data-dir bench_data] [--output results.json] [--compare old.json]
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock  # noqa: E402
+import db  # noqa: E402
+import synthetic_data  # noqa: E402
+
+# Служебные функции db.py, которые не измеряются: соединения, миграции, чистые вычисления без запросов
+# и ротация разделов user_visits (необратимо переносит историю из рабочей копии, повторный замер пуст)
+NOT_MEASURED = {"get_connection", "close_connections", "db_cursor", "create_tables",
+                "get_appointment_at", "get_day_bounds", "rotate_user_visits"}
+
+
+class Context:
+    """Аргументы сценариев: выборка существующих пользователей и записей, окна дат и счётчик итераций."""
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.today = clock.today()
+        self.now = clock.now()
+        with db.db_cursor() as cursor:
+            cursor.execute("SELECT DISTINCT telegram_user_id FROM user_visits ORDER BY random() LIMIT 1000;")
+            self.user_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT id, telegram_user_id FROM records ORDER BY random() LIMIT 1000;")
+            self.records = cursor.fetchall()
+            cursor.execute("SELECT telegram_user_id FROM user_visits_daily ORDER BY telegram_user_id LIMIT 1 "
+                           "OFFSET (SELECT COUNT(DISTINCT telegram_user_id) FROM user_visits_daily) / 2;")
+            row = cursor.fetchone()
+        self.middle_user_id = row[0] if row else 0
+        self.iteration = 0
+
+    def user_id(self):
+        return self.rng.choice(self.user_ids)
+
+    def record(self):
+        return self.rng.choice(self.records)
+
+    def days_ago(self, days):
+        return self.today - timedelta(days=days)
+
+    def action(self):
+        user_id = self.user_id()
+        return (user_id, f"user{user_id}", "Bench", None, self.now, "menu_click", "Виды процедур")
+
+
+# (сценарий, функция db.py, аргументы по контексту, ограничение числа вызовов или None)
+READ_CASES = [
+    ("get_repeat_visits: страница", "get_repeat_visits",
+     lambda c: ((), {"after_user_id": c.middle_user_id, "limit": 11}), None),
+    ("get_repeat_visits: все", "get_repeat_visits", lambda c: ((), {}), None),
+    ("get_inactive_users: страница, 30 дней", "get_inactive_users",
+     lambda c: ((c.days_ago(30), c.today), {"limit": 11}), None),
+    ("get_inactive_users: все, 30 дней", "get_inactive_users",
+     lambda c: ((c.days_ago(30), c.today), {}), None),
+    ("get_users_by_date_range: день", "get_users_by_date_range",
+     lambda c: ((c.days_ago(1), c.days_ago(1)), {}), None),
+    ("get_users_by_date_range: unique, 30 дней", "get_users_by_date_range",
+     lambda c: ((c.days_ago(30), c.today), {"unique": True, "limit": 11}), None),
+    ("get_users_by_date_range: repeat, 30 дней", "get_users_by_date_range",
+     lambda c: ((c.days_ago(30), c.today), {"repeat": True, "limit": 11}), None),
+    ("get_users_by_date_range: inactive, 90 дней", "get_users_by_date_range",
+     lambda c: ((c.days_ago(90), c.today), {"inactive": True}), None),
+    ("iter_unique_users: 30 дней", "iter_unique_users", lambda c: ((c.days_ago(30), c.today), {}), None),
+    ("iter_repeat_visits", "iter_repeat_visits", lambda c: ((), {}), None),
+    ("iter_inactive_users: 30 дней", "iter_inactive_users", lambda c: ((c.days_ago(30), c.today), {}), None),
+    ("iter_records: месяц", "iter_records",
+     lambda c: (db.get_day_bounds(c.days_ago(30), c.today), {}), None),
+    ("get_unique_users", "get_unique_users", lambda c: ((), {}), None),
+    ("get_records_from_today", "get_records_from_today", lambda c: ((), {}), None),
+    ("get_upcoming_appointments", "get_upcoming_appointments", lambda c: ((c.now,), {}), None),
+    ("get_records_page: неделя", "get_records_page",
+     lambda c: (db.get_day_bounds(c.today, c.today + timedelta(days=6)), {"limit": 6}), None),
+    ("get_last_appointment_id", "get_last_appointment_id", lambda c: ((c.record()[1],), {}), None),
+    ("check_appointment_exists", "check_appointment_exists", lambda c: ((c.record()[0],), {}), None),
+    ("get_user_data_by_record_id", "get_user_data_by_record_id", lambda c: ((c.record()[0],), {}), None),
+    ("load_chat_state", "load_chat_state", lambda c: ((c.user_id(), time.time()), {}), None),
+]
+
+WRITE_CASES = [
+    ("save_appointment: новая заявка", "save_appointment",
+     lambda c: ((c.user_id(), "bench", "Bench", None, "+79000000000", None, None, c.now, None, "ожидает"), {}), None),
+    ("save_message_id_to_db", "save_message_id_to_db", lambda c: ((c.record()[0], 1), {}), None),
+    ("update_appointment", "update_appointment",
+     lambda c: ((c.record()[0], (c.today + timedelta(days=3)).isoformat(), "12:00", "Записан"), {}), None),
+    ("save_user_visit", "save_user_visit", lambda c: ((c.user_id(), "bench", "Bench", None), {}), None),
+    ("log_user_action", "log_user_action", lambda c: ((c.user_id(), "bench", "Bench", None, "menu_click"), {}), None),
+    ("log_user_actions: пачка 200", "log_user_actions", lambda c: (([c.action() for _ in range(200)],), {}), None),
+    ("save_chat_state", "save_chat_state", lambda c: ((c.user_id(), "{}", time.time() + 60), {}), None),
+    ("delete_chat_state", "delete_chat_state", lambda c: ((c.user_id(),), {}), None),
+    ("purge_chat_states", "purge_chat_states", lambda c: ((time.time(),), {}), None),
+    ("rollup_user_visits", "rollup_user_visits", lambda c: ((), {}), None),
+    ("rebuild_user_visits_rollup", "rebuild_user_visits_rollup", lambda c: ((), {}), 1),
+]
+
+
+def uncovered_functions():
+    """Публичные функции db.py без сценария (кроме служебных)."""
+    covered = {function for _, function, _, _ in READ_CASES + WRITE_CASES}
+    return sorted(
+        name for name, value in vars(db).items()
+        if inspect.isfunction(value) and not name.startswith("_") and value.__module__ == db.__name__
+        and name not in covered and name not in NOT_MEASURED
+    )
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def _call(func, args, kwargs):
+    """Вызывает функцию db.py; генератор потоковой выгрузки дочитывается до конца. Возвращает число строк или None."""
+    result = func(*args, **kwargs)
+    if inspect.isgenerator(result):
+        return sum(1 for _ in result)
+    return len(result) if isinstance(result, list) else None
+
+
+def measure(context, name, function, build_args, repeat):
+    """Один прогрев и repeat замеров. Возвращает словарь результата сценария."""
+    func = getattr(db, function)
+    args, kwargs = build_args(context)
+    _call(func, args, kwargs)
+
+    durations, rows = [], None
+    for _ in range(repeat):
+        args, kwargs = build_args(context)
+        started = time.perf_counter()
+        rows = _call(func, args, kwargs)
+        durations.append(time.perf_counter() - started)
+
+    return {
+        "case": name,
+        "function": function,
+        "calls": len(durations),
+        "rows": rows,
+        "p50_ms": round(percentile(durations, 0.5) * 1000, 3),
+        "p95_ms": round(percentile(durations, 0.95) * 1000, 3),
+        "mean_ms": round(sum(durations) / len(durations) * 1000, 3),
+    }
+
+
+def prepare_database(data_dir, visits, args):
+    """Возвращает путь к сгенерированной базе уровня visits, создавая её при отсутствии."""
+    path = os.path.join(data_dir, f"synthetic_{visits}_{args.days}d_seed{args.seed}.db")
+    if not os.path.exists(path):
+        print(f"Генерация {visits} посещений в {path}...", flush=True)
+        started = time.perf_counter()
+        db.DB_NAME = path + ".tmp"
+        db.create_tables()
+        synthetic_data.generate(visits, days=args.days, seed=args.seed)
+        db.close_connections()
+        os.replace(path + ".tmp", path)
+        print(f"  готово за {time.perf_counter() - started:.1f} с", flush=True)
+    return path
+
+
+def run_tier(path, visits, args, work_dir):
+    work_path = os.path.join(work_dir, "work.db")
+    shutil.copyfile(path, work_path)
+    db.DB_NAME = work_path
+    db.create_tables()
+    # Граница свёртки и кэш процесса должны соответствовать этой базе, а не предыдущему уровню
+    db.rollup_user_visits()
+
+    with db.db_cursor() as cursor:
+        counts = {table: cursor.execute(f"SELECT COUNT(*) FROM {table};").fetchone()[0]
+                  for table in ("user_visits", "records", "user_visits_daily")}
+
+    context = Context(args.seed)
+    results = []
+    for name, function, build_args, limit in READ_CASES + WRITE_CASES:
+        result = measure(context, name, function, build_args, min(args.repeat, limit or args.repeat))
+        result.update(tier=visits, **{f"{table}_rows": count for table, count in counts.items()})
+        results.append(result)
+        print(f"{visits:>10} {name:<45}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+              f"{result['rows'] if result['rows'] is not None else '':>8}", flush=True)
+
+    db.close_connections()
+    os.remove(work_path)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+    }
+
+
+def compare(results, baseline_path):
+    """Печатает отношение p50 к прошлому прогону по совпадающим (уровень, сценарий)."""
+    with open(baseline_path, encoding="utf-8") as file:
+        baseline = json.load(file)
+    previous = {(row["tier"], row["case"]): row for row in baseline["results"]}
+
+    print(f"\nСравнение с {baseline_path} (коммит {baseline['environment'].get('commit')}):")
+    print(f"{'уровень':>10} {'сценарий':<45}{'было, мс':>10}{'стало, мс':>10}{'x':>8}")
+    for row in results:
+        old = previous.get((row["tier"], row["case"]))
+        if old is None:
+            continue
+        ratio = row["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        print(f"{row['tier']:>10} {row['case']:<45}{old['p50_ms']:>10.2f}{row['p50_ms']:>10.2f}{ratio:>8.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", default="100000,1000000",
+                        help="Уровни объёма через запятую (строк user_visits), например 100000,1000000,10000000")
+    parser.add_argument("--repeat", type=int, default=10, help="Замеров на сценарий")
+    parser.add_argument("--days", type=int, default=365, help="Глубина синтетической истории в днях")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--data-dir", help="Каталог для сгенерированных баз (переиспользуются между запусками)")
+    parser.add_argument("--output", help="Файл JSON с результатами")
+    parser.add_argument("--compare", help="Прошлый файл результатов для сравнения")
+    args = parser.parse_args()
+    tiers = [int(tier) for tier in args.tiers.split(",") if tier.strip()]
+
+    missing = uncovered_functions()
+    if missing:
+        print(f"Нет сценариев для функций db.py: {', '.join(missing)}\n")
+
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        data_dir = args.data_dir or work_dir
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"{'уровень':>10} {'сценарий':<45}{'p50, мс':>10}{'p95, мс':>10}{'строк':>8}")
+        for visits in tiers:
+            path = prepare_database(data_dir, visits, args)
+            results += run_tier(path, visits, args, work_dir)
+
+    report = {"environment": environment(), "parameters": vars(args) | {"tiers": tiers}, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
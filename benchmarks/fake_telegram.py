@@ -0,0 +1,237 @@
+"""
+Локальный «фальшивый Telegram» для проверки режимов приёма обновлений без сети.
+
+Скрипт поднимает заглушку Bot API (sendMessage, editMessageText, getUpdates и т.д.),
+генерирует всплеск синтетических обновлений от множества чатов и измеряет:
+- ack — время ответа webhook на доставку обновления (только режим webhook);
+- e2e — время от отправки обновления до первого ответа бота в этот чат.
+
+1. Запустить скрипт (ждёт, пока бот поднимется):
+    python benchmarks/fake_telegram.py --mode webhook --chats 300
+2. Запустить бота, направив его на заглушку:
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot{0}/{1} BOT_MODE=webhook WEBHOOK_SECRET=secret python bot.py
+   Для сравнения с long polling: --mode polling и BOT_MODE=polling.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Тексты кнопок пользовательского меню, которые бот обрабатывает без участия администратора
+USER_TEXTS = ["/start", "✨ Виды процедур", "🌐 Другие соц сети", "📅 Узнать о свободных слотах"]
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeBotAPI:
+    """
+    Заглушка Bot API: отвечает успехом на любые методы, отдаёт обновления через getUpdates
+    и запоминает время первого исходящего сообщения в каждый чат.
+    """
+    def __init__(self, host, port, latency=0.0):
+        self.latency = latency  # Имитация сетевой задержки Telegram на каждый вызов
+        self.pending_updates = []
+        self.first_reply_at = {}
+        self.calls = {}
+        self._lock = threading.Condition()
+        self._message_id = 0
+        self.httpd = _HTTPServer((host, port), self._make_request_handler())
+
+    def push_updates(self, updates):
+        """Кладёт обновления в очередь getUpdates (для режима polling)."""
+        with self._lock:
+            self.pending_updates.extend(updates)
+            self._lock.notify_all()
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset", 0) or 0)
+        timeout = float(params.get("timeout", 0) or 0)
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while True:
+                self.pending_updates = [u for u in self.pending_updates if u["update_id"] >= offset]
+                if self.pending_updates or time.monotonic() >= deadline:
+                    return list(self.pending_updates[:100])
+                self._lock.wait(deadline - time.monotonic())
+
+    def _handle(self, method, params):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        chat_id = params.get("chat_id")
+        if chat_id is not None and method in ("sendMessage", "editMessageText", "sendDocument"):
+            with self._lock:
+                self.first_reply_at.setdefault(int(chat_id), time.perf_counter())
+
+        if method in ("sendMessage", "editMessageText", "sendDocument"):
+            with self._lock:
+                self._message_id += 1
+                message_id = self._message_id
+            return {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(chat_id or 0), "type": "private"},
+                "text": params.get("text", "")
+            }
+        return True
+
+    def _make_request_handler(self):
+        api = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def _serve(self):
+                url = urllib.parse.urlparse(self.path)
+                method = url.path.rsplit("/", 1)[-1]
+                params = dict(urllib.parse.parse_qsl(url.query))
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                if length:
+                    body = self.rfile.read(length)
+                    content_type = self.headers.get("Content-Type", "")
+                    if "json" in content_type:
+                        params.update(json.loads(body))
+                    elif "x-www-form-urlencoded" in content_type:
+                        params.update(urllib.parse.parse_qsl(body.decode("utf-8")))
+
+                payload = json.dumps({"ok": True, "result": api._handle(method, params)}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+def make_update(update_id, chat_id, text):
+    """Синтетическое обновление с текстовым сообщением от пользователя."""
+    user = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+    message = {
+        "message_id": update_id,
+        "from": user,
+        "chat": {"id": chat_id, "type": "private", "first_name": user["first_name"]},
+        "date": int(time.time()),
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"offset": 0, "length": len(text), "type": "bot_command"}]
+    return {"update_id": update_id, "message": message}
+
+
+def post_update(url, secret, update):
+    """Доставляет обновление на webhook, возвращает время ответа в секундах."""
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        method="POST"
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=30) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def wait_for_webhook(url, secret, timeout):
+    """Ждёт, пока бот начнёт принимать обновления на webhook."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            post_update(url, secret, make_update(0, 1, "/start"))
+            return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+    return False
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return "нет данных"
+    pick = lambda p: values[min(len(values) - 1, int(len(values) * p))] * 1000
+    return f"p50={pick(0.50):.1f} мс  p95={pick(0.95):.1f} мс  p99={pick(0.99):.1f} мс  max={values[-1] * 1000:.1f} мс"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["webhook", "polling"], default="webhook")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8443/webhook")
+    parser.add_argument("--secret", default="secret")
+    parser.add_argument("--chats", type=int, default=300, help="Количество чатов во всплеске (по одному обновлению)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Параллельных доставок на webhook")
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Имитация задержки Bot API, секунды")
+    parser.add_argument("--wait", type=float, default=60, help="Сколько ждать ответов бота, секунды")
+    args = parser.parse_args()
+
+    api = FakeBotAPI("127.0.0.1", args.api_port, latency=args.api_latency)
+    api.start()
+    print(f"Заглушка Bot API: http://127.0.0.1:{args.api_port}/bot{{0}}/{{1}}")
+
+    # ID чатов начинаются с большого числа, чтобы не совпасть с ID администратора
+    chat_ids = [10_000_000 + i for i in range(args.chats)]
+    updates = [make_update(i + 1, chat_id, USER_TEXTS[i % len(USER_TEXTS)]) for i, chat_id in enumerate(chat_ids)]
+
+    if args.mode == "webhook":
+        print(f"Ожидание webhook {args.webhook_url} ...")
+        if not wait_for_webhook(args.webhook_url, args.secret, args.wait):
+            print("Бот не отвечает на webhook")
+            sys.exit(1)
+        time.sleep(1)
+        api.first_reply_at.clear()
+
+        sent_at = {}
+        def deliver(update):
+            sent_at[update["message"]["chat"]["id"]] = time.perf_counter()
+            return post_update(args.webhook_url, args.secret, update)
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            acks = list(pool.map(deliver, updates))
+        print(f"ack webhook: {percentiles(acks)}")
+    else:
+        print("Ожидание первого запроса getUpdates от бота ...")
+        deadline = time.monotonic() + args.wait
+        while "getUpdates" not in api.calls and time.monotonic() < deadline:
+            time.sleep(0.2)
+        started = time.perf_counter()
+        sent_at = {chat_id: started for chat_id in chat_ids}
+        api.push_updates(updates)
+
+    deadline = time.monotonic() + args.wait
+    while time.monotonic() < deadline and len([c for c in chat_ids if c in api.first_reply_at]) < len(chat_ids):
+        time.sleep(0.1)
+
+    latencies = [api.first_reply_at[c] - sent_at[c] for c in chat_ids if c in api.first_reply_at and c in sent_at]
+    print(f"Ответов получено: {len(latencies)} из {len(chat_ids)}")
+    print(f"e2e ({args.mode}): {percentiles(latencies)}")
+    print(f"Вызовы Bot API: {api.calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""
+Бенчмарк обработчиков bot.py без сети.
+
+TeleBot подменяется записывающей заглушкой (исходящие методы ничего не отправляют, а только
+запоминают вызов), база — временным файлом SQLite с синтетической историей посещений.
+Синтетические Message/CallbackQuery проходят весь путь обработки: TeleBot.process_new_updates ->
+маршрутизатор -> обработчики -> db.py и планировщик исходящих сообщений.
+
+Для каждого сценария выводятся:
+- p50/p95/p99 времени сценария целиком (все его обновления подряд);
+- количество SQL-запросов на обновление (в потоке обработчика; фоновая запись действий не учитывается);
+- объём памяти, выделенной за обновление (пик tracemalloc), и сколько из неё осталось занятым.
+Память измеряется отдельным, более коротким прогоном: tracemalloc сильно замедляет выполнение.
+
+Запуск из корня репозитория:
+    python benchmarks/handlers.py [--iterations 200] [--users 2000] [--visits 10]
+"""
+import argparse
+import contextlib
+import itertools
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Лимиты Telegram здесь не нужны: измеряются обработчики, а не ожидание токенов планировщика
+os.environ.setdefault("OUTBOUND_GLOBAL_RATE", "1000000")
+os.environ.setdefault("OUTBOUND_CHAT_RATE", "1000000")
+os.environ.setdefault("OUTBOUND_CHAT_BURST", "1000000")
+
+import telebot  # noqa: E402
+from telebot import types  # noqa: E402
+import clock  # noqa: E402
+import config  # noqa: E402
+import db  # noqa: E402
+
+ADMIN_CHAT_ID = int(config.id_chat_owner)
+FIRST_USER_ID = 10_000_000
+PHONE_ACTION_DETAILS = db.PHONE_ACTION_DETAILS
+
+
+class RecordingBot(telebot.TeleBot):
+    """TeleBot без сети: исходящие методы записывают вызов и возвращают синтетическое сообщение."""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.calls = []
+        self._message_ids = itertools.count(1_000_000)
+
+    def _record(self, method, chat_id=None, text=None):
+        self.calls.append(method)
+        return types.Message.de_json({
+            "message_id": next(self._message_ids),
+            "date": clock.now(),
+            "chat": {"id": chat_id or 0, "type": "private"},
+            "text": text or "",
+        })
+
+    def send_message(self, chat_id, text, *args, **kwargs):
+        return self._record("send_message", chat_id, text)
+
+    def send_document(self, chat_id, *args, **kwargs):
+        return self._record("send_document", chat_id)
+
+    def send_photo(self, chat_id, *args, **kwargs):
+        return self._record("send_photo", chat_id)
+
+    def edit_message_text(self, text=None, chat_id=None, *args, **kwargs):
+        return self._record("edit_message_text", chat_id, text)
+
+    def edit_message_reply_markup(self, chat_id=None, *args, **kwargs):
+        return self._record("edit_message_reply_markup", chat_id)
+
+    def delete_message(self, chat_id, *args, **kwargs):
+        self.calls.append("delete_message")
+        return True
+
+    def answer_callback_query(self, *args, **kwargs):
+        self.calls.append("answer_callback_query")
+        return True
+
+
+# ===== Синтетические обновления =====
+_update_ids = itertools.count(1)
+
+
+def _user(chat_id):
+    return {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}", "username": f"user{chat_id}"}
+
+
+def _message(chat_id, **fields):
+    return {
+        "message_id": next(_update_ids),
+        "from": _user(chat_id),
+        "chat": {"id": chat_id, "type": "private"},
+        "date": clock.now(),
+        **fields,
+    }
+
+
+def text_update(chat_id, text):
+    fields = {"text": text}
+    if text.startswith("/"):
+        fields["entities"] = [{"offset": 0, "length": len(text), "type": "bot_command"}]
+    return types.Update.de_json({"update_id": next(_update_ids), "message": _message(chat_id, **fields)})
+
+
+def contact_update(chat_id):
+    contact = {"phone_number": f"+7900{chat_id:07d}", "first_name": f"User{chat_id}", "user_id": chat_id}
+    return types.Update.de_json({"update_id": next(_update_ids), "message": _message(chat_id, contact=contact)})
+
+
+def callback_update(chat_id, data):
+    return types.Update.de_json({
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(chat_id),
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": _message(chat_id, text="..."),
+        },
+    })
+
+
+# ===== Сценарии =====
+# Каждый сценарий по номеру итерации возвращает список обновлений; подготовка (если есть) не измеряется.
+def date_range_text(days):
+    today = clock.today()
+    return f"{(today - timedelta(days=days)).strftime('%d.%m.%Y')} {today.strftime('%d.%m.%Y')}"
+
+
+def flow_start(i):
+    return [text_update(FIRST_USER_ID + i, "/start")]
+
+
+def flow_contact(i):
+    return [contact_update(FIRST_USER_ID + i)]
+
+
+def flow_admin_booking(i):
+    # Заявка клиента создаётся заранее; каждая итерация занимает свой час, чтобы не было пересечений
+    user_id = FIRST_USER_ID + 500_000 + i
+    record_id = db.save_appointment(user_id, f"user{user_id}", f"User{user_id}", None, "+79000000000",
+                                    None, None, clock.now(), None, "ожидает")
+    day = clock.today() + timedelta(days=1 + i // 24)
+    return [
+        callback_update(ADMIN_CHAT_ID, f"record_{record_id}"),
+        text_update(ADMIN_CHAT_ID, day.strftime('%d.%m.%y')),
+        text_update(ADMIN_CHAT_ID, f"{i % 24:02d}:00"),
+        text_update(ADMIN_CHAT_ID, "Комментарий"),
+        callback_update(ADMIN_CHAT_ID, "confirm_booking"),
+    ]
+
+
+def flow_records(i):
+    return [text_update(ADMIN_CHAT_ID, "📋 Отобразить записи")]
+
+
+def flow_stats_unique(i):
+    return [
+        text_update(ADMIN_CHAT_ID, "👥 Посмотреть пользователей"),
+        callback_update(ADMIN_CHAT_ID, "unique_users"),
+        text_update(ADMIN_CHAT_ID, date_range_text(30)),
+    ]
+
+
+def flow_stats_repeat(i):
+    return [callback_update(ADMIN_CHAT_ID, "repeat_visits")]
+
+
+def flow_stats_inactive(i):
+    return [
+        callback_update(ADMIN_CHAT_ID, "inactive_users"),
+        text_update(ADMIN_CHAT_ID, date_range_text(14)),
+    ]
+
+
+FLOWS = [
+    ("start", flow_start),
+    ("contact", flow_contact),
+    ("admin_booking", flow_admin_booking),
+    ("records", flow_records),
+    ("stats_unique", flow_stats_unique),
+    ("stats_repeat", flow_stats_repeat),
+    ("stats_inactive", flow_stats_inactive),
+]
+
+
+# ===== Измерения =====
+def seed_visits(users, visits, days=60):
+    """История посещений: users пользователей по visits действий за последние days дней."""
+    rng = random.Random(42)
+    now = clock.now()
+    actions = []
+    for user_id in range(1, users + 1):
+        for _ in range(visits):
+            details = PHONE_ACTION_DETAILS if rng.random() < 0.05 else "Виды процедур"
+            visited_at = now - rng.randrange(days * 24 * 60 * 60)
+            actions.append((user_id, f"user{user_id}", f"User{user_id}", None, visited_at, "menu_click", details))
+    for start in range(0, len(actions), 5000):
+        db.log_user_actions(actions[start:start + 5000])
+    db.rollup_user_visits()
+
+
+class StatementCounter:
+    """Считает SQL-запросы на соединении текущего потока (без BEGIN/COMMIT)."""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, sql):
+        if not sql.lstrip().upper().startswith(("BEGIN", "COMMIT", "ROLLBACK")):
+            self.count += 1
+
+
+def run_flow(bot_module, build, iterations, offset, measure_memory=False):
+    """
+    Прогоняет сценарий iterations раз. Возвращает (длительности сценария, обновлений в сценарии,
+    SQL на обновление, пик КБ на обновление, остаток КБ на обновление).
+    """
+    client = bot_module.telebot_client
+    counter = StatementCounter()
+    durations, peaks, retained = [], [], []
+    updates_total = 0
+
+    for i in range(offset, offset + iterations):
+        updates = build(i)
+        conn = db.get_connection()
+        conn.set_trace_callback(counter)
+        started = time.perf_counter()
+        for update in updates:
+            if measure_memory:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            client.process_new_updates([update])
+            if measure_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peaks.append(peak - before)
+                retained.append(current - before)
+        durations.append(time.perf_counter() - started)
+        conn.set_trace_callback(None)
+        updates_total += len(updates)
+
+    average = lambda values: sum(values) / len(values) / 1024 if values else 0
+    return (durations, updates_total // iterations, counter.count / updates_total,
+            average(peaks), average(retained))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200, help="Прогонов каждого сценария")
+    parser.add_argument("--warmup", type=int, default=10, help="Прогонов для прогрева (не учитываются)")
+    parser.add_argument("--memory-iterations", type=int, default=30, help="Прогонов под tracemalloc (0 — не измерять)")
+    parser.add_argument("--users", type=int, default=2000, help="Пользователей в истории посещений")
+    parser.add_argument("--visits", type=int, default=10, help="Посещений на пользователя")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_NAME = os.path.join(tmp_dir, "handlers.db")
+        db.create_tables()
+        seed_visits(args.users, args.visits)
+
+        # bot.init() создаёт TeleBot по имени, импортированному в bot.py, — подменяем класс до импорта
+        telebot.TeleBot = RecordingBot
+        import bot
+        bot.init()
+        # Отладочный вывод обработчиков (print) и логи INFO не должны смешиваться с результатами
+        logging.getLogger().setLevel(logging.WARNING)
+        quiet = open(os.devnull, "w")
+
+        print(f"История: {args.users} пользователей x {args.visits} посещений; {args.iterations} прогонов на сценарий\n")
+        print(f"{'сценарий':<16}{'обновл.':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"
+              f"{'SQL/обн.':>10}{'пик КБ/обн.':>13}{'остаток КБ/обн.':>17}")
+
+        # Итерации сценариев не пересекаются по пользователям и времени записи
+        offset = 0
+        try:
+            for name, build in FLOWS:
+                with contextlib.redirect_stdout(quiet):
+                    run_flow(bot, build, args.warmup, offset)
+                    offset += args.warmup
+                    durations, updates, statements, _, _ = run_flow(bot, build, args.iterations, offset)
+                    offset += args.iterations
+
+                    peak = retained = 0
+                    if args.memory_iterations:
+                        tracemalloc.start()
+                        _, _, _, peak, retained = run_flow(
+                            bot, build, args.memory_iterations, offset, measure_memory=True
+                        )
+                        tracemalloc.stop()
+                        offset += args.memory_iterations
+
+                print(f"{name:<16}{updates:>8}{percentile(durations, 0.50):>10.2f}{percentile(durations, 0.95):>10.2f}"
+                      f"{percentile(durations, 0.99):>10.2f}{statements:>10.1f}{peak:>13.1f}{retained:>17.1f}")
+        finally:
+            bot.outbound_scheduler.stop()
+            bot.action_log_writer.stop()
+            db.close_connections()
+            quiet.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Проверка планов запросов статистики: запросы по диапазонам дат должны искать по индексу.
+
+Скрипт вызывает функции db.py на временной базе, перехватывает выполненные SELECT
+и прогоняет их через EXPLAIN QUERY PLAN. Если обращение к user_visits или records
+идёт полным сканированием (например, из-за функции над visited_at в условии), скрипт
+завершается с кодом 1.
+
+Запуск из корня репозитория:
+    python benchmarks/query_plans.py
+Те же вызовы проверяются в тестах: python -m pytest tests/test_query_plans.py
+"""
+import os
+import sys
+import tempfile
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+# Функции, которые обязаны читать таблицы только поиском по индексу (SEARCH), без SCAN
+CHECKED_CALLS = [
+    ("get_users_by_date_range", (date(2025, 1, 1), date(2025, 1, 15)), {}),
+    ("get_users_by_date_range", (date(2025, 1, 1), date(2025, 1, 15)), {"unique": True}),
+    ("get_users_by_date_range", (date(2025, 1, 1), date(2025, 1, 15)), {"repeat": True}),
+    ("get_users_by_date_range", (date(2025, 1, 1), date(2025, 1, 15)), {"inactive": True}),
+    ("get_inactive_users", (date(2025, 1, 1), date(2025, 1, 15)), {}),
+    ("get_inactive_users", (date(2025, 1, 1), date(2025, 1, 15)), {"after_user_id": 100, "limit": 11}),
+    ("get_repeat_visits", (), {"after_user_id": 100, "limit": 11}),
+    ("get_repeat_visits", (), {"before_user_id": 100, "limit": 11}),
+    ("get_records_from_today", (), {}),
+    ("get_records_page", db.get_day_bounds(date(2025, 1, 1), date(2025, 1, 7)),
+     {"after": (db.get_appointment_at("2025-01-02", "10:00"), 5), "limit": 6}),
+    ("get_records_page", db.get_day_bounds(date(2025, 1, 1), date(2025, 1, 7)),
+     {"before": (db.get_appointment_at("2025-01-02", "10:00"), 5), "limit": 6}),
+]
+
+
+def capture_statements(func, args, kwargs):
+    """Вызывает функцию db.py и возвращает выполненные ею SELECT с подставленными параметрами."""
+    conn = db.get_connection()
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        func(*args, **kwargs)
+    finally:
+        conn.set_trace_callback(None)
+    return [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+
+
+# Таблицы, которые растут вместе с историей и должны читаться только поиском по индексу.
+# Дневную свёртку постраничные запросы намеренно обходят по первичному ключу в порядке telegram_user_id.
+SEARCH_ONLY_TABLES = {"user_visits", "records"}
+
+
+def find_full_scans(sql):
+    """Возвращает строки плана, в которых таблица из SEARCH_ONLY_TABLES читается сканированием."""
+    plan = db.get_connection().execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return [
+        row[3] for row in plan
+        if row[3].startswith("SCAN ") and row[3].split()[1] in SEARCH_ONLY_TABLES
+    ]
+
+
+def main():
+    failures = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db.DB_NAME = os.path.join(tmp_dir, "plans.db")
+        db.create_tables()
+        db.rollup_user_visits()  # Как в работающем боте: завершённые дни уже свёрнуты
+
+        for name, args, kwargs in CHECKED_CALLS:
+            for sql in capture_statements(getattr(db, name), args, kwargs):
+                scans = find_full_scans(sql)
+                if scans:
+                    failures.append((name, kwargs, scans))
+
+        db.close_connections()
+
+    if failures:
+        for name, kwargs, scans in failures:
+            print(f"FAIL {name} {kwargs}: {'; '.join(scans)}")
+        sys.exit(1)
+
+    print(f"OK: {len(CHECKED_CALLS)} вызовов используют поиск по индексу")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Генератор синтетических данных для records и user_visits.
+
+Данные детерминированы (при тех же параметрах, seed и now одинаковы) и повторяют форму реальной нагрузки бота:
+- активность пользователей распределена по закону Ципфа: немного постоянных посетителей с сотнями
+  действий и длинный хвост тех, кто заходил один-два раза;
+- действия идут сессиями по несколько нажатий с интервалом от секунд до пары минут;
+- по дням — рост аудитории, недельный цикл и всплески (рассылки, акции) с затуханием за несколько дней;
+- по часам — дневной профиль с пиком вечером;
+- каждое нажатие «Отправить номер телефона» создаёт заявку в records; старые заявки в основном
+  подтверждены или отклонены, свежие ещё ожидают, время приёма — в рабочие часы из config.WORKING_HOURS.
+Строки пишутся по дням в хронологическом порядке, поэтому id растут вместе со временем, как в рабочей базе.
+После заполнения дневная свёртка пересобирается (db.rebuild_user_visits_rollup).
+
+Запуск из корня репозитория:
+    python benchmarks/synthetic_data.py synthetic.db [--visits 1000000] [--days 365] [--seed 42]
+"""
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clock  # noqa: E402
+import config  # noqa: E402
+import db  # noqa: E402
+
+# Нажатия меню с долями, близкими к реальным (см. log_action в bot.py)
+ACTIONS = [
+    ("start_command", "Запуст бота", 20),
+    ("menu_click", "Виды процедур", 30),
+    ("button_click", "Узнать подробнее", 15),
+    ("menu_click", "Узнать о свободных слотах", 12),
+    ("button_click", "Другие соц сети", 6),
+    ("menu_click", "Спасибо, вернуться позже", 8),
+    ("button_click", "Возвращение в бота", 5),
+    ("button_click", db.PHONE_ACTION_DETAILS, 4),
+]
+# Доля действий по часам местного времени (0..23): ночью почти пусто, пик вечером
+HOUR_WEIGHTS = [1, 1, 1, 1, 1, 1, 2, 4, 6, 8, 9, 10, 11, 11, 10, 10, 11, 13, 15, 16, 15, 12, 7, 3]
+FIRST_NAMES = ["Анна", "Мария", "Елена", "Ольга", "Наталья", "Ирина", "Светлана", "Татьяна", "Юлия", "Дарья",
+               "Алексей", "Дмитрий", "Сергей", "Андрей", "Иван"]
+LAST_NAMES = ["Иванова", "Петрова", "Смирнова", "Кузнецова", "Попова", "Соколова", "Лебедева", "Новикова"]
+FIRST_USER_ID = 100_000_000
+WRITE_CHUNK = 50_000
+
+
+class _Users:
+    """Пользователи с весами по закону Ципфа: пользователь ранга k выбирается с весом 1 / k^exponent."""
+    def __init__(self, rng, count, exponent=0.7):
+        self.rng = rng
+        self.ids = list(range(FIRST_USER_ID, FIRST_USER_ID + count))
+        # Ранги перемешаны, чтобы активность не зависела от порядка telegram_user_id
+        rng.shuffle(self.ids)
+        self.cum_weights = list(itertools.accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+        self._profiles = {}
+
+    def pick(self, k):
+        return self.rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+    def profile(self, user_id):
+        """(username, first_name, last_name) пользователя; одинаковые при каждом вызове."""
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            rng = random.Random(user_id)
+            profile = self._profiles[user_id] = (
+                f"user{user_id}" if rng.random() < 0.8 else None,
+                rng.choice(FIRST_NAMES),
+                rng.choice(LAST_NAMES) if rng.random() < 0.3 else None,
+            )
+        return profile
+
+
+def _day_weights(rng, days):
+    """Относительная активность по дням: рост, недельный цикл и всплески с затуханием."""
+    weights = []
+    burst = 0.0
+    for day in range(days):
+        if rng.random() < 1 / 30:
+            burst += rng.uniform(2, 7)
+        weekly = 0.75 if day % 7 in (5, 6) else 1.0
+        weights.append((0.5 + day / days) * weekly * (1 + burst))
+        burst *= 0.5
+    return weights
+
+
+def _appointment_at(rng, requested_at):
+    """Время приёма через 1–14 дней после заявки, в рабочий день и рабочие часы, с шагом в час."""
+    day = clock.to_local(requested_at).date() + timedelta(days=rng.randint(1, 14))
+    while day.weekday() not in config.WORKING_HOURS:
+        day += timedelta(days=1)
+    opens, closes = config.WORKING_HOURS[day.weekday()]
+    hour = rng.randrange(int(opens[:2]), int(closes[:2]))
+    return db.get_appointment_at(day.isoformat(), f"{hour:02d}:00")
+
+
+def _record(rng, user_id, profile, requested_at, now):
+    age_days = (now - requested_at) / 86400
+    roll = rng.random()
+    if age_days > 2:
+        status = "Записан" if roll < 0.75 else "Отклонена" if roll < 0.95 else "ожидает"
+    else:
+        status = "ожидает" if roll < 0.6 else "Записан" if roll < 0.9 else "Отклонена"
+    appointment_at = None if status == "ожидает" else _appointment_at(rng, requested_at)
+    phone = f"+79{rng.randrange(10 ** 9):09d}"
+    comments = rng.choice([None, None, "Первый визит", "Перенос", "Просила напомнить"])
+    return (user_id, *profile, phone, requested_at, appointment_at, comments, status, rng.randrange(1, 10 ** 6))
+
+
+def _write(visits, records):
+    with db.db_cursor(write=True) as cursor:
+        cursor.executemany("""
+            INSERT INTO user_visits (telegram_user_id, username, first_name, last_name, visited_at, action_type, action_details)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+        """, visits)
+        cursor.executemany("""
+            INSERT INTO records (
+                telegram_user_id, username, first_name, last_name, phone_number,
+                requested_at, appointment_at, comments, status, message_id
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+        """, records)
+
+
+def generate(visits, days=365, seed=42, users=None, now=None):
+    """
+    Заполняет текущую базу db.DB_NAME (схема уже создана) примерно visits действиями за последние days дней.
+    users — количество пользователей (по умолчанию visits / 8). Возвращает {"visits": ..., "records": ..., "users": ...}.
+    """
+    rng = random.Random(seed)
+    now = now or clock.now()
+    users = _Users(rng, users or max(visits // 8, 1))
+    action_cum = list(itertools.accumulate(weight for _, _, weight in ACTIONS))
+    hour_cum = list(itertools.accumulate(HOUR_WEIGHTS))
+    weights = _day_weights(rng, days)
+    total_weight = sum(weights)
+    first_day = clock.to_local(now).date() - timedelta(days=days - 1)
+
+    visit_rows, record_rows = [], []
+    booked = set()  # (пользователь, время приёма) уже созданных записей
+    written_visits = written_records = 0
+    for offset, weight in enumerate(weights):
+        day_start = clock.day_start(first_day + timedelta(days=offset))
+        target = round(visits * weight / total_weight)
+        day_rows = []
+        while len(day_rows) < target:
+            # Сессия: 1–8 нажатий (в среднем около 2,5) одного пользователя подряд
+            user_id = users.pick(1)[0]
+            profile = users.profile(user_id)
+            at = day_start + rng.choices(range(24), cum_weights=hour_cum)[0] * 3600 + rng.randrange(3600)
+            for _ in range(min(1 + int(rng.expovariate(0.65)), 8, target - len(day_rows))):
+                if at >= now:
+                    break
+                action_type, details, _ = rng.choices(ACTIONS, cum_weights=action_cum)[0]
+                day_rows.append((user_id, *profile, at, action_type, details))
+                if details == db.PHONE_ACTION_DETAILS:
+                    record = _record(rng, user_id, profile, at, now)
+                    # Повторная заявка на то же время обновляет прежнюю запись (уникальный ключ records)
+                    if record[6] is None or (user_id, record[6]) not in booked:
+                        booked.add((user_id, record[6]))
+                        record_rows.append(record)
+                at += rng.randint(3, 120)
+            else:
+                continue
+            break  # Текущий день закончился на моменте now
+
+        day_rows.sort(key=lambda row: row[4])
+        visit_rows += day_rows
+        if len(visit_rows) >= WRITE_CHUNK:
+            record_rows.sort(key=lambda row: row[5])
+            _write(visit_rows, record_rows)
+            written_visits += len(visit_rows)
+            written_records += len(record_rows)
+            visit_rows, record_rows = [], []
+
+    record_rows.sort(key=lambda row: row[5])
+    _write(visit_rows, record_rows)
+    db.rebuild_user_visits_rollup()
+    return {
+        "visits": written_visits + len(visit_rows),
+        "records": written_records + len(record_rows),
+        "users": len(users.ids),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path", help="Файл базы (создаётся; существующий файл не перезаписывается)")
+    parser.add_argument("--visits", type=int, default=1_000_000, help="Строк в user_visits")
+    parser.add_argument("--users", type=int, default=None, help="Пользователей (по умолчанию visits / 8)")
+    parser.add_argument("--days", type=int, default=365, help="Глубина истории в днях")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    if os.path.exists(args.path):
+        parser.error(f"{args.path} уже существует")
+
+    db.DB_NAME = args.path
+    db.create_tables()
+    started = time.perf_counter()
+    counts = generate(args.visits, days=args.days, seed=args.seed, users=args.users)
+    db.close_connections()
+    print(f"{args.path}: {counts['visits']} посещений, {counts['records']} заявок, {counts['users']} пользователей "
+          f"за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
+import html
 import logging
-from telebot import TeleBot
-from telebot import types
+import sqlite3
+from telebot import TeleBot, apihelper
 import config
 from handlers.StartHandler import StartHandler
 from handlers.BookingHandler import BookingHandler
@@ -15,71 +16,178 @@ from handlers.UserStatisticsHandler import (
 )
 from handlers.RecordsHandler import RecordsHandler
 from handlers.SocialMediaHandler import SocialMediaHandler
-from db import save_user_visit, get_user_data_by_record_id, update_appointment, get_records_from_today
-from handlers.Logger import log_action
+from handlers.ScreenCache import get_screen
+from db import get_user_data_by_record_id, update_appointment, close_connections, create_tables, rollup_user_visits, get_appointment_at
+from handlers.Logger import log_action, action_log_writer
+from dispatcher import ChatDispatcher, run_polling
+from export import FORMATS
+from state import chat_states
+from outbound import OutboundScheduler, RateLimitedBot
+from reminders import ReminderScheduler
+from availability import availability
+from router import Router
+from metrics import metrics, MetricsServer
 
 
 # Настроим логирование
 logging.basicConfig(level=logging.INFO)
-logging.info("Bot is starting...")
-
-# Создаем объект бота с использованием токена из config.py
-bot = TeleBot(config.TELEBOT_TOKEN)
 
 # Используем идентификатор администратора из config.py
 ADMIN_CHAT_ID = int(config.id_chat_owner)
 
-# Создание экземпляров обработчиков
-start_handler = StartHandler(bot)
-booking_handler = BookingHandler(bot, start_handler)
-user_request_handler = UserRequestHandler(bot, ADMIN_CHAT_ID)
-procedures_handler = ProceduresHandler(bot, ADMIN_CHAT_ID)
-records_handler = RecordsHandler(bot)
-social_media_handler = SocialMediaHandler(bot)
+# Компоненты бота создаются в init(), а не при импорте: модуль импортирует и асинхронный режим (bot_async.py),
+# которому нужны обработчики, но не синхронный TeleBot с его планировщиком
+telebot_client = None
+outbound_scheduler = None
+bot = None
+dispatcher = None
+reminder_scheduler = None
 
-# из файла UserStatisticsHandler.py
-unique_users_handler = UniqueUsersStatisticsHandler(bot)
-repeat_visits_handler = RepeatVisitsStatisticsHandler(bot)
-inactive_users_handler = InactiveUsersStatisticsHandler(bot)
-visited_sections_handler = VisitedSectionsStatisticsHandler(bot)
 
+def init(scheduler=None, update_dispatcher=None):
+    """
+    Общий запуск обоих режимов: миграции и досворачивание базы, бот с планировщиком исходящих сообщений,
+    напоминания и обработчики. Возвращает RateLimitedBot, через который отвечают обработчики.
+    - scheduler — планировщик исходящих запросов (submit(method, args, kwargs, chat_id, priority) -> Future).
+      По умолчанию создаётся TeleBot с OutboundScheduler; bot_async.py передаёт AsyncOutboundScheduler,
+      чтобы синхронные обработчики отправляли сообщения через общую сессию и те же лимиты.
+    - update_dispatcher — диспетчер обновлений, чья статистика показывается в /metrics; по умолчанию
+      ChatDispatcher поверх TeleBot.
+    Повторный вызов ничего не делает.
+    """
+    global telebot_client, outbound_scheduler, bot, dispatcher, reminder_scheduler
+    global start_handler, booking_handler, user_request_handler, procedures_handler, records_handler
+    global social_media_handler, unique_users_handler, repeat_visits_handler, inactive_users_handler
+    global visited_sections_handler, base_statistics_handler
+    if bot is not None:
+        return bot
+
+    logging.info("Bot is starting...")
+    # Применяем миграции схемы до того, как обработчики начнут обращаться к базе
+    create_tables()
+    # Досворачиваем завершённые дни посещений, накопившиеся, пока бот был остановлен
+    rollup_user_visits()
+
+    if scheduler is None:
+        # Локальная подмена Bot API (например, benchmarks/fake_telegram.py)
+        if config.TELEGRAM_API_URL:
+            apihelper.API_URL = config.TELEGRAM_API_URL
+
+        # Создаем объект бота с использованием токена из config.py.
+        # Обработчики выполняются в потоках ChatDispatcher, собственный пул TeleBot не используется:
+        # он не сохраняет порядок обновлений внутри чата.
+        # Все исходящие сообщения проходят через планировщик с лимитами Telegram (общим и по чатам).
+        telebot_client = TeleBot(config.TELEBOT_TOKEN, threaded=False)
+        scheduler = OutboundScheduler(
+            telebot_client,
+            global_rate=config.OUTBOUND_GLOBAL_RATE,
+            chat_rate=config.OUTBOUND_CHAT_RATE,
+            chat_burst=config.OUTBOUND_CHAT_BURST,
+            workers=config.OUTBOUND_WORKERS
+        )
+        metrics.add_stats("outbound", scheduler.stats)
+        # TeleBot передаёт все сообщения и нажатия маршрутизатору
+        router.install(telebot_client)
+    outbound_scheduler = scheduler
+    bot = RateLimitedBot(scheduler.bot, scheduler, admin_chat_id=ADMIN_CHAT_ID)
+
+    if update_dispatcher is None:
+        # Разные чаты обрабатываются параллельно, обновления одного чата — по порядку
+        update_dispatcher = ChatDispatcher(
+            bot.process_new_updates,
+            workers=config.DISPATCHER_WORKERS,
+            chat_queue_size=config.DISPATCHER_CHAT_QUEUE_SIZE,
+            max_pending=config.DISPATCHER_MAX_PENDING
+        )
+        metrics.add_stats("dispatcher", update_dispatcher.stats)
+    dispatcher = update_dispatcher
+
+    # Напоминания о подтверждённых записях отправляются без ожидания ответа Bot API
+    reminder_scheduler = ReminderScheduler(
+        lambda chat_id, text: bot.submit("send_message", chat_id, text),
+        offsets=config.REMINDER_OFFSETS
+    )
+
+    # Счётчики компонентов выгружаются вместе с гистограммами (см. metrics.py)
+    metrics.add_stats("reminders", reminder_scheduler.stats)
+    metrics.add_stats("action_log", action_log_writer.stats)
+    metrics.add_stats("chat_states", chat_states.stats)
+
+    # Создание экземпляров обработчиков
+    start_handler = StartHandler(bot)
+    booking_handler = BookingHandler(bot, start_handler)
+    user_request_handler = UserRequestHandler(bot, ADMIN_CHAT_ID)
+    procedures_handler = ProceduresHandler(bot, ADMIN_CHAT_ID, user_request_handler)
+    records_handler = RecordsHandler(bot)
+    social_media_handler = SocialMediaHandler(bot)
+
+    # из файла UserStatisticsHandler.py
+    unique_users_handler = UniqueUsersStatisticsHandler(bot)
+    repeat_visits_handler = RepeatVisitsStatisticsHandler(bot)
+    inactive_users_handler = InactiveUsersStatisticsHandler(bot)
+    visited_sections_handler = VisitedSectionsStatisticsHandler(bot)
+    base_statistics_handler = BaseStatisticsHandler(bot)
+    return bot
 
 
+# Все обработчики регистрируются в маршрутизаторе: текст и callback_data находятся поиском по словарю,
+# а TeleBot получает по одному обработчику сообщений и нажатий. Время и ошибки каждого обработчика
+# пишутся в метрики.
+router = Router(metrics)
+
+
+# Ответы на шаги диалога записи. Проверка состояния выполняется раньше таблиц маршрутизатора, чтобы,
+# как и register_next_step_handler, перехватывать текст, пока у чата есть незавершённый шаг.
+@router.guard(lambda message: booking_handler.has_step(message.chat.id))
+def handle_conversation_step(message):
+    """Передаёт ответ администратора текущему шагу записи."""
+    booking_handler.process_step(message)
+
 # Обработчик команды /start
-@bot.message_handler(commands=['start'])
+@router.command("start")
 @log_action(action_type="start_command", action_details="Запуст бота")
 def handle_start(message):
     """Обрабатывает команду /start (при первом взаимодействии с ботом)."""
     start_handler.main_menu(message)
 
-@bot.message_handler(func=lambda message: message.text == "🙏 Спасибо, вернуться позже")
+@router.text("🙏 Спасибо, вернуться позже")
 @log_action(action_type="menu_click", action_details="Спасибо, вернуться позже")
 def handle_exit(message):
     """Обрабатывает нажатие на кнопку 'Спасибо, вернуться позже'."""
-    # Создаем клавиатуру с одной кнопкой "Запустить"
-    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
-    button = types.KeyboardButton("🚀 Запустить")
-    markup.add(button)
-
-    # Отправляем сообщение пользователю
-    bot.send_message(
-        message.chat.id,
-        "💖 Спасибо, что воспользовались нашим ботом! Мы всегда рады вам помочь. Хорошего дня! 😊\n\n"
-        "🚀 Когда будете готовы вернуться, нажмите 'Запустить'.",
-        reply_markup=markup  # Устанавливаем новую клавиатуру
-    )
+    # Прощание с клавиатурой из одной кнопки "Запустить" собрано заранее
+    get_screen("exit").send(bot, message.chat.id)
+
+# Сводка метрик для администратора; остальным отвечаем как на неизвестную команду
+@router.command("metrics")
+def handle_metrics(message):
+    """Показывает самые затратные обработчики, функции базы и методы Bot API."""
+    if message.chat.id != ADMIN_CHAT_ID:
+        handle_text_message(message)
+        return
 
-@bot.message_handler(func=lambda message: message.text == "🚀 Запустить")
+    sections = [
+        ("Обработчики", "bot_handler_seconds", "bot_handler_errors_total"),
+        ("База данных", "bot_db_seconds", "bot_db_errors_total"),
+        ("Bot API", "bot_telegram_api_seconds", "bot_telegram_api_errors_total"),
+    ]
+    text = "📈 <b>Метрики</b>\n"
+    for title, name, errors_name in sections:
+        summary = "\n".join(metrics.summary(name, errors_name)) or "Нет данных"
+        text += f"\n<b>{title}</b>\n<pre>{html.escape(summary)}</pre>\n"
+    text += (f"\nОчередь диспетчера: {dispatcher.stats['max_pending']} (макс.), "
+             f"ошибок обработки: {dispatcher.stats['failed']}")
+    bot.send_message(message.chat.id, text, parse_mode="HTML")
+
+@router.text("🚀 Запустить")
 @log_action(action_type="button_click", action_details="Возвращение в бота")
 def handle_restart(message):
     start_handler.main_menu(message)
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("record_"))
-def handle_admin_booking(call):
+@router.callback_prefix("record", int)
+def handle_admin_booking(call, record_id):
     # Ваш код обработки инлайн-кнопки
     """Обрабатывает нажатие на кнопку 'Записать'."""
     try:
-        record_id = int(call.data.split("_")[-1])  # Получаем ID записи из callback_data
         print(f"Callback data received: {call.data}, record ID: {record_id}")
 
         # Проверяем существование записи в базе данных
@@ -93,14 +201,39 @@ def handle_admin_booking(call):
     except Exception as e:
         print(f"Ошибка в обработчике callback_query: {e}")
 
-@bot.callback_query_handler(func=lambda call: call.data in ["confirm_booking", "cancel_booking"])
+def apply_booking_update(chat_id, record_id, **fields):
+    """
+    Обновляет заявку через update_appointment. Если у клиента уже есть другая запись на это время
+    (уникальный ключ records), сообщает администратору и возвращает False.
+    """
+    try:
+        update_appointment(user_id=record_id, **fields)
+    except sqlite3.IntegrityError:
+        bot.send_message(
+            chat_id,
+            f"⚠️ У клиента уже есть запись на это время. Заявка №{record_id} не изменена — "
+            "нажмите 'Записать' в заявке и выберите другое время."
+        )
+        return False
+    return True
+
+
+@router.callback("confirm_booking", "cancel_booking")
 def handle_booking_confirmation(call):
     """Обрабатывает нажатие инлайн-кнопок подтверждения или отклонения заявки."""
     bot.answer_callback_query(call.id)  # Убираем индикатор загрузки
 
     # Проверяем, к какому действию относится нажатая кнопка
     action = "confirm" if call.data == "confirm_booking" else "cancel"
-    record_id = booking_handler.current_record_id
+    booking = booking_handler.get_booking(call.message.chat.id)
+    if not booking:
+        bot.send_message(
+            call.message.chat.id,
+            "⌛ Сессия записи истекла. Нажмите 'Записать' в заявке ещё раз."
+        )
+        return
+    booking_handler.finish_booking(call.message.chat.id)
+    record_id = booking["record_id"]
 
     # Получаем данные пользователя из базы
     user_data = get_user_data_by_record_id(record_id)
@@ -113,6 +246,29 @@ def handle_booking_confirmation(call):
         print(f"Пользователь с record_id {record_id} не найден.")
         return
 
+    # Сначала обновляем запись в базе: если время занято другой записью клиента,
+    # заявка и её сообщение остаются как были
+    if action == "confirm":
+        updated = apply_booking_update(
+            call.message.chat.id,
+            record_id,
+            appointment_date=booking['selected_date'].strftime('%Y-%m-%d'),
+            appointment_time=booking['selected_time'],
+            status="Записан",
+            comment=booking.get('comments')
+        )
+    else:
+        updated = apply_booking_update(
+            call.message.chat.id,
+            record_id,
+            appointment_date=None,
+            appointment_time=None,
+            status="Отклонена",
+            comment=None
+        )
+    if not updated:
+        return
+
     # Проверяем наличие message_id заявки
     message_id_request = user_data.get("message_id")
     if message_id_request:
@@ -125,45 +281,34 @@ def handle_booking_confirmation(call):
 
     # Формируем текст для редактирования сообщения подтверждения/отклонения
     if action == "confirm":
-        # Обновляем запись в базе данных
-        update_appointment(
-            user_id=record_id,
-            appointment_date=booking_handler.selected_date.strftime('%Y-%m-%d'),
-            appointment_time=booking_handler.selected_time,
-            status="Записан",
-            comment=booking_handler.comments
-        )
+        appointment_at = get_appointment_at(booking['selected_date'], booking['selected_time'])
+        availability.book(record_id, appointment_at)
+        reminder_scheduler.schedule(record_id, user_data['telegram_user_id'], appointment_at)
         updated_message = (
             "✅ Запись успешно подтверждена!\n\n"
             f"👤 Имя: {user_data.get('first_name', '')} {user_data.get('last_name', '')}\n"
             f"📱 Телефон: {user_data.get('phone_number', 'Не указан')}\n"
             f"📧 Username: @{user_data.get('username', 'Не указан')}\n"
             f"🆔 ID клиента: <code>{user_data.get('telegram_user_id', 'Не указан')}</code>\n\n"
-            f"📅 Дата: {booking_handler.selected_date.strftime('%d.%m.%y')}\n"
-            f"⏰ Время: {booking_handler.selected_time}\n"
-            f"💬 Комментарий: {booking_handler.comments if booking_handler.comments else 'Нет комментариев'}"
+            f"📅 Дата: {booking['selected_date'].strftime('%d.%m.%y')}\n"
+            f"⏰ Время: {booking['selected_time']}\n"
+            f"💬 Комментарий: {booking.get('comments') or 'Нет комментариев'}"
         )
 
         # Уведомляем клиента
         bot.send_message(
             user_data['telegram_user_id'],
             f"🎉 Вы успешно записаны!\n\n"
-            f"📅 Дата: {booking_handler.selected_date.strftime('%d.%m.%y')}\n"
-            f"⏰ Время: {booking_handler.selected_time}\n"
+            f"📅 Дата: {booking['selected_date'].strftime('%d.%m.%y')}\n"
+            f"⏰ Время: {booking['selected_time']}\n"
             f"📍 Адрес: [Укажите адрес]\n"
             f"📞 Контакт: [Укажите телефон]\n\n"
             "Спасибо за запись! 😊"
         )
 
     elif action == "cancel":
-        # Обновляем запись в базе данных
-        update_appointment(
-            user_id=record_id,
-            appointment_date=None,
-            appointment_time=None,
-            status="Отклонена",
-            comment=None
-        )
+        availability.release(record_id)
+        reminder_scheduler.cancel(record_id)
         updated_message = (
             f"❌ Заявка №{record_id} отклонена!\n\n"
             f"👤 Имя: {user_data['first_name']} {user_data['last_name']}\n"
@@ -198,13 +343,17 @@ def process_cancel_booking(record_id, call=None):
         return
 
     # Обновляем запись в базе данных
-    update_appointment(
-        user_id=record_id,
+    if not apply_booking_update(
+        call.message.chat.id if call else ADMIN_CHAT_ID,
+        record_id,
         appointment_date=None,
         appointment_time=None,
         status="Отклонена",
         comment=None
-    )
+    ):
+        return
+    availability.release(record_id)
+    reminder_scheduler.cancel(record_id)
 
     # Формируем текст для обновления
     updated_message = (
@@ -228,13 +377,10 @@ def process_cancel_booking(record_id, call=None):
 
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith("cancel_"))
-def handle_cancel_booking(call):
+@router.callback_prefix("cancel", int)
+def handle_cancel_booking(call, record_id):
     """Обрабатывает нажатие на кнопку 'Отклонить'."""
     try:
-        # Извлекаем record_id
-        record_id = int(call.data.split("_")[1])
-
         # Вызываем метод process_cancel_booking с правильным аргументом
         process_cancel_booking(record_id=record_id, call=call)
     except Exception as e:
@@ -243,26 +389,26 @@ def handle_cancel_booking(call):
 
 
 # Обработчик для записи клиента
-@bot.message_handler(func=lambda message: message.text == "📝 Записать клиента")
+@router.text("📝 Записать клиента")
 def handle_booking(message):
     """Начинает процесс записи клиента."""
     booking_handler.start_booking(message)
 
 # Обработчик для сохранения, редактирования или отмены записи
-@bot.message_handler(func=lambda message: message.text in ["✅ Сохранить", "✏️ Редактировать", "❌ Отменить"])
+@router.text("✅ Сохранить", "✏️ Редактировать", "❌ Отменить")
 def handle_confirmation(message):
     """Обрабатывает подтверждения от пользователя."""
     booking_handler.process_action(message)
 
 
-@bot.message_handler(func=lambda message: message.text == "📅 Узнать о свободных слотах")
+@router.text("📅 Узнать о свободных слотах")
 @log_action(action_type="menu_click", action_details="Узнать о свободных слотах")
 def handle_user_request(message):
     """Обрабатывает запрос от пользователя."""
     user_request_handler.start_request(message)
 
 # Обработчик для получения контакта
-@bot.message_handler(content_types=['contact'])
+@router.content("contact")
 @log_action(action_type="button_click", action_details="Отправить номер телефона")
 def handle_contact_message(message):
     """Передает контактное сообщение в UserRequestHandler."""
@@ -273,31 +419,40 @@ def handle_contact_message(message):
     user_request_handler.handle_contact(message)
 
 # Обработчик кнопки "Виды процедур"
-@bot.message_handler(func=lambda message: message.text == "✨ Виды процедур")
+@router.text("✨ Виды процедур")
 @log_action(action_type="menu_click", action_details="Виды процедур")
 def handle_procedures(message):
     """Обрабатывает нажатие на кнопку 'Виды процедур'."""
     procedures_handler.show_procedures(message)
 
 # Обработчик кнопки "Записаться" в описании процедур
-@bot.callback_query_handler(func=lambda call: call.data == "book_procedure")
+@router.callback("book_procedure")
 def handle_procedure_booking(call):
     """Обрабатывает нажатие на 'Записаться' в видах процедур."""
     procedures_handler.handle_booking_procedure(call)
 
-@bot.callback_query_handler(func=lambda call: call.data == "get_contact")
+@router.callback("get_contact")
 @log_action(action_type="button_click", action_details="Узнать подробнее")
 def handle_get_contact(call):
     """Обрабатывает нажатие на 'Узнать подробнее'."""
     procedures_handler.handle_booking_procedure(call)
 
-@bot.message_handler(func=lambda message: message.text == "📋 Отобразить записи")
+@router.text("📋 Отобразить записи")
 def handle_show_records(message):
     """Обрабатывает нажатие на 'Отобразить записи'."""
     bot.delete_message(message.chat.id, message.message_id)  # Удаляем сообщение пользователя
     records_handler.show_records(message)
 
-@bot.message_handler(func=lambda message: message.text == "🌐 Другие соц сети")
+@router.callback_prefix("rec")
+def handle_records_navigation(call):
+    """Обрабатывает навигацию по записям (страницы, день/неделя)."""
+    bot.answer_callback_query(call.id)
+    try:
+        records_handler.handle_callback(call)
+    except Exception as e:
+        print(f"Ошибка при переключении страницы записей: {e}")
+
+@router.text("🌐 Другие соц сети")
 @log_action(action_type="button_click", action_details="Другие соц сети")
 def handle_social_media(message):
     """Обрабатывает нажатие на кнопку 'Другие соц сети'."""
@@ -311,55 +466,86 @@ def handle_social_media(message):
 
 
 
-@bot.message_handler(func=lambda message: message.text == "👥 Посмотреть пользователей")
+@router.text("👥 Посмотреть пользователей")
 def handle_view_users(message):
     """Обрабатывает нажатие на 'Посмотреть пользователей'."""
     bot.delete_message(message.chat.id, message.message_id)
     # Общий метод для отображения статистики
-    base_statistics_handler = BaseStatisticsHandler(bot)
     base_statistics_handler.show_statistics(message)
 
-@bot.callback_query_handler(func=lambda call: call.data == "unique_users")
+@router.callback("unique_users")
 def handle_unique_users(call):
     """Обрабатывает запрос на уникальных пользователей."""
     bot.answer_callback_query(call.id)
-    unique_users_handler.pending_section[call.message.chat.id] = "unique_users"
+    chat_states.update(call.message.chat.id, stats_section="unique_users")
     unique_users_handler.request_date_range_unique_user(call)
 
-@bot.callback_query_handler(func=lambda call: call.data == "repeat_visits")
+@router.callback("repeat_visits")
 def handle_repeat_visits(call):
     """Обрабатывает запрос на повторные посещения."""
     bot.answer_callback_query(call.id)
     repeat_visits_handler.handle_statistics(call)
 
-@bot.callback_query_handler(func=lambda call: call.data == "inactive_users")
+@router.callback("inactive_users")
 def handle_inactive_users(call):
     """Обрабатывает запрос на неактивных пользователей."""
     bot.answer_callback_query(call.id)
-    inactive_users_handler.pending_section[call.message.chat.id] = "inactive_users"
+    chat_states.update(call.message.chat.id, stats_section="inactive_users")
     inactive_users_handler.request_date_range_inactive_users(call)
 
-@bot.callback_query_handler(func=lambda call: call.data == "section_stats")
+@router.callback_prefix("stats", str, str)
+def handle_statistics_page(call, section, _page):
+    """Обрабатывает кнопки «Назад»/«Вперёд» в разделах статистики."""
+    bot.answer_callback_query(call.id)
+    handlers_by_section = {
+        "unique": unique_users_handler,
+        "repeat": repeat_visits_handler,
+        "inactive": inactive_users_handler,
+    }
+    try:
+        handlers_by_section[section].handle_page(call)
+    except Exception as e:
+        print(f"Ошибка при переключении страницы статистики: {e}")
+
+@router.callback_prefix("export", str, str)
+def handle_export(call, fmt, target):
+    """Выгружает раздел статистики или записи окна файлом CSV/XLSX (только для администратора)."""
+    if call.message.chat.id != ADMIN_CHAT_ID or fmt not in FORMATS:
+        bot.answer_callback_query(call.id)
+        return
+
+    bot.answer_callback_query(call.id, "⏳ Готовлю файл...")
+    section, *params = target.split("_")
+    handlers_by_section = {
+        "unique": unique_users_handler,
+        "repeat": repeat_visits_handler,
+        "inactive": inactive_users_handler,
+        "rec": records_handler,
+    }
+    try:
+        handlers_by_section[section].export(call.message.chat.id, fmt, params)
+    except Exception as e:
+        print(f"Ошибка при выгрузке в файл: {e}")
+
+@router.callback("section_stats")
 def handle_visited_sections(call):
     """Обрабатывает запрос на посещённые разделы."""
     bot.answer_callback_query(call.id)
     visited_sections_handler.handle_statistics(call)
 
-@bot.callback_query_handler(func=lambda call: call.data == "back_to_menu")
+@router.callback("back_to_menu")
 def handle_back_to_menu(call):
     """Возвращает в главное меню статистики."""
-    base_statistics_handler = BaseStatisticsHandler(bot)
     base_statistics_handler.handle_back_to_menu(call)
 
-@bot.message_handler(content_types=['text'])
+@router.fallback
 def handle_text_message(message):
     """Обрабатывает текстовые сообщения."""
-    # Проверяем, ожидает ли бот ввода даты для уникальных пользователей
-    if message.chat.id in inactive_users_handler.pending_section:
-        # Сначала проверяем неактивных пользователей
+    # Проверяем, ожидает ли бот ввода диапазона дат для выбранного раздела статистики
+    stats_section = chat_states.get(message.chat.id, "stats_section")
+    if stats_section == "inactive_users":
         inactive_users_handler.process_date_input_inactive_users(message)
-    elif message.chat.id in unique_users_handler.pending_section:
-        # Затем уникальных пользователей
+    elif stats_section == "unique_users":
         unique_users_handler.process_date_input_unique_users(message)
     else:
         bot.send_message(
@@ -368,11 +554,48 @@ def handle_text_message(message):
             parse_mode="HTML"
         )
 
+def run_webhook():
+    """Регистрирует webhook в Telegram и запускает встроенный HTTP-сервер, передающий обновления диспетчеру."""
+    from webhook import WebhookServer
+
+    server = WebhookServer(
+        dispatcher,
+        host=config.WEBHOOK_HOST,
+        port=config.WEBHOOK_PORT,
+        path=config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET
+    )
+    metrics.add_stats("webhook", server.stats)
+    if config.WEBHOOK_URL:
+        bot.remove_webhook()
+        bot.set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET or None)
+    server.serve_forever()
 
 
 # Запуск бота
 if __name__ == "__main__":
+    init()
+    metrics_server = None
     try:
-        bot.polling(none_stop=True)
+        if config.METRICS_PORT:
+            metrics_server = MetricsServer(metrics, config.METRICS_HOST, config.METRICS_PORT)
+            metrics_server.start()
+        availability.load()
+        reminder_scheduler.start()
+        if config.BOT_MODE == "webhook":
+            run_webhook()
+        else:
+            dispatcher.start()
+            run_polling(bot, dispatcher)
     except Exception as e:
         logging.error(f"Error occurred: {e}")
+    finally:
+        # Дорабатываем уже принятые обновления и отправляем их ответы
+        dispatcher.stop()
+        reminder_scheduler.stop()
+        outbound_scheduler.stop()
+        # Дописываем накопленные действия пользователей до закрытия соединений
+        action_log_writer.stop()
+        close_connections()
+        if metrics_server is not None:
+            metrics_server.stop()
@@ -0,0 +1,201 @@
+"""
+Асинхронный режим бота: python bot_async.py (BOT_MODE выбирает polling или webhook, как и в bot.py).
+
+- Обновления клиентов обрабатываются корутинами в одном цикле событий: ожидание ответа Bot API не занимает
+  поток, поэтому одновременно обслуживаются тысячи чатов (ASYNC_MAX_CONCURRENCY).
+- Все запросы к Bot API идут через AsyncTeleBot с одной общей сессией aiohttp и теми же лимитами Telegram.
+- Вызовы db.py выполняются в небольшом пуле потоков (run_db).
+- Чат администратора, шаги записи и всё, для чего здесь нет корутины, обрабатывает маршрутизатор bot.py
+  в пуле потоков; их исходящие сообщения тоже идут через общую сессию: общий запуск bot.init() получает
+  асинхронный планировщик вместо синхронного TeleBot. Синхронный режим (python bot.py) работает как раньше.
+"""
+import asyncio
+import logging
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+import config
+import bot as sync_bot
+from async_runtime import (
+    AsyncChatDispatcher, AsyncOutboundScheduler, AsyncRateLimitedBot, run_async_polling, run_db, run_sync,
+    shutdown_executors
+)
+from availability import availability
+from db import close_connections
+from handlers.AsyncUserRequestHandler import AsyncUserRequestHandler
+from handlers.Logger import log_action, action_log_writer
+from handlers.ScreenCache import get_screen
+from metrics import metrics, MetricsServer
+from router import Router
+
+ADMIN_CHAT_ID = sync_bot.ADMIN_CHAT_ID
+
+# Локальная подмена Bot API и размер пула соединений общей сессии aiohttp
+if config.TELEGRAM_API_URL:
+    asyncio_helper.API_URL = config.TELEGRAM_API_URL
+asyncio_helper.REQUEST_LIMIT = config.ASYNC_HTTP_CONNECTIONS
+
+async_telebot = AsyncTeleBot(config.TELEBOT_TOKEN)
+outbound_scheduler = AsyncOutboundScheduler(
+    async_telebot,
+    global_rate=config.OUTBOUND_GLOBAL_RATE,
+    chat_rate=config.OUTBOUND_CHAT_RATE,
+    chat_burst=config.OUTBOUND_CHAT_BURST
+)
+bot = AsyncRateLimitedBot(async_telebot, outbound_scheduler, admin_chat_id=ADMIN_CHAT_ID)
+
+
+async def process_update(update):
+    """
+    Сообщения и нажатия клиентов, для которых есть корутина, обрабатываются здесь;
+    чат администратора и всё остальное — синхронным маршрутизатором bot.py в пуле потоков.
+    """
+    message = update.message
+    if message is not None:
+        handler = router.resolve_message(message) if message.chat.id != ADMIN_CHAT_ID else None
+        if handler is None:
+            await run_sync(sync_bot.router.route_message, message)
+        else:
+            await handler(message)
+        return
+
+    call = update.callback_query
+    if call is not None:
+        from_admin = call.message is not None and call.message.chat.id == ADMIN_CHAT_ID
+        route = router.resolve_callback(call.data) if not from_admin else None
+        if route is None:
+            await run_sync(sync_bot.router.route_callback, call)
+        else:
+            handler, args = route
+            await handler(call, *args)
+
+
+dispatcher = AsyncChatDispatcher(
+    process_update,
+    max_concurrency=config.ASYNC_MAX_CONCURRENCY,
+    chat_queue_size=config.DISPATCHER_CHAT_QUEUE_SIZE,
+    max_pending=config.DISPATCHER_MAX_PENDING
+)
+metrics.add_stats("async_dispatcher", dispatcher.stats)
+metrics.add_stats("async_outbound", outbound_scheduler.stats)
+
+user_request_handler = AsyncUserRequestHandler(bot, ADMIN_CHAT_ID)
+
+# Корутины клиентских экранов; имена совпадают с обработчиками bot.py, поэтому метрики у режимов общие
+router = Router(metrics)
+
+
+@router.command("start")
+@log_action(action_type="start_command", action_details="Запуст бота")
+async def handle_start(message):
+    """Обрабатывает команду /start (при первом взаимодействии с ботом)."""
+    await get_screen("main_menu", message.chat.id).send(bot, message.chat.id)
+
+@router.text("🙏 Спасибо, вернуться позже")
+@log_action(action_type="menu_click", action_details="Спасибо, вернуться позже")
+async def handle_exit(message):
+    """Обрабатывает нажатие на кнопку 'Спасибо, вернуться позже'."""
+    await get_screen("exit").send(bot, message.chat.id)
+
+@router.text("🚀 Запустить")
+@log_action(action_type="button_click", action_details="Возвращение в бота")
+async def handle_restart(message):
+    await get_screen("main_menu", message.chat.id).send(bot, message.chat.id)
+
+@router.text("📅 Узнать о свободных слотах")
+@log_action(action_type="menu_click", action_details="Узнать о свободных слотах")
+async def handle_user_request(message):
+    """Показывает свободные окна и запрашивает контакт."""
+    await user_request_handler.start_request(message)
+
+@router.content("contact")
+@log_action(action_type="button_click", action_details="Отправить номер телефона")
+async def handle_contact_message(message):
+    """Сохраняет заявку и уведомляет администратора."""
+    await user_request_handler.handle_contact(message)
+
+@router.text("✨ Виды процедур")
+@log_action(action_type="menu_click", action_details="Виды процедур")
+async def handle_procedures(message):
+    """Обрабатывает нажатие на кнопку 'Виды процедур'."""
+    await get_screen("procedures").send(bot, message.chat.id)
+
+@router.callback("book_procedure")
+async def handle_procedure_booking(call):
+    """Обрабатывает нажатие на 'Записаться' в видах процедур."""
+    await bot.answer_callback_query(call.id)
+    await user_request_handler.start_request(call.message)
+
+@router.callback("get_contact")
+@log_action(action_type="button_click", action_details="Узнать подробнее")
+async def handle_get_contact(call):
+    """Обрабатывает нажатие на 'Узнать подробнее'."""
+    await bot.answer_callback_query(call.id)
+    await user_request_handler.start_request(call.message)
+
+@router.text("🌐 Другие соц сети")
+@log_action(action_type="button_click", action_details="Другие соц сети")
+async def handle_social_media(message):
+    """Обрабатывает нажатие на кнопку 'Другие соц сети'."""
+    await get_screen("social_media").send(bot, message.chat.id)
+
+
+async def run_webhook():
+    """Регистрирует webhook и запускает встроенный HTTP-сервер в отдельном потоке; обновления идут в dispatcher."""
+    from webhook import WebhookServer
+
+    server = WebhookServer(
+        dispatcher,
+        host=config.WEBHOOK_HOST,
+        port=config.WEBHOOK_PORT,
+        path=config.WEBHOOK_PATH,
+        secret_token=config.WEBHOOK_SECRET
+    )
+    metrics.add_stats("webhook", server.stats)
+    if config.WEBHOOK_URL:
+        await async_telebot.remove_webhook()
+        await async_telebot.set_webhook(url=config.WEBHOOK_URL, secret_token=config.WEBHOOK_SECRET or None)
+    try:
+        await asyncio.to_thread(server.serve_forever)
+    finally:
+        server.shutdown()
+
+
+async def main():
+    # Общий запуск с bot.py; синхронные обработчики и напоминания отправляют сообщения через ту же сессию
+    # и те же лимиты, а /metrics показывает этот диспетчер
+    sync_bot.init(scheduler=outbound_scheduler, update_dispatcher=dispatcher)
+    outbound_scheduler.start()
+    dispatcher.start()
+
+    metrics_server = None
+    if config.METRICS_PORT:
+        metrics_server = MetricsServer(metrics, config.METRICS_HOST, config.METRICS_PORT)
+        metrics_server.start()
+    try:
+        await run_db(availability.load)
+        sync_bot.reminder_scheduler.start()
+        if config.BOT_MODE == "webhook":
+            await run_webhook()
+        else:
+            await run_async_polling(async_telebot, dispatcher)
+    finally:
+        # Дорабатываем уже принятые обновления и отправляем их ответы
+        await dispatcher.stop()
+        sync_bot.reminder_scheduler.stop()
+        await outbound_scheduler.stop()
+        await async_telebot.close_session()
+        shutdown_executors()
+        # Дописываем накопленные действия пользователей до закрытия соединений
+        action_log_writer.stop()
+        close_connections()
+        if metrics_server is not None:
+            metrics_server.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logging.error(f"Error occurred: {e}")
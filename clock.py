@@ -0,0 +1,67 @@
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import pytz
+
+
+# ===== Время бота =====
+# В базе время хранится целыми секундами Unix (UTC). Местное время (TIMEZONE) нужно только
+# для границ дней и для вывода пользователю, поэтому часовой пояс создаётся один раз здесь.
+TIMEZONE = "Europe/Moscow"
+TZ = pytz.timezone(TIMEZONE)
+
+
+def now():
+    """Текущий момент в секундах Unix."""
+    return int(time.time())
+
+
+def local_now():
+    """Текущее местное время (aware datetime)."""
+    return datetime.now(TZ)
+
+
+def today():
+    """Текущая местная дата."""
+    return local_now().date()
+
+
+def to_local(timestamp):
+    """Секунды Unix -> местное время (aware datetime)."""
+    return datetime.fromtimestamp(timestamp, TZ)
+
+
+def from_local(value):
+    """Местное время без часового пояса (datetime или 'ГГГГ-ММ-ДД[ ЧЧ:ММ[:СС]]') -> секунды Unix."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return int(TZ.localize(value).timestamp())
+
+
+@lru_cache(maxsize=1024)
+def day_start(day):
+    """Начало местного дня day (date) в секундах Unix."""
+    return from_local(datetime.combine(day, datetime.min.time()))
+
+
+def local_day_start(timestamp):
+    """Начало местного дня, в который попадает timestamp (используется и как функция SQLite local_day)."""
+    if timestamp is None:
+        return None
+    return day_start(to_local(timestamp).date())
+
+
+def day_bounds(start_date, end_date):
+    """Включительный диапазон местных дней -> полуоткрытый диапазон [начало, конец) в секундах Unix."""
+    if isinstance(start_date, str):
+        start_date = date.fromisoformat(start_date)
+    if isinstance(end_date, str):
+        end_date = date.fromisoformat(end_date)
+    return day_start(start_date), day_start(end_date + timedelta(days=1))
+
+
+def format_local(timestamp, fmt='%d.%m.%Y %H:%M', default=None):
+    """Форматирует секунды Unix в местное время для вывода; для None возвращает default."""
+    if timestamp is None:
+        return default
+    return to_local(timestamp).strftime(fmt)
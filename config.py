@@ -1,2 +1,78 @@
+import os
+
 TELEBOT_TOKEN = "6667181660:AAFFHVzkoAmM1D44eEU60vF4mIA-JU46R8Y"
 id_chat_owner = "1753749064"  # Обновите на правильный идентификатор
+
+# ===== Режим получения обновлений =====
+# polling — длинный опрос getUpdates; webhook — встроенный HTTP-сервер принимает обновления от Telegram.
+# Процесс бота один (Procfile), режим выбирается только этой переменной: пока webhook установлен,
+# Telegram отклоняет getUpdates, а два процесса писали бы в один файл базы.
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+
+# ===== Настройки webhook =====
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес, например https://example.herokuapp.com/webhook
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("PORT", os.getenv("WEBHOOK_PORT", "8443")))  # Heroku передаёт порт в PORT
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Проверяется в заголовке X-Telegram-Bot-Api-Secret-Token
+
+# ===== Диспетчер обновлений =====
+# Чаты обрабатываются параллельно, обновления одного чата — строго по порядку
+DISPATCHER_WORKERS = int(os.getenv("DISPATCHER_WORKERS", "8"))
+DISPATCHER_CHAT_QUEUE_SIZE = int(os.getenv("DISPATCHER_CHAT_QUEUE_SIZE", "100"))  # Очередь одного чата
+DISPATCHER_MAX_PENDING = int(os.getenv("DISPATCHER_MAX_PENDING", "10000"))  # Всего ожидающих обновлений
+
+# ===== Асинхронный режим (bot_async.py) =====
+# Клиентские обработчики — корутины в одном цикле событий, обработчики администратора и база — в пулах потоков
+ASYNC_MAX_CONCURRENCY = int(os.getenv("ASYNC_MAX_CONCURRENCY", "1000"))  # Одновременно обрабатываемых обновлений
+ASYNC_DB_WORKERS = int(os.getenv("ASYNC_DB_WORKERS", "4"))  # Потоков для вызовов db.py
+ASYNC_HANDLER_WORKERS = int(os.getenv("ASYNC_HANDLER_WORKERS", "4"))  # Потоков для синхронных обработчиков
+ASYNC_HTTP_CONNECTIONS = int(os.getenv("ASYNC_HTTP_CONNECTIONS", "100"))  # Соединений в общей сессии aiohttp
+
+# Адрес Bot API; переопределяется для локального тестирования (см. benchmarks/fake_telegram.py)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "")
+
+# ===== Перевод старых дат в секунды Unix (миграция 7) =====
+# Пояс сервера, в котором прежний код писал наивные datetime.now() (records.request_date); на Heroku — UTC
+LEGACY_SERVER_TIMEZONE = os.getenv("LEGACY_SERVER_TIMEZONE", "UTC")
+
+# ===== Метрики =====
+# Выгрузка для Prometheus: http://METRICS_HOST:METRICS_PORT/metrics; 0 (по умолчанию) — не запускать сервер
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))  # Например, 9108
+
+# ===== Выгрузка статистики и записей в файл =====
+# Файл собирается в памяти до этого размера (байт), дальше переносится во временный файл на диске
+EXPORT_SPOOL_MAX_SIZE = int(os.getenv("EXPORT_SPOOL_MAX_SIZE", str(1024 * 1024)))
+
+# ===== Состояние диалогов =====
+CHAT_STATE_TTL = int(os.getenv("CHAT_STATE_TTL", "1800"))  # Секунд без действий до сброса диалога
+CHAT_STATE_MAX_CHATS = int(os.getenv("CHAT_STATE_MAX_CHATS", "10000"))  # Сколько диалогов держать в памяти
+CHAT_STATE_PERSISTENT = os.getenv("CHAT_STATE_PERSISTENT", "0") == "1"  # Дублировать состояние в базу (чтение на каждое сообщение)
+
+# ===== Лимиты исходящих сообщений =====
+# Telegram допускает около 30 сообщений в секунду всего и около одного в секунду в один чат
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))  # Сколько сообщений подряд можно отправить в чат
+OUTBOUND_WORKERS = int(os.getenv("OUTBOUND_WORKERS", "8"))  # Параллельных HTTP-запросов к Bot API
+
+# ===== Напоминания о записи =====
+# За сколько минут до приёма отправлять напоминания клиенту (через запятую)
+REMINDER_OFFSETS = [int(m) for m in os.getenv("REMINDER_OFFSETS", "1440,120").split(",") if m.strip()]
+
+# ===== Свободные окна для записи =====
+# Рабочие часы по дням недели (0 — понедельник); выходные дни не указываются
+WORKING_HOURS = {
+    0: ("10:00", "20:00"),
+    1: ("10:00", "20:00"),
+    2: ("10:00", "20:00"),
+    3: ("10:00", "20:00"),
+    4: ("10:00", "20:00"),
+    5: ("11:00", "17:00"),
+}
+SLOT_MINUTES = 15  # Шаг сетки занятости
+# Длительность приёма в минутах (процедура у записи не хранится, поэтому длительность общая)
+DEFAULT_APPOINTMENT_MINUTES = 60
+FREE_SLOTS_SHOWN = 5  # Сколько ближайших окон показывать клиенту
+FREE_SLOTS_SEARCH_DAYS = 30  # На сколько дней вперёд искать окна
@@ -1,198 +1,219 @@
+import logging
+import os
 import sqlite3
-import pytz
-from datetime import datetime, timedelta
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import groupby, islice
+from operator import itemgetter
+import clock
+from metrics import metrics
+from migrations import run_migrations
 
 
 # ===== Настройки базы данных =====
+# Время во всех таблицах хранится целыми секундами Unix (UTC), см. clock.py
 DB_NAME = "appointments.db"
-TIMEZONE = "Europe/Moscow"
+DB_BUSY_TIMEOUT = 5.0  # Сколько секунд ждать снятия блокировки, прежде чем выдать "database is locked"
+DB_CACHED_STATEMENTS = 128  # Размер кэша подготовленных выражений на одно соединение
+
+# ===== Управление соединениями =====
+# Каждый поток (в том числе рабочие потоки TeleBot) открывает одно соединение
+# и переиспользует его для всех вызовов, вместо connect/close на каждый запрос.
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_generation = 0  # Увеличивается при close_connections, чтобы потоки переоткрыли соединения
+
+
+def _open_connection(db_name):
+    """Открывает соединение и настраивает WAL, busy timeout и кэш выражений."""
+    conn = sqlite3.connect(
+        db_name,
+        timeout=DB_BUSY_TIMEOUT,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False  # Закрыть соединение может и другой поток (close_connections)
+    )
+    # Новый файл сразу создаётся с инкрементальной очисткой (настройка действует только до включения WAL);
+    # существующий переводится в неё при первой ротации user_visits, см. _reclaim_space
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    conn.execute("PRAGMA journal_mode=WAL;")
+    conn.execute("PRAGMA synchronous=NORMAL;")  # В режиме WAL это безопасно и избавляет от fsync на каждый commit
+    conn.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT * 1000)};")
+    # Начало местного дня для метки времени — группировка посещений по дням в свёртке
+    conn.create_function("local_day", 1, clock.local_day_start, deterministic=True)
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+def get_connection():
+    """Возвращает долгоживущее соединение текущего потока, открывая его при первом обращении."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.db_name != DB_NAME or _local.generation != _generation:
+        # Соединение ещё не открыто, было закрыто или сменился файл базы (например, в бенчмарках)
+        conn = _open_connection(DB_NAME)
+        _local.conn = conn
+        _local.db_name = DB_NAME
+        _local.generation = _generation
+    return conn
+
+
+def close_connections():
+    """Закрывает все открытые соединения (вызывается при остановке бота)."""
+    global _generation
+    with _connections_lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+    for conn in connections:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+@contextmanager
+def db_cursor(write=False):
+    """
+    Выдаёт курсор на соединении текущего потока.
+    - При write=True открывает транзакцию сразу с блокировкой на запись (BEGIN IMMEDIATE),
+      чтобы конкурирующие писатели ждали busy timeout, а не падали посреди транзакции.
+    - Фиксирует транзакцию при успехе и откатывает при ошибке.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        if write:
+            cursor.execute("BEGIN IMMEDIATE;")
+        yield cursor
+        if conn.in_transaction:
+            conn.commit()
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
 
 # ===== Вспомогательные функции =====
-def get_local_time():
-    """Возвращает текущее время с учётом часового пояса."""
-    tz = pytz.timezone(TIMEZONE)
-    local_time = datetime.now(tz)
-    return local_time.strftime('%Y-%m-%d %H:%M:%S')
+def get_appointment_at(date, time):
+    """Начало приёма в секундах Unix по местным дате ('ГГГГ-ММ-ДД' или date) и времени ('ЧЧ:ММ'); None, если чего-то нет."""
+    if not date or not time:
+        return None
+    return clock.from_local(f"{date} {time}")
+
+def get_day_bounds(start_date, end_date):
+    """
+    Переводит включительный диапазон местных дней в полуоткрытый диапазон [начало, конец) в секундах Unix,
+    чтобы сравнивать visited_at напрямую и искать по индексу.
+    """
+    return clock.day_bounds(start_date, end_date)
 
 # ===== Управление таблицами =====
 def create_tables():
-    """Создаёт все необходимые таблицы."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    # Таблица записей
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS records (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        telegram_user_id INTEGER NOT NULL,
-        username TEXT,
-        first_name TEXT,
-        last_name TEXT,
-        phone_number TEXT,
-        appointment_date DATE,
-        appointment_time TIME,
-        request_date DATETIME,
-        comments TEXT,
-        status TEXT,
-        message_id INTEGER
-    );
-    """)
-
-    # Таблица посещений пользователей
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS user_visits (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        telegram_user_id INTEGER NOT NULL,
-        username TEXT,
-        first_name TEXT,
-        last_name TEXT,
-        visit_date DATETIME,
-        unique_until DATETIME,
-        action_type TEXT,
-        action_details TEXT
-    );
-    """)
-
-    conn.commit()
-    conn.close()
+    """Создаёт все необходимые таблицы и доводит схему до актуальной версии (см. migrations.py)."""
+    return run_migrations(get_connection())
 
 # ===== Операции с таблицей records =====
-def save_appointment(user_id, username, first_name, last_name, phone_number, date, time, request_date, comments, status):
-    """Сохраняет запись в базе данных. Обновляет запись, если она уже существует."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    # Проверяем, существует ли запись с таким telegram_user_id и appointment_date
-    cursor.execute("""
-        SELECT id FROM records
-        WHERE telegram_user_id = ? AND appointment_date = ?;
-    """, (user_id, date))
-    existing_record = cursor.fetchone()
+def save_appointment(user_id, username, first_name, last_name, phone_number, date, time, requested_at, comments, status):
+    """
+    Сохраняет запись в базе данных и возвращает её ID. requested_at — секунды Unix.
+    Запись пользователя на то же время обновляется: один INSERT ... ON CONFLICT по уникальному ключу
+    (telegram_user_id, appointment_at) в одной транзакции, поэтому параллельные вызовы не создают дублей.
+    """
+    appointment_at = get_appointment_at(date, time)
 
-    if existing_record:
-        # Если запись существует, обновляем её
-        cursor.execute("""
-            UPDATE records
-            SET username = ?, first_name = ?, last_name = ?, phone_number = ?, 
-                appointment_time = ?, comments = ?, status = ?, request_date = ?
-            WHERE id = ?;
-        """, (username, first_name, last_name, phone_number, time, comments, status, request_date, existing_record[0]))
-    else:
-        # Если записи нет, создаём новую
+    with db_cursor(write=True) as cursor:
         cursor.execute("""
             INSERT INTO records (
-                telegram_user_id, username, first_name, last_name, phone_number, 
-                appointment_date, appointment_time, request_date, comments, status
+                telegram_user_id, username, first_name, last_name, phone_number,
+                appointment_at, requested_at, comments, status
             )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
-        """, (user_id, username, first_name, last_name, phone_number, date, time, request_date, comments, status))
-
-    conn.commit()
-    conn.close()
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (telegram_user_id, appointment_at) DO UPDATE SET
+                username = excluded.username, first_name = excluded.first_name, last_name = excluded.last_name,
+                phone_number = excluded.phone_number, comments = excluded.comments, status = excluded.status,
+                requested_at = excluded.requested_at
+            RETURNING id;
+        """, (user_id, username, first_name, last_name, phone_number, appointment_at, requested_at,
+              comments, status))
+        return cursor.fetchone()[0]
 
 
 def save_message_id_to_db(record_id, message_id):
     """Сохраняет message_id для конкретной записи."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        UPDATE records
-        SET message_id = ?
-        WHERE id = ?;
-    """, (message_id, record_id))
-
-    conn.commit()
-    conn.close()
+    with db_cursor(write=True) as cursor:
+        cursor.execute("""
+            UPDATE records
+            SET message_id = ?
+            WHERE id = ?;
+        """, (message_id, record_id))
 
 
 def update_appointment(user_id, appointment_date, appointment_time, status, comment=None):
-    """Обновляет запись в базе данных."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    """Обновляет запись в базе данных (дата и время приёма — местные, хранятся одной меткой appointment_at)."""
+    appointment_at = get_appointment_at(appointment_date, appointment_time)
 
-    cursor.execute("""
-        UPDATE records
-        SET appointment_date = ?, appointment_time = ?, status = ?, comments = ?
-        WHERE id = ?;
-    """, (appointment_date, appointment_time, status, comment, user_id))  # user_id здесь должен быть record_id
-
-    conn.commit()
-    conn.close()
+    with db_cursor(write=True) as cursor:
+        # При переносе приёма отметка об отправленных напоминаниях сбрасывается
+        cursor.execute("""
+            UPDATE records
+            SET appointment_at = ?, status = ?, comments = ?,
+                reminded_offset = CASE WHEN appointment_at IS ? THEN reminded_offset END
+            WHERE id = ?;
+        """, (appointment_at, status, comment, appointment_at, user_id))  # user_id здесь должен быть record_id
 
 def get_last_appointment_id(user_id):
     """Возвращает последний ID записи для пользователя."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT id FROM records
-        WHERE telegram_user_id = ? AND status = 'ожидает'
-        ORDER BY id DESC LIMIT 1;
-    """, (user_id,))
-    result = cursor.fetchone()
-
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT id FROM records
+            WHERE telegram_user_id = ? AND status = 'ожидает'
+            ORDER BY id DESC LIMIT 1;
+        """, (user_id,))
+        result = cursor.fetchone()
     return result[0] if result else None
 
 def check_appointment_exists(record_id):
     """Проверяет существование записи в базе данных."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT 1 FROM records WHERE id = ?;", (record_id,))
-    exists = cursor.fetchone() is not None
-
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute("SELECT 1 FROM records WHERE id = ?;", (record_id,))
+        exists = cursor.fetchone() is not None
     return exists
 
 # ===== Операции с таблицей user_visits =====
 def save_user_visit(user_id, username, first_name, last_name):
-    """Логирует посещение пользователя в боте."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    visit_date = datetime.now(pytz.timezone(TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
-    unique_until = (datetime.now(pytz.timezone(TIMEZONE)) + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
-
-    # Проверяем, существует ли пользователь в таблице
-    cursor.execute("""
-        SELECT id FROM user_visits WHERE telegram_user_id = ?;
-    """, (user_id,))
-    result = cursor.fetchone()
+    """
+    Отмечает посещение пользователя в боте и возвращает ID строки-отметки.
+    У пользователя одна отметка (строка user_visits без action_type): один INSERT ... ON CONFLICT
+    по частичному уникальному индексу создаёт её или обновляет время и имя.
+    """
+    visited_at = clock.now()
+    unique_until = visited_at + 24 * 60 * 60
 
-    if result:
-        # Если пользователь уже есть, обновляем запись
+    with db_cursor(write=True) as cursor:
         cursor.execute("""
-            UPDATE user_visits
-            SET visit_date = ?, unique_until = ?, username = ?, first_name = ?, last_name = ?
-            WHERE telegram_user_id = ?;
-        """, (visit_date, unique_until, username, first_name, last_name, user_id))
-    else:
-        # Если пользователя нет, добавляем новую запись
-        cursor.execute("""
-            INSERT INTO user_visits (
-                telegram_user_id, username, first_name, last_name, visit_date, unique_until
-            )
-            VALUES (?, ?, ?, ?, ?, ?);
-        """, (user_id, username, first_name, last_name, visit_date, unique_until))
-
-    conn.commit()
-    conn.close()
+            INSERT INTO user_visits (telegram_user_id, username, first_name, last_name, visited_at, unique_until)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (telegram_user_id) WHERE action_type IS NULL DO UPDATE SET
+                visited_at = excluded.visited_at, unique_until = excluded.unique_until,
+                username = excluded.username, first_name = excluded.first_name, last_name = excluded.last_name
+            RETURNING id;
+        """, (user_id, username, first_name, last_name, visited_at, unique_until))
+        return cursor.fetchone()[0]
 
 def get_user_data_by_record_id(record_id):
     """Возвращает данные пользователя по ID записи."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT telegram_user_id, username, first_name, last_name, phone_number, message_id
-        FROM records
-        WHERE id = ?;
-    """, (record_id,))
-    result = cursor.fetchone()
-
-    conn.close()
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT telegram_user_id, username, first_name, last_name, phone_number, message_id
+            FROM records
+            WHERE id = ?;
+        """, (record_id,))
+        result = cursor.fetchone()
     if result:
         return {
             "telegram_user_id": result[0],
@@ -206,150 +227,516 @@ def get_user_data_by_record_id(record_id):
 
 def get_unique_users():
     """Возвращает список уникальных пользователей на основании unique_until."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    # Получаем текущую дату и время
-    current_time = datetime.now(pytz.timezone(TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
-
-    # Фильтруем пользователей, у которых unique_until >= текущей даты
-    cursor.execute("""
-        SELECT telegram_user_id, username, first_name, last_name, visit_date, unique_until
-        FROM user_visits
-        WHERE unique_until > ?;  -- Дата должна быть в будущем
-    """, (current_time,))
-
-    users = cursor.fetchall()
-    conn.close()
+    now = clock.now()
+    # Фильтруем пользователей, у которых unique_until ещё не наступил (визит не раньше чем сутки назад,
+    # поэтому из архивов подключается не больше одного, только что перенесённого месяца)
+    users = _select_visits(
+        "id, telegram_user_id, username, first_name, last_name, visited_at, unique_until",
+        "unique_until > ?", (now,), range_start=now - 24 * 60 * 60
+    )
 
     # Преобразуем данные в удобный формат
     return [
         {
-            "telegram_user_id": user[0],
-            "username": user[1],
-            "first_name": user[2],
-            "last_name": user[3],
-            "visit_date": user[4],
-            "unique_until": user[5],
+            "telegram_user_id": user[1],
+            "username": user[2],
+            "first_name": user[3],
+            "last_name": user[4],
+            "visited_at": user[5],
+            "unique_until": user[6],
         }
         for user in users
     ]
 
-def get_repeat_visits():
+def get_repeat_visits(after_user_id=None, before_user_id=None, limit=None):
     """
     Возвращает список пользователей с повторной активностью, включая данные о том, оставляли ли они номер телефона.
+    Поддерживает постраничную выборку по ключу telegram_user_id:
+    - after_user_id — страница после указанного пользователя;
+    - before_user_id — страница перед указанным пользователем (ближайшие limit пользователей);
+    - limit — максимальное количество пользователей (None — все).
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
-    query = """
-        SELECT 
-            uv.telegram_user_id, 
-            uv.username, 
-            uv.first_name, 
-            uv.last_name, 
-            MAX(uv.visit_date) as last_visit, 
-            MAX(CASE WHEN uv.action_details = 'Отправить номер телефона' THEN uv.visit_date END) as phone_action_date, 
-            COUNT(*) as visit_count
-        FROM user_visits uv
-        GROUP BY uv.telegram_user_id
-        HAVING COUNT(*) > 1
-    """
-    cursor.execute(query)
-    result = cursor.fetchall()
-    conn.close()
+    with db_cursor() as cursor:
+        source = _daily_visits_source(cursor, after_user_id=after_user_id, before_user_id=before_user_id)
+        users = _fetch_user_stats(
+            cursor, [source], min_visits=2, descending=before_user_id is not None, limit=limit
+        )
 
     return [
         {
-            "telegram_user_id": row[0],
-            "username": row[1],
-            "first_name": row[2],
-            "last_name": row[3],
-            "visit_date": row[4],
-            "phone_action_date": row[5],  # Дата, когда пользователь отправлял номер телефона (или None)
-            "visit_count": row[6]
+            "telegram_user_id": user["telegram_user_id"],
+            "username": user["username"],
+            "first_name": user["first_name"],
+            "last_name": user["last_name"],
+            "visited_at": user["visited_at"],
+            "phone_action_at": user["phone_action_at"],  # Когда пользователь отправлял номер телефона (или None)
+            "visit_count": user["visit_count"]
         }
-        for row in result
+        for user in users
     ]
 
 
 
 
-def get_inactive_users(start_date, end_date):
+def get_inactive_users(start_date, end_date, after_user_id=None, before_user_id=None, limit=None):
     """
     Возвращает список неактивных пользователей за указанный период.
+    Параметры after_user_id, before_user_id и limit — как у get_repeat_visits.
     """
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+    range_start, range_end = get_day_bounds(start_date, end_date)
 
-    query = """
-        SELECT telegram_user_id, username, first_name, last_name, MAX(visit_date) as last_visit
-        FROM user_visits
-        WHERE DATE(visit_date) NOT BETWEEN ? AND ?
-        GROUP BY telegram_user_id
-    """
-
-    cursor.execute(query, (start_date, end_date))
-    result = cursor.fetchall()
-    conn.close()
+    with db_cursor() as cursor:
+        # "Вне периода" — это посещения до начала периода и после его конца
+        page = {"after_user_id": after_user_id, "before_user_id": before_user_id}
+        sources = [
+            _daily_visits_source(cursor, range_end=range_start, **page),
+            _daily_visits_source(cursor, range_start=range_end, **page),
+        ]
+        users = _fetch_user_stats(cursor, sources, descending=before_user_id is not None, limit=limit)
 
     # Преобразуем результат в читаемый формат
     return [
         {
-            "telegram_user_id": row[0],
-            "username": row[1],
-            "first_name": row[2],
-            "last_name": row[3],
-            "visit_date": row[4]
+            "telegram_user_id": user["telegram_user_id"],
+            "username": user["username"],
+            "first_name": user["first_name"],
+            "last_name": user["last_name"],
+            "visited_at": user["visited_at"]
         }
-        for row in result
+        for user in users
     ]
 
 
 
 def log_user_action(user_id, username, first_name, last_name, action_type, action_details=None):
     """Логирует действия пользователя в базу данных."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-
     # Текущее время для логирования
-    action_time = datetime.now(pytz.timezone(TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+    action_time = clock.now()
+    log_user_actions([(user_id, username, first_name, last_name, action_time, action_type, action_details)])
+
+
+def log_user_actions(actions):
+    """
+    Записывает пачку действий пользователей одной транзакцией.
+    Каждый элемент: (user_id, username, first_name, last_name, visited_at, action_type, action_details),
+    где visited_at (секунды Unix) зафиксирован в момент действия.
+    """
+    with db_cursor(write=True) as cursor:
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM user_visits;")
+        last_id = cursor.fetchone()[0]
+
+        cursor.executemany("""
+            INSERT INTO user_visits (telegram_user_id, username, first_name, last_name, visited_at, action_type, action_details)
+            VALUES (?, ?, ?, ?, ?, ?, ?);
+        """, actions)
+
+        # Действия за уже свёрнутые дни (например, дописанные после полуночи) сразу добавляем в свёртку
+        watermark = _get_rollup_watermark(cursor)
+        if watermark and any(action[4] and action[4] < watermark for action in actions):
+            _merge_visits_into_rollup(cursor, "id > ? AND visited_at < ?", (last_id, watermark))
+
+
+# ===== Дневная свёртка user_visits =====
+# Статистика читает завершённые дни из user_visits_daily, а сырые строки user_visits —
+# только после границы свёртки (в обычном режиме это текущий неполный день).
+PHONE_ACTION_DETAILS = "Отправить номер телефона"
+ROLLUP_NAME = "user_visits_daily"
+_rollup_watermark = None  # Последняя известная этому процессу граница свёртки
+
+
+def _today_start():
+    """Начало текущего местного дня в секундах Unix."""
+    return clock.day_start(clock.today())
+
+
+def _get_rollup_watermark(cursor):
+    """Возвращает границу свёртки: всё раньше неё уже учтено в user_visits_daily (None — свёртки ещё не было)."""
+    cursor.execute("SELECT value FROM rollup_state WHERE name = ?;", (ROLLUP_NAME,))
+    row = cursor.fetchone()
+    return int(row[0]) if row else None
+
+
+def _merge_visits_into_rollup(cursor, condition, params, table="user_visits"):
+    """Добавляет в дневную свёртку сырые посещения, отобранные условием по table (user_visits или архивный месяц)."""
+    cursor.execute(f"""
+        INSERT INTO user_visits_daily (
+            telegram_user_id, visit_day, username, first_name, last_name, visit_count, last_visit, phone_action_at
+        )
+        SELECT telegram_user_id, local_day(visited_at), username, first_name, last_name,
+               COUNT(*), MAX(visited_at), MAX(CASE WHEN action_details = ? THEN visited_at END)
+        FROM {table}
+        WHERE {condition}
+        GROUP BY telegram_user_id, local_day(visited_at)
+        ON CONFLICT (telegram_user_id, visit_day) DO UPDATE SET
+            username = CASE WHEN excluded.last_visit >= last_visit THEN excluded.username ELSE username END,
+            first_name = CASE WHEN excluded.last_visit >= last_visit THEN excluded.first_name ELSE first_name END,
+            last_name = CASE WHEN excluded.last_visit >= last_visit THEN excluded.last_name ELSE last_name END,
+            visit_count = visit_count + excluded.visit_count,
+            last_visit = MAX(last_visit, excluded.last_visit),
+            phone_action_at = COALESCE(MAX(phone_action_at, excluded.phone_action_at),
+                                       phone_action_at, excluded.phone_action_at);
+    """, (PHONE_ACTION_DETAILS, *params))
+
+
+def rollup_user_visits(until_day=None):
+    """
+    Сворачивает в user_visits_daily все завершённые дни, которые ещё не были свёрнуты.
+    - until_day: первый местный день, который НЕ сворачивается (date или 'ГГГГ-ММ-ДД'), по умолчанию сегодня.
+    - Читает только сырые строки между прошлой и новой границей, поэтому вызывать можно сколько угодно часто.
+    Возвращает новую границу свёртки.
+    """
+    global _rollup_watermark
+    until = clock.day_bounds(until_day, until_day)[0] if until_day else _today_start()
+
+    with db_cursor(write=True) as cursor:
+        watermark = _get_rollup_watermark(cursor)
+        if watermark is None or watermark < until:
+            if watermark is None:
+                _merge_visits_into_rollup(cursor, "visited_at < ?", (until,))
+            else:
+                _merge_visits_into_rollup(cursor, "visited_at >= ? AND visited_at < ?", (watermark, until))
+            cursor.execute("""
+                INSERT INTO rollup_state (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value;
+            """, (ROLLUP_NAME, until))
+            watermark = until
+
+    _rollup_watermark = watermark
+    return watermark
+
+
+def rollup_user_visits_on_new_day():
+    """
+    Сворачивает завершённые дни, только если с прошлой свёртки в этом процессе начался новый день.
+    Вызывается после каждой записанной пачки действий отдельно от её транзакции (см. ActionLogWriter).
+    """
+    if _rollup_watermark != _today_start():
+        rollup_user_visits()
+
+
+def rebuild_user_visits_rollup():
+    """Пересобирает дневную свёртку заново по всей истории user_visits, включая архивные месяцы (команда backfill)."""
+    global _rollup_watermark
+    with db_cursor(write=True) as cursor:
+        cursor.execute("DELETE FROM user_visits_daily;")
+        cursor.execute("DELETE FROM rollup_state WHERE name = ?;", (ROLLUP_NAME,))
+    _rollup_watermark = None
+
+    with db_cursor() as cursor:
+        months = _visit_partitions(cursor)
+    for month_start in months:
+        with _attached_partition(month_start) as schema:
+            with db_cursor(write=True) as cursor:
+                _merge_visits_into_rollup(cursor, "visited_at IS NOT NULL", (), table=f"{schema}.user_visits")
+    return rollup_user_visits()
+
+
+# ===== Помесячные разделы user_visits =====
+# user_visits пополняется на каждое нажатие, поэтому завершённые месяцы переносятся в отдельные файлы
+# рядом с основной базой (<база>_visits_ГГГГ_ММ.db); в основном файле остаётся текущий месяц.
+# - Переносятся только месяцы, полностью попавшие в дневную свёртку: статистика по свёртке
+#   (_daily_visits_source) читает сырые строки лишь после её границы, то есть из основного файла.
+# - Запросы по сырым строкам за произвольный период (_select_visits) подключают через ATTACH
+#   только месяцы, пересекающиеся с периодом, и отключают их после чтения (лимит ATTACH — 10 файлов).
+# - Строки-отметки посещения (action_type IS NULL) не переносятся: save_user_visit обновляет их
+#   по частичному уникальному индексу основного файла, в архиве отметка стала бы второй.
+# - Освободившиеся после переноса страницы основного файла возвращаются incremental_vacuum.
+# - Перенос и очистка держат блокировку на запись, поэтому выполняются не ботом, а отдельной командой
+#   python db.py rotate-visits (например, ежедневной задачей планировщика).
+PARTITION_MOVE_CHUNK = 20000  # Строк за одну транзакцию переноса, чтобы писатели не ждали дольше busy timeout
+_VISIT_COLUMNS = ("id, telegram_user_id, username, first_name, last_name, visited_at, unique_until, "
+                  "action_type, action_details")
+
+
+def _month_bounds(timestamp):
+    """(начало местного месяца, начало следующего месяца) в секундах Unix для момента timestamp."""
+    month = clock.to_local(timestamp).date().replace(day=1)
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    return clock.day_start(month), clock.day_start(next_month)
+
+
+def _partition_path(month_start):
+    """Файл архивного месяца рядом с основной базой."""
+    base, _ = os.path.splitext(DB_NAME)
+    return f"{base}_visits_{clock.format_local(month_start, '%Y_%m')}.db"
+
+
+@contextmanager
+def _attached_partition(month_start):
+    """Подключает файл архивного месяца к соединению текущего потока и отключает после использования."""
+    conn = get_connection()
+    schema = f"visits_{clock.format_local(month_start, '%Y_%m')}"
+    conn.execute(f"ATTACH DATABASE ? AS {schema};", (_partition_path(month_start),))
+    try:
+        yield schema
+    finally:
+        conn.execute(f"DETACH DATABASE {schema};")
+
+
+def _visit_partitions(cursor, range_start=None, range_end=None):
+    """Начала архивных месяцев, пересекающихся с [range_start, range_end), по возрастанию."""
+    conditions, params = [], []
+    if range_start is not None:
+        conditions.append("month_end > ?")
+        params.append(range_start)
+    if range_end is not None:
+        conditions.append("month_start < ?")
+        params.append(range_end)
+    cursor.execute(f"""
+        SELECT month_start FROM user_visits_partitions
+        {'WHERE ' + ' AND '.join(conditions) if conditions else ''}
+        ORDER BY month_start;
+    """, params)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _select_visits(columns, condition, params, range_start=None, range_end=None):
+    """
+    Строки user_visits по условию из основного файла и архивных месяцев, пересекающихся с [range_start, range_end).
+    - Первой колонкой в columns должен идти id: пока идёт перенос месяца, строка может быть видна
+      и в основном файле, и в архиве, такие дубли отбрасываются.
+    - Порядок результата — архивные месяцы по возрастанию, затем основной файл.
+    """
+    with db_cursor() as cursor:
+        cursor.execute(f"SELECT {columns} FROM main.user_visits WHERE {condition};", params)
+        hot_rows = cursor.fetchall()
+        months = _visit_partitions(cursor, range_start, range_end)
 
-    # Добавляем запись в таблицу
-    cursor.execute("""
-        INSERT INTO user_visits (telegram_user_id, username, first_name, last_name, visit_date, action_type, action_details)
-        VALUES (?, ?, ?, ?, ?, ?, ?);
-    """, (user_id, username, first_name, last_name, action_time, action_type, action_details))
+    if not months:
+        return hot_rows
 
-    conn.commit()
-    conn.close()
+    hot_ids = {row[0] for row in hot_rows}
+    rows = []
+    for month_start in months:
+        with _attached_partition(month_start) as schema:
+            with db_cursor() as cursor:
+                cursor.execute(f"SELECT {columns} FROM {schema}.user_visits WHERE {condition};", params)
+                rows += [row for row in cursor.fetchall() if row[0] not in hot_ids]
+    return rows + hot_rows
 
 
+def _seal_month(month_start, month_end):
+    """
+    Переносит строки одного месяца из основного файла в архивный порциями по PARTITION_MOVE_CHUNK.
+    Месяц регистрируется до начала переноса, чтобы читатели сразу искали его строки и в архиве.
+    Перенос идемпотентен (INSERT OR IGNORE по id), поэтому прерванную ротацию можно просто повторить.
+    """
+    with db_cursor(write=True) as cursor:
+        cursor.execute("""
+            INSERT INTO user_visits_partitions (month_start, month_end) VALUES (?, ?)
+            ON CONFLICT (month_start) DO UPDATE SET sealed_at = NULL;
+        """, (month_start, month_end))
+
+    with _attached_partition(month_start) as schema:
+        # Новый файл архива сразу создаётся с инкрементальной очисткой (до первой таблицы, вне транзакции)
+        get_connection().execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL;")
+        with db_cursor(write=True) as cursor:
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {schema}.user_visits (
+                    id INTEGER PRIMARY KEY,
+                    telegram_user_id INTEGER NOT NULL,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    visited_at INTEGER,
+                    unique_until INTEGER,
+                    action_type TEXT,
+                    action_details TEXT
+                );
+            """)
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS {schema}.idx_user_visits_visited_at
+                ON user_visits (visited_at);
+            """)
+
+        while True:
+            with db_cursor(write=True) as cursor:
+                cursor.execute("""
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM main.user_visits
+                        WHERE visited_at >= ? AND visited_at < ? AND action_type IS NOT NULL
+                        ORDER BY id LIMIT ?
+                    );
+                """, (month_start, month_end, PARTITION_MOVE_CHUNK))
+                last_id = cursor.fetchone()[0]
+                if last_id is None:
+                    cursor.execute(f"""
+                        UPDATE user_visits_partitions
+                        SET row_count = (SELECT COUNT(*) FROM {schema}.user_visits), sealed_at = ?
+                        WHERE month_start = ?;
+                    """, (clock.now(), month_start))
+                    break
+
+                condition = "visited_at >= ? AND visited_at < ? AND action_type IS NOT NULL AND id <= ?"
+                cursor.execute(f"""
+                    INSERT OR IGNORE INTO {schema}.user_visits ({_VISIT_COLUMNS})
+                    SELECT {_VISIT_COLUMNS} FROM main.user_visits WHERE {condition};
+                """, (month_start, month_end, last_id))
+                cursor.execute(f"DELETE FROM main.user_visits WHERE {condition};", (month_start, month_end, last_id))
+
+
+def _reclaim_space():
+    """
+    Возвращает системе страницы, освободившиеся после переноса.
+    Файл, созданный до появления разделов, один раз переводится в режим auto_vacuum=INCREMENTAL полным VACUUM —
+    к этому моменту история уже перенесена в архивы, поэтому переписывать приходится только текущий месяц.
+    """
+    conn = get_connection()
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        conn.execute("VACUUM;")
+    else:
+        # executescript выполняет прагму до конца; через execute она освобождает лишь одну страницу за шаг
+        conn.executescript("PRAGMA incremental_vacuum;")
+    # Изменения лежат в WAL; файл уменьшается после переноса страниц обратно в основной файл
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);").fetchall()
+
+
+def rotate_user_visits():
+    """
+    Переносит в архивные файлы все завершённые месяцы user_visits, уже попавшие в дневную свёртку,
+    и освобождает место в основном файле. Возвращает список перенесённых месяцев (начала в секундах Unix).
+    Запускается отдельно от бота: python db.py rotate-visits.
+    """
+    current_month = _month_bounds(clock.now())[0]
+    # Месяц переносится, только если он целиком раньше и текущего месяца, и границы свёртки
+    boundary = min(current_month, rollup_user_visits())
+
+    sealed = []
+    while True:
+        with db_cursor() as cursor:
+            cursor.execute("""
+                SELECT MIN(visited_at) FROM user_visits
+                WHERE visited_at < ? AND action_type IS NOT NULL;
+            """, (boundary,))
+            oldest = cursor.fetchone()[0]
+        if oldest is None:
+            break
+        month_start, month_end = _month_bounds(oldest)
+        if month_end > boundary:
+            break
+        _seal_month(month_start, month_end)
+        sealed.append(month_start)
+
+    if sealed:
+        _reclaim_space()
+        logging.info(f"user_visits: в архив перенесено месяцев: {len(sealed)}")
+    return sealed
+
+
+def _daily_visits_source(cursor, range_start=None, range_end=None, after_user_id=None, before_user_id=None):
+    """
+    Возвращает (sql, params) подзапроса посещений за [range_start, range_end) с колонками
+    telegram_user_id, username, first_name, last_name, visit_count, last_visit, phone_action_at.
+    Границы — секунды Unix начала местных дней, поэтому сравниваются и с visited_at, и с visit_day свёртки.
+    Завершённые дни берутся из свёртки, сырые строки — только после её границы.
+    after_user_id/before_user_id — ключ страницы (keyset): только пользователи с большим/меньшим ID.
+    """
+    watermark = _get_rollup_watermark(cursor)
+    parts, params = [], []
+
+    user_conditions, user_values = [], []
+    if after_user_id is not None:
+        user_conditions.append("telegram_user_id > ?")
+        user_values.append(after_user_id)
+    if before_user_id is not None:
+        user_conditions.append("telegram_user_id < ?")
+        user_values.append(before_user_id)
+
+    if watermark:
+        rollup_end = min(filter(None, [watermark, range_end]))
+        conditions, values = ["visit_day < ?"] + user_conditions, [rollup_end] + user_values
+        if range_start:
+            conditions.append("visit_day >= ?")
+            values.append(range_start)
+        parts.append(f"""
+            SELECT telegram_user_id, username, first_name, last_name, visit_count, last_visit, phone_action_at
+            FROM user_visits_daily
+            WHERE {' AND '.join(conditions)}
+        """)
+        params += values
+
+    raw_start = max(filter(None, [watermark, range_start]), default=None)
+    conditions, values = list(user_conditions), list(user_values)
+    if raw_start:
+        conditions.append("visited_at >= ?")
+        values.append(raw_start)
+    if range_end:
+        conditions.append("visited_at < ?")
+        values.append(range_end)
+    if not raw_start and not range_end:
+        conditions.append("visited_at IS NOT NULL")
+    # После границы свёртки сырых строк немного (текущий день): ищем их по visited_at и досортировываем,
+    # а не обходим индекс по пользователю через всю историю ради порядка telegram_user_id
+    index_hint = "INDEXED BY idx_user_visits_visited_at" if raw_start else ""
+    parts.append(f"""
+        SELECT telegram_user_id, username, first_name, last_name, 1 AS visit_count, visited_at AS last_visit,
+               CASE WHEN action_details = ? THEN visited_at END AS phone_action_at
+        FROM user_visits {index_hint}
+        WHERE {' AND '.join(conditions)}
+    """)
+    params += [PHONE_ACTION_DETAILS] + values
 
+    return " UNION ALL ".join(parts), params
+
+
+def _iter_user_stats(cursor, sources, min_visits=1, descending=False):
+    """
+    Сводит посещения по пользователям, читая подзапросы из _daily_visits_source в порядке telegram_user_id.
+    - Строки читаются с курсора потоково и группируются на лету: в памяти только текущий пользователь.
+    - Имя и username берутся из последнего по времени посещения.
+    Генератор словарей в порядке сортировки запроса (по убыванию ID при descending=True).
+    """
+    sql = " UNION ALL ".join(source for source, _ in sources)
+    params = [value for _, source_params in sources for value in source_params]
+    cursor.execute(f"{sql} ORDER BY telegram_user_id {'DESC' if descending else 'ASC'};", params)
+
+    for user_id, rows in groupby(cursor, key=itemgetter(0)):
+        user = None
+        for row in rows:
+            if user is None:
+                user = {
+                    "telegram_user_id": user_id, "username": row[1], "first_name": row[2], "last_name": row[3],
+                    "visit_count": 0, "visited_at": row[5], "phone_action_at": None
+                }
+            elif row[5] and (user["visited_at"] is None or row[5] > user["visited_at"]):
+                user.update(username=row[1], first_name=row[2], last_name=row[3], visited_at=row[5])
+            user["visit_count"] += row[4]
+            if row[6] and (user["phone_action_at"] is None or row[6] > user["phone_action_at"]):
+                user["phone_action_at"] = row[6]
+
+        if user["visit_count"] >= min_visits:
+            yield user
+
+
+def _fetch_user_stats(cursor, sources, min_visits=1, descending=False, limit=None):
+    """
+    Страница сводки _iter_user_stats: при заданном limit чтение прекращается сразу после заполнения
+    страницы — остальные пользователи не загружаются.
+    Возвращает список словарей, всегда отсортированный по возрастанию telegram_user_id.
+    """
+    users = list(islice(_iter_user_stats(cursor, sources, min_visits, descending), limit))
+    if descending:
+        users.reverse()
+    return users
 
 
 # Вспомогательная функция для получения записей из базы данных
 # Реализуем ее в файле db.py
 def get_records_from_today():
-    """Получает записи с текущей даты и времени."""
+    """Получает записи, которые начинаются не раньше текущего момента."""
 
-    conn = sqlite3.connect('appointments.db')
-    cursor = conn.cursor()
-
-    # Получаем текущую дату и время
-    current_datetime = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-
-    # Выполняем запрос к базе данных
-    cursor.execute("""
-        SELECT id, telegram_user_id, username, first_name, last_name, phone_number,
-               appointment_date, appointment_time, comments, status
-        FROM records
-        WHERE datetime(appointment_date || ' ' || appointment_time) >= datetime(?)
-        ORDER BY appointment_date, appointment_time ASC;
-    """, (current_datetime,))
+    with db_cursor() as cursor:
+        # Диапазон по индексу idx_records_appointment_at, сортировка берётся из него же
+        cursor.execute("""
+            SELECT id, telegram_user_id, username, first_name, last_name, phone_number,
+                   appointment_at, comments, status
+            FROM records
+            WHERE appointment_at >= ?
+            ORDER BY appointment_at ASC;
+        """, (clock.now(),))
 
-    rows = cursor.fetchall()
-    conn.close()
+        rows = cursor.fetchall()
 
     # Преобразуем результаты в удобный формат
     return [
@@ -360,52 +747,140 @@ def get_records_from_today():
             "first_name": row[3],
             "last_name": row[4],
             "phone_number": row[5],
-            "appointment_date": row[6],
-            "appointment_time": row[7],
-            "comments": row[8],
-            "status": row[9]
+            "appointment_at": row[6],
+            "comments": row[7],
+            "status": row[8]
         }
         for row in rows
     ]
 
 
+def get_upcoming_appointments(since):
+    """
+    Возвращает подтверждённые записи (статус 'Записан'), начинающиеся не раньше since (секунды Unix),
+    в виде (id, telegram_user_id, appointment_at). Используется для загрузки напоминаний при старте.
+    """
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT id, telegram_user_id, appointment_at
+            FROM records
+            WHERE appointment_at >= ? AND status = 'Записан'
+            ORDER BY appointment_at ASC;
+        """, (since,))
+        return cursor.fetchall()
 
 
+def get_upcoming_reminders(since):
+    """
+    Как get_upcoming_appointments, но с четвёртым полем reminded_offset: за сколько минут до приёма
+    ушло последнее доставленное напоминание (None — ещё ни одного). Используется ReminderScheduler.load.
+    """
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT id, telegram_user_id, appointment_at, reminded_offset
+            FROM records
+            WHERE appointment_at >= ? AND status = 'Записан'
+            ORDER BY appointment_at ASC;
+        """, (since,))
+        return cursor.fetchall()
 
 
-def get_users_by_date_range(start_date, end_date, unique=False, repeat=False, inactive=False):
-    """Получает пользователей по диапазону дат с опциональной фильтрацией."""
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
+def mark_reminder_sent(record_id, appointment_at, minutes):
+    """
+    Отмечает доставленное напоминание за minutes минут до приёма.
+    Отметка не ставится, если приём уже перенесён на другое время, и не откатывается к более раннему напоминанию.
+    """
+    with db_cursor(write=True) as cursor:
+        cursor.execute("""
+            UPDATE records SET reminded_offset = ?
+            WHERE id = ? AND appointment_at = ?
+              AND (reminded_offset IS NULL OR reminded_offset > ?);
+        """, (minutes, record_id, appointment_at, minutes))
 
-    base_query = """
-        SELECT telegram_user_id, username, first_name, last_name, visit_date
-        FROM user_visits
-        WHERE DATE(visit_date) BETWEEN ? AND ?
-    """
-
-    if unique:
-        # Уникальные пользователи
-        query = f"{base_query} GROUP BY telegram_user_id"
-    elif repeat:
-        # Повторные посещения
-        query = f"""
-            SELECT telegram_user_id, username, first_name, last_name, MAX(visit_date) as last_visit, COUNT(*)
-            FROM user_visits
-            WHERE DATE(visit_date) BETWEEN ? AND ?
-            GROUP BY telegram_user_id
-            HAVING COUNT(*) > 1
-        """
-    elif inactive:
-        # Неактивные пользователи (не заходили более 30 дней)
-        query = f"{base_query} AND DATE(visit_date) < DATE('now', '-30 days')"
-    else:
-        # Все пользователи
-        query = base_query
 
-    cursor.execute(query, (start_date, end_date))
-    result = cursor.fetchall()
-    conn.close()
+def get_records_page(window_start, window_end, after=None, before=None, limit=None):
+    """
+    Возвращает записи с началом приёма в окне [window_start, window_end) (секунды Unix) постранично.
+    - Ключ страницы — пара (appointment_at, id): after — записи после неё, before — ближайшие записи перед ней.
+    - Запрос — диапазон по индексу idx_records_appointment_at (id входит в индекс как rowid).
+    Результат всегда отсортирован по возрастанию начала приёма.
+    """
+    # Ключ страницы сужает сам диапазон поиска по индексу, сравнение пар уточняет только совпадения по времени
+    conditions = ["appointment_at >= ?", "appointment_at < ?"]
+    params = [max(window_start, after[0]) if after else window_start, window_end]
+    if after:
+        conditions.append("(appointment_at, id) > (?, ?)")
+        params += list(after)
+    if before:
+        conditions += ["appointment_at <= ?", "(appointment_at, id) < (?, ?)"]
+        params += [before[0]] + list(before)
+    order = "DESC" if before else "ASC"
+
+    with db_cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id, telegram_user_id, username, first_name, last_name, phone_number,
+                   appointment_at, comments, status
+            FROM records
+            WHERE {' AND '.join(conditions)}
+            ORDER BY appointment_at {order}, id {order}
+            {'LIMIT ?' if limit else ''};
+        """, params + ([limit] if limit else []))
+        rows = cursor.fetchall()
+
+    if before:
+        rows.reverse()
+
+    return [
+        {
+            "id": row[0],
+            "telegram_user_id": row[1],
+            "username": row[2],
+            "first_name": row[3],
+            "last_name": row[4],
+            "phone_number": row[5],
+            "appointment_at": row[6],
+            "comments": row[7],
+            "status": row[8]
+        }
+        for row in rows
+    ]
+
+
+
+def get_users_by_date_range(start_date, end_date, unique=False, repeat=False, inactive=False,
+                            after_user_id=None, before_user_id=None, limit=None):
+    """
+    Получает пользователей по диапазону дат с опциональной фильтрацией.
+    Для unique и repeat поддерживается постраничная выборка (after_user_id, before_user_id, limit — как у get_repeat_visits).
+    """
+    range_start, range_end = get_day_bounds(start_date, end_date)
+    params = (range_start, range_end)
+
+    if unique or repeat:
+        # Уникальные пользователи и повторные посещения считаются по дневной свёртке
+        with db_cursor() as cursor:
+            source = _daily_visits_source(cursor, range_start, range_end, after_user_id, before_user_id)
+            users = _fetch_user_stats(
+                cursor, [source], min_visits=2 if repeat else 1,
+                descending=before_user_id is not None, limit=limit
+            )
+        result = [
+            (user["telegram_user_id"], user["username"], user["first_name"], user["last_name"], user["visited_at"])
+            for user in users
+        ]
+    else:
+        condition = "visited_at >= ? AND visited_at < ?"
+        if inactive:
+            # Неактивные пользователи (не заходили более 30 дней, граница — начало местного дня)
+            condition += " AND visited_at < ?"
+            params += (clock.day_start(clock.today() - timedelta(days=30)),)
+
+        # Без фильтров — все посещения за период; завершённые месяцы читаются из своих архивов
+        rows = _select_visits(
+            "id, telegram_user_id, username, first_name, last_name, visited_at",
+            condition, params, range_start, range_end
+        )
+        result = [row[1:] for row in rows]
 
     # Преобразуем результат в читаемый формат
     return [
@@ -414,13 +889,115 @@ def get_users_by_date_range(start_date, end_date, unique=False, repeat=False, in
             "username": row[1],
             "first_name": row[2],
             "last_name": row[3],
-            "visit_date": row[4]
+            "visited_at": row[4]
         }
         for row in result
     ]
 
 
 
+# ===== Потоковая выгрузка =====
+# Генераторы для выгрузки в файл: строки читаются с курсора по одной, без fetchall,
+# поэтому память не зависит от объёма выборки. Курсор открыт, пока генератор не исчерпан или не закрыт.
+def iter_unique_users(start_date, end_date):
+    """Все уникальные пользователи за период (как get_users_by_date_range(..., unique=True)) по возрастанию ID."""
+    range_start, range_end = get_day_bounds(start_date, end_date)
+    with db_cursor() as cursor:
+        yield from _iter_user_stats(cursor, [_daily_visits_source(cursor, range_start, range_end)])
+
+
+def iter_repeat_visits():
+    """Все пользователи с повторной активностью (как get_repeat_visits) по возрастанию ID."""
+    with db_cursor() as cursor:
+        yield from _iter_user_stats(cursor, [_daily_visits_source(cursor)], min_visits=2)
+
+
+def iter_inactive_users(start_date, end_date):
+    """Все неактивные за период пользователи (как get_inactive_users) по возрастанию ID."""
+    range_start, range_end = get_day_bounds(start_date, end_date)
+    with db_cursor() as cursor:
+        sources = [
+            _daily_visits_source(cursor, range_end=range_start),
+            _daily_visits_source(cursor, range_start=range_end),
+        ]
+        yield from _iter_user_stats(cursor, sources)
+
+
+def iter_records(window_start, window_end):
+    """Все записи с началом приёма в окне [window_start, window_end) по возрастанию времени (как get_records_page)."""
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT id, telegram_user_id, username, first_name, last_name, phone_number,
+                   appointment_at, comments, status
+            FROM records
+            WHERE appointment_at >= ? AND appointment_at < ?
+            ORDER BY appointment_at ASC, id ASC;
+        """, (window_start, window_end))
+
+        for row in cursor:
+            yield {
+                "id": row[0],
+                "telegram_user_id": row[1],
+                "username": row[2],
+                "first_name": row[3],
+                "last_name": row[4],
+                "phone_number": row[5],
+                "appointment_at": row[6],
+                "comments": row[7],
+                "status": row[8]
+            }
+
+
+# ===== Состояние диалогов по чатам =====
+def save_chat_state(chat_id, state, expires_at):
+    """Сохраняет состояние диалога чата (JSON) и время его истечения (Unix time)."""
+    with db_cursor(write=True) as cursor:
+        cursor.execute("""
+            INSERT INTO chat_state (chat_id, state, expires_at)
+            VALUES (?, ?, ?)
+            ON CONFLICT(chat_id) DO UPDATE SET state = excluded.state, expires_at = excluded.expires_at;
+        """, (chat_id, state, expires_at))
+
+
+def load_chat_state(chat_id, now):
+    """Возвращает сохранённое состояние диалога чата и время истечения, если оно ещё не истекло."""
+    with db_cursor() as cursor:
+        cursor.execute("""
+            SELECT state, expires_at FROM chat_state
+            WHERE chat_id = ? AND expires_at > ?;
+        """, (chat_id, now))
+        result = cursor.fetchone()
+    return result
+
+
+def delete_chat_state(chat_id):
+    """Удаляет состояние диалога чата."""
+    with db_cursor(write=True) as cursor:
+        cursor.execute("DELETE FROM chat_state WHERE chat_id = ?;", (chat_id,))
+
+
+def purge_chat_states(now):
+    """Удаляет истёкшие состояния диалогов, возвращает количество удалённых."""
+    with db_cursor(write=True) as cursor:
+        cursor.execute("DELETE FROM chat_state WHERE expires_at <= ?;", (now,))
+        return cursor.rowcount
+
+
+# Время и ошибки каждой функции доступа к базе (bot_db_seconds{function=...}).
+# Оборачивается при импорте модуля, до того как обработчики выполнят from db import ...
+metrics.instrument_module(
+    sys.modules[__name__], "bot_db_seconds", "bot_db_errors_total", "Время запроса к базе",
+    exclude={"get_connection", "db_cursor", "close_connections", "get_appointment_at", "get_day_bounds"},
+)
+
+
 # ===== Инициализация базы данных =====
 if __name__ == "__main__":
     create_tables()
+    if "backfill-rollup" in sys.argv:
+        # python db.py backfill-rollup — пересобрать дневную свёртку по всей истории
+        print(f"Свёртка user_visits пересобрана до {rebuild_user_visits_rollup()}")
+    if "rotate-visits" in sys.argv:
+        # python db.py rotate-visits — перенести завершённые месяцы user_visits в архивные файлы
+        months = [clock.format_local(month, '%m.%Y') for month in rotate_user_visits()]
+        print(f"Перенесено в архив: {', '.join(months) or 'нечего переносить'}")
@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import deque
+
+
+def get_chat_key(update):
+    """
+    Возвращает ключ упорядочивания обновления — ID чата, к которому оно относится.
+    Обновления без чата (например, inline-запросы) упорядочиваются по пользователю,
+    а если нет и его — обрабатываются независимо по update_id.
+    """
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        message = getattr(update, name, None)
+        if message is not None:
+            return message.chat.id
+
+    callback_query = getattr(update, "callback_query", None)
+    if callback_query is not None:
+        if callback_query.message is not None:
+            return callback_query.message.chat.id
+        return callback_query.from_user.id
+
+    for name in ("inline_query", "chosen_inline_result", "shipping_query", "pre_checkout_query"):
+        query = getattr(update, name, None)
+        if query is not None:
+            return query.from_user.id
+
+    return ("update", update.update_id)
+
+
+class ChatDispatcher:
+    """
+    Параллельная обработка обновлений с сохранением порядка внутри чата.
+    - У каждого чата своя ограниченная очередь; чат в любой момент обрабатывается не более чем одним потоком,
+      поэтому шаги одного диалога (дата → время → комментарий) не обгоняют друг друга.
+    - Разные чаты обрабатываются пулом потоков параллельно.
+    - Общее число ожидающих обновлений тоже ограничено, чтобы всплеск не исчерпал память.
+    - В stats копятся счётчики и пиковые глубины очередей, текущие глубины — в depth().
+    """
+    def __init__(self, process, workers=8, chat_queue_size=100, max_pending=10000):
+        self.process = process  # Вызывается как process([update]), например bot.process_new_updates
+        self.workers = workers
+        self.chat_queue_size = chat_queue_size
+        self.max_pending = max_pending
+        self.stats = {
+            "submitted": 0, "processed": 0, "failed": 0, "rejected": 0,
+            "max_pending": 0, "max_chat_depth": 0
+        }
+        self._chats = {}  # Ключ чата -> очередь его обновлений; чат есть в словаре, пока у него есть работа
+        self._ready = deque()  # Чаты с обновлениями, которые сейчас никем не обрабатываются
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._threads = []
+
+    def start(self):
+        """Запускает пул рабочих потоков (повторный вызов ничего не делает)."""
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"dispatcher-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=10):
+        """Дожидается обработки уже принятых обновлений и завершает рабочие потоки."""
+        self.join(timeout)
+        with self._cond:
+            self._stopping = True
+            threads, self._threads = self._threads, []
+            self._cond.notify_all()
+        for thread in threads:
+            thread.join(timeout)
+
+    def join(self, timeout=None):
+        """Блокирует вызывающий поток, пока все принятые обновления не будут обработаны."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def depth(self):
+        """Текущая нагрузка: всего ожидающих обновлений, чатов с работой и глубина самой длинной очереди."""
+        with self._cond:
+            return {
+                "pending": self._pending,
+                "chats": len(self._chats),
+                "max_chat_depth": max((len(q) for q in self._chats.values()), default=0)
+            }
+
+    def submit(self, update, block=True, timeout=None):
+        """
+        Ставит обновление в очередь его чата.
+        - block=True: при заполненной очереди ждёт освобождения места (естественное торможение long polling).
+        - block=False или истёк timeout: возвращает False, обновление не принято (webhook отвечает 503).
+        """
+        key = get_chat_key(update)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._is_full(key):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not block or (remaining is not None and remaining <= 0):
+                    self.stats["rejected"] += 1
+                    return False
+                self._cond.wait(remaining)
+
+            chat_queue = self._chats.get(key)
+            if chat_queue is None:
+                chat_queue = self._chats[key] = deque()
+                self._ready.append(key)
+            chat_queue.append(update)
+            self._pending += 1
+
+            self.stats["submitted"] += 1
+            self.stats["max_pending"] = max(self.stats["max_pending"], self._pending)
+            self.stats["max_chat_depth"] = max(self.stats["max_chat_depth"], len(chat_queue))
+            self._cond.notify_all()
+        return True
+
+    def _is_full(self, key):
+        chat_queue = self._chats.get(key)
+        return (
+            self._pending >= self.max_pending
+            or (chat_queue is not None and len(chat_queue) >= self.chat_queue_size)
+        )
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._ready and not self._stopping:
+                    self._cond.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                update = self._chats[key].popleft()
+
+            try:
+                self.process([update])
+                failed = False
+            except Exception as e:
+                failed = True
+                logging.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+
+            with self._cond:
+                self._pending -= 1
+                self.stats["failed" if failed else "processed"] += 1
+                # Следующее обновление чата берём только после завершения текущего
+                if self._chats[key]:
+                    self._ready.append(key)
+                else:
+                    del self._chats[key]
+                self._cond.notify_all()
+
+
+def run_polling(bot, dispatcher, timeout=20, retry_delay=3):
+    """
+    Long polling через диспетчер: обновления забираются getUpdates и раскладываются по очередям чатов.
+    Если очереди заполнены, submit блокирует цикл, и новые обновления не запрашиваются,
+    пока обработчики не разгрузятся — Telegram сам держит их у себя.
+    """
+    offset = None
+    while True:
+        try:
+            updates = bot.get_updates(offset=offset, timeout=timeout, long_polling_timeout=timeout)
+        except Exception as e:
+            logging.error(f"Ошибка при получении обновлений: {e}")
+            time.sleep(retry_delay)
+            continue
+
+        for update in updates:
+            dispatcher.submit(update)
+            offset = update.update_id + 1
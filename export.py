@@ -0,0 +1,136 @@
+"""
+Выгрузка таблиц (статистика, записи) в CSV или XLSX и отправка файлом через send_document.
+
+Строки приходят генератором (db.iter_*) и пишутся в файл по одной, а файл — SpooledTemporaryFile:
+небольшие выгрузки остаются в памяти, крупные после EXPORT_SPOOL_MAX_SIZE переносятся на диск.
+Поэтому расход памяти не зависит от количества строк.
+
+XLSX пишется без сторонних библиотек: это zip-архив из нескольких XML-файлов, а лист
+потоково записывается в архив строка за строкой (строки ячеек хранятся прямо в листе — inlineStr).
+"""
+import csv
+import io
+import re
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+import config
+
+FORMATS = ("csv", "xlsx")
+
+# Символы, недопустимые в XML 1.0 (могут встретиться в именах пользователей Telegram)
+_XML_INVALID = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_XLSX_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_XLSX_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_XLSX_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_XLSX_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_XLSX_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_XLSX_SHEET_END = '</sheetData></worksheet>'
+
+
+def write_csv(file, header, rows):
+    """Пишет CSV (UTF-8 с BOM, чтобы Excel сразу распознал кириллицу) в двоичный файл. Возвращает число строк."""
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    writer = csv.writer(text)
+    writer.writerow(header)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    text.flush()
+    text.detach()  # Файл остаётся открытым для отправки
+    return count
+
+
+def _xlsx_cell(value):
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_XML_INVALID.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def write_xlsx(file, header, rows, sheet_name="Данные"):
+    """Пишет книгу XLSX с одним листом в двоичный файл. Возвращает число строк (без заголовка)."""
+    count = 0
+    with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", _XLSX_CONTENT_TYPES)
+        archive.writestr("_rels/.rels", _XLSX_ROOT_RELS)
+        archive.writestr("xl/workbook.xml", _XLSX_WORKBOOK.format(name=escape(sheet_name, {'"': "&quot;"})))
+        archive.writestr("xl/_rels/workbook.xml.rels", _XLSX_WORKBOOK_RELS)
+        with archive.open("xl/worksheets/sheet1.xml", "w") as sheet:
+            sheet.write(_XLSX_SHEET_START.encode())
+            sheet.write(f"<row>{''.join(_xlsx_cell(value) for value in header)}</row>".encode())
+            for row in rows:
+                sheet.write(f"<row>{''.join(_xlsx_cell(value) for value in row)}</row>".encode())
+                count += 1
+            sheet.write(_XLSX_SHEET_END.encode())
+    return count
+
+
+WRITERS = {"csv": write_csv, "xlsx": write_xlsx}
+
+
+def build_export(fmt, header, rows):
+    """
+    Записывает таблицу во временный файл в формате fmt ('csv' или 'xlsx').
+    Возвращает (файл, число строк); файл перемотан в начало, закрывает его вызывающий.
+    """
+    file = tempfile.SpooledTemporaryFile(max_size=config.EXPORT_SPOOL_MAX_SIZE)
+    try:
+        count = WRITERS[fmt](file, header, rows)
+        file.seek(0)
+    except BaseException:
+        file.close()
+        raise
+    return file, count
+
+
+def send_export(bot, chat_id, filename, fmt, header, rows, caption=None):
+    """
+    Собирает файл <filename>.<fmt> из строк rows и отправляет его документом.
+    Пустая выборка не отправляется. Возвращает число выгруженных строк.
+    """
+    file, count = build_export(fmt, header, rows)
+    with file:
+        if count:
+            bot.send_document(
+                chat_id, file, visible_file_name=f"{filename}.{fmt}",
+                caption=caption and f"{caption} — строк: {count}"
+            )
+    return count
@@ -0,0 +1,57 @@
+import asyncio
+import logging
+import sqlite3
+from handlers.UserRequestHandler import UserRequestHandler, SAVE_ERROR_TEXT, CONTACT_THANKS_TEXT
+from handlers.ScreenCache import get_screen
+from async_runtime import run_db
+from db import save_appointment, save_message_id_to_db
+
+
+class AsyncUserRequestHandler(UserRequestHandler):
+    """
+    Запрос свободных окон и приём контакта для асинхронного режима (bot_async.py).
+    bot — AsyncRateLimitedBot, обращения к базе выполняются в пуле потоков через run_db.
+    Тексты, клавиатуры и аргументы заявки общие с UserRequestHandler.
+    """
+    async def start_request(self, message):
+        """Показывает ближайшие свободные окна и запрашивает у пользователя номер телефона для связи."""
+        screen = get_screen("contact_request")
+        await screen.send(self.bot, message.chat.id, text=self.free_slots_text() + screen.text)
+
+    async def handle_contact(self, message):
+        """Обрабатывает контакт, отправленный пользователем; порядок шагов — как у UserRequestHandler.handle_contact."""
+        if not message.contact:
+            return
+
+        chat_id = message.chat.id
+        calls = [self.bot.submit("delete_message", chat_id, message.message_id)]
+        try:
+            appointment = self.contact_appointment(message)
+            try:
+                record_id = await run_db(save_appointment, **appointment)
+            except sqlite3.Error as e:
+                logging.error(f"Не удалось сохранить заявку пользователя {appointment['user_id']}: {e}")
+                await self.bot.send_message(chat_id, SAVE_ERROR_TEXT)
+                return
+
+            calls.append(self.bot.submit("send_message", chat_id, CONTACT_THANKS_TEXT, parse_mode="HTML"))
+            calls.append(get_screen("menu_buttons", chat_id).submit(self.bot, chat_id))
+
+            admin_message, markup = self.admin_notification(message, record_id, appointment)
+            sent_message = await self.bot.send_message(
+                self.admin_chat_id, admin_message, reply_markup=markup, parse_mode="HTML"
+            )
+            await run_db(save_message_id_to_db, record_id, sent_message.message_id)
+        finally:
+            errors = await wait_calls(calls)
+        if errors:
+            raise errors[0]
+
+
+async def wait_calls(tasks):
+    """Дожидается всех задач bot.submit и возвращает их ошибки, записав каждую в лог (как wait_calls в UserRequestHandler.py)."""
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [result for result in results if isinstance(result, BaseException)]
+    for error in errors:
+        logging.error(f"Ошибка вызова Bot API: {error!r}")
+    return errors
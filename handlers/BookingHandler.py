@@ -1,111 +1,133 @@
 from telebot import types
 from datetime import datetime
-from db import save_appointment, update_appointment, get_user_data_by_record_id
-from config import id_chat_owner
+import clock
+from db import get_user_data_by_record_id, get_appointment_at
+from state import chat_states
+from availability import availability
 
 
 class BookingHandler:
+    """
+    Запись клиента администратором по шагам: дата → время → комментарий → подтверждение.
+    Данные сессии (ID заявки, выбранные дата и время, комментарий, ID последнего вопроса, текущий шаг)
+    хранятся в chat_states по чату администратора, поэтому несколько сессий могут идти одновременно.
+    """
     def __init__(self, bot, start_handler):
         self.bot = bot
         self.start_handler = start_handler  # Сохраняем ссылку на start_handler
-        self.selected_date = None
-        self.selected_time = None
-        self.comments = None
-
-    def start_admin_booking(self, call, record_id):
-        """Начинает процесс записи администратора для клиента."""
-        self.current_record_id = record_id  # Сохраняем текущий ID записи
-
-        # Отправляем вопрос и сохраняем ID сообщения
+        # Шаг диалога -> обработчик ответа на этом шаге
+        self.steps = {
+            "admin_date": self.process_admin_date,
+            "admin_time": self.process_admin_time,
+            "admin_comment": self.process_admin_comment,
+        }
+
+    def has_step(self, chat_id):
+        """Проверяет, ждёт ли бот от чата ответа на шаге записи."""
+        return chat_states.get(chat_id, "step") in self.steps
+
+    def process_step(self, message):
+        """Передаёт сообщение обработчику текущего шага записи."""
+        self.steps[chat_states.get(message.chat.id, "step")](message)
+
+    def get_booking(self, chat_id):
+        """
+        Возвращает данные сессии записи чата: record_id, selected_date (date), selected_time, comments.
+        Если сессии нет или она истекла, возвращает None.
+        """
+        booking = chat_states.get(chat_id)
+        if "record_id" not in booking or "selected_date" not in booking:
+            return None
+        booking["selected_date"] = datetime.strptime(booking["selected_date"], '%Y-%m-%d').date()
+        return booking
+
+    def finish_booking(self, chat_id):
+        """Завершает сессию записи чата."""
+        chat_states.clear(chat_id)
+
+    def ask(self, chat_id, text, step):
+        """Задаёт вопрос шага и запоминает его ID, чтобы удалить вместе с ответом."""
         bot_message = self.bot.send_message(
-            call.message.chat.id,
-            "📅 Укажите дату (ДД.ММ.ГГ):",
+            chat_id,
+            text,
             reply_markup=types.ForceReply(selective=True)  # ForceReply для скрытия текста
         )
-        self.last_bot_message_id = bot_message.message_id  # Сохраняем ID сообщения
-        self.bot.register_next_step_handler(bot_message, self.process_admin_date)
+        chat_states.update(chat_id, step=step, last_bot_message_id=bot_message.message_id)
+
+    def delete_question_and_answer(self, message):
+        """Удаляет ответ администратора и предыдущий вопрос бота."""
+        self.bot.delete_message(message.chat.id, message.message_id)
+        last_bot_message_id = chat_states.get(message.chat.id, "last_bot_message_id")
+        if last_bot_message_id:
+            self.bot.delete_message(message.chat.id, last_bot_message_id)
+
+    def start_admin_booking(self, call, record_id):
+        """Начинает процесс записи администратора для клиента."""
+        chat_id = call.message.chat.id
+        # Новая сессия записи заменяет незавершённую
+        chat_states.clear(chat_id)
+        chat_states.update(chat_id, record_id=record_id)  # Сохраняем текущий ID записи
+        self.ask(chat_id, "📅 Укажите дату (ДД.ММ.ГГ):", "admin_date")
 
     def process_admin_date(self, message):
         """Обрабатывает ввод даты администратором."""
         try:
-            self.selected_date = datetime.strptime(message.text, '%d.%m.%y').date()
-            if self.selected_date < datetime.today().date():
+            selected_date = datetime.strptime(message.text or "", '%d.%m.%y').date()
+            if selected_date < clock.today():
                 raise ValueError("Дата не может быть в прошлом.")
 
             # Удаляем предыдущее сообщение (вопрос и ответ)
-            self.bot.delete_message(message.chat.id, message.message_id)
-            if hasattr(self, 'last_bot_message_id') and self.last_bot_message_id:
-                self.bot.delete_message(message.chat.id, self.last_bot_message_id)
+            self.delete_question_and_answer(message)
+            chat_states.update(message.chat.id, selected_date=selected_date.isoformat())
 
             # Задаем новый вопрос
-            bot_message = self.bot.send_message(
-                message.chat.id,
-                "⏰ Укажите время (ЧЧ:ММ):",
-                reply_markup=types.ForceReply(selective=True)
-            )
-            self.last_bot_message_id = bot_message.message_id  # Сохраняем ID сообщения
-            self.bot.register_next_step_handler(bot_message, self.process_admin_time)
+            self.ask(message.chat.id, "⏰ Укажите время (ЧЧ:ММ):", "admin_time")
         except ValueError:
             # Удаляем сообщение с ошибкой, если оно было
-            self.bot.delete_message(message.chat.id, message.message_id)
-            if hasattr(self, 'last_bot_message_id') and self.last_bot_message_id:
-                self.bot.delete_message(message.chat.id, self.last_bot_message_id)
-
-            bot_message = self.bot.send_message(
-                message.chat.id,
-                "❌ Неверный формат даты. Введите дату (ДД.ММ.ГГ):",
-                reply_markup=types.ForceReply(selective=True)
-            )
-            self.last_bot_message_id = bot_message.message_id
-            self.bot.register_next_step_handler(bot_message, self.process_admin_date)
+            self.delete_question_and_answer(message)
+            self.ask(message.chat.id, "❌ Неверный формат даты. Введите дату (ДД.ММ.ГГ):", "admin_date")
 
     def process_admin_time(self, message):
         """Обрабатывает ввод времени администратором."""
         try:
-            self.selected_time = message.text
             # Преобразуем введённое время в формат ЧЧ:ММ
-            self.selected_time = datetime.strptime(self.selected_time, '%H:%M').strftime('%H:%M')
+            selected_time = datetime.strptime(message.text or "", '%H:%M').strftime('%H:%M')
 
             # Удаляем предыдущее сообщение (вопрос и ответ)
-            self.bot.delete_message(message.chat.id, message.message_id)
-            if hasattr(self, 'last_bot_message_id') and self.last_bot_message_id:
-                self.bot.delete_message(message.chat.id, self.last_bot_message_id)
+            self.delete_question_and_answer(message)
+
+            # Не допускаем двух записей на одно время
+            booking = chat_states.get(message.chat.id)
+            appointment_at = get_appointment_at(booking['selected_date'], selected_time)
+            if availability.conflicts(appointment_at, ignore_record_id=booking["record_id"]):
+                self.ask(
+                    message.chat.id,
+                    "⛔ Это время уже занято другой записью. Введите другое время (ЧЧ:ММ):",
+                    "admin_time"
+                )
+                return
+
+            chat_states.update(message.chat.id, selected_time=selected_time)
 
             # Задаем новый вопрос
-            bot_message = self.bot.send_message(
-                message.chat.id,
-                "💬 Укажите комментарий:",
-                reply_markup=types.ForceReply(selective=True)
-            )
-            self.last_bot_message_id = bot_message.message_id  # Сохраняем ID сообщения
-            self.bot.register_next_step_handler(bot_message, self.process_admin_comment)
+            self.ask(message.chat.id, "💬 Укажите комментарий:", "admin_comment")
         except ValueError:
             # Удаляем сообщение с ошибкой
-            self.bot.delete_message(message.chat.id, message.message_id)
-            if hasattr(self, 'last_bot_message_id') and self.last_bot_message_id:
-                self.bot.delete_message(message.chat.id, self.last_bot_message_id)
-
-            bot_message = self.bot.send_message(
-                message.chat.id,
-                "❌ Неверный формат времени. Введите время (ЧЧ:ММ):",
-                reply_markup=types.ForceReply(selective=True)
-            )
-            self.last_bot_message_id = bot_message.message_id
-            self.bot.register_next_step_handler(bot_message, self.process_admin_time)
+            self.delete_question_and_answer(message)
+            self.ask(message.chat.id, "❌ Неверный формат времени. Введите время (ЧЧ:ММ):", "admin_time")
 
     def process_admin_comment(self, message):
         """Обрабатывает ввод комментария администратором."""
-        self.comments = message.text
-
-        # Удаляем предыдущее сообщение (вопрос и ответ)
-        self.bot.delete_message(message.chat.id, message.message_id)
-        if hasattr(self, 'last_bot_message_id') and self.last_bot_message_id:
-            self.bot.delete_message(message.chat.id, self.last_bot_message_id)
+        # Удаляем предыдущее сообщение (вопрос и ответ); шаги закончились, дальше ждём кнопку подтверждения
+        self.delete_question_and_answer(message)
+        chat_states.update(message.chat.id, comments=message.text, step=None, last_bot_message_id=None)
+        booking = self.get_booking(message.chat.id)
 
         # Получаем данные пользователя из базы
-        user_data = get_user_data_by_record_id(self.current_record_id)
+        user_data = get_user_data_by_record_id(booking["record_id"])
 
         if not user_data:
+            self.finish_booking(message.chat.id)
             self.bot.send_message(
                 message.chat.id,
                 "❌ Ошибка: Данные пользователя не найдены."
@@ -114,15 +136,15 @@ class BookingHandler:
 
         # Отправляем сообщение с подтверждением
         confirmation_message = (
-            f"📩 Запрос на запись (Заявка №{self.current_record_id}):\n\n"
+            f"📩 Запрос на запись (Заявка №{booking['record_id']}):\n\n"
             f"👤 Имя: {user_data['first_name'] or 'Не указано'} {user_data['last_name'] or ''}\n"
             f"📱 Телефон: {user_data['phone_number'] or 'Не указан'}\n"
             f"📧 Username: @{user_data['username'] or 'Не указан'}\n"
             f"🆔 ID клиента: <code>{user_data['telegram_user_id']}</code>\n\n"
             f"Данные для записи:\n"
-            f"📅 Дата: {self.selected_date.strftime('%d.%m.%y')}\n"
-            f"⏰ Время: {self.selected_time}\n"
-            f"💬 Комментарий: {self.comments}\n\n"
+            f"📅 Дата: {booking['selected_date'].strftime('%d.%m.%y')}\n"
+            f"⏰ Время: {booking['selected_time']}\n"
+            f"💬 Комментарий: {booking.get('comments')}\n\n"
             "✅ Нажмите 'Подтвердить', чтобы сохранить запись, или '❌ Отменить', чтобы отказаться."
         )
 
@@ -134,12 +156,9 @@ class BookingHandler:
         )
 
         # Отправляем сообщение с кнопками
-        sent_message = self.bot.send_message(
+        self.bot.send_message(
             message.chat.id,
             confirmation_message,
             reply_markup=markup,
             parse_mode="HTML"  # Указываем HTML для обработки тега <code>
         )
-
-        self.last_bot_message_id = sent_message.message_id  # Сохраняем ID сообщения
-
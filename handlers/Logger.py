@@ -1,10 +1,145 @@
-from db import log_user_action
+import atexit
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+import time
+import clock
+from db import log_user_actions, rollup_user_visits_on_new_day
 from config import id_chat_owner
 
 
+class ActionLogWriter:
+    """
+    Фоновая запись действий пользователей (write-behind).
+    - Обработчик только кладёт событие в ограниченную очередь и сразу продолжает работу.
+    - Фоновый поток сбрасывает события в базу пачками: по размеру пачки или по истечении интервала.
+    - При переполнении очереди событие отбрасывается и учитывается в счётчике dropped.
+    - Если запись пачки не удалась (например, база занята), пачка повторяется позже и учитывается в delayed.
+    - Любая другая ошибка записи не останавливает поток: пачка логируется и учитывается в dropped.
+    - Дневная свёртка запускается после успешной записи пачки и не входит в её повторы:
+      сбой свёртки не приводит к повторной вставке уже записанных действий.
+    """
+    def __init__(self, max_queue_size=10000, batch_size=200, flush_interval=1.0, max_retries=5):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stats = {"enqueued": 0, "written": 0, "dropped": 0, "delayed": 0}
+        self._stats_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Запускает фоновый поток записи (повторный вызов ничего не делает)."""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="action-log-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Останавливает поток, предварительно записав всё, что осталось в очереди."""
+        with self._start_lock:
+            thread = self._thread
+            self._thread = None
+        if thread is None:
+            return
+        self._stop_event.set()
+        thread.join(timeout)
+
+    def flush(self):
+        """Блокирует вызывающий поток, пока все уже поставленные события не будут записаны."""
+        self.queue.join()
+
+    def enqueue(self, user_id, username, first_name, last_name, action_type, action_details=None):
+        """Ставит действие в очередь на запись. Время действия фиксируется здесь, а не при записи."""
+        if self._thread is None:
+            self.start()
+
+        event = (user_id, username, first_name, last_name, clock.now(), action_type, action_details)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("enqueued")
+        return True
+
+    def _count(self, name, value=1):
+        with self._stats_lock:
+            self.stats[name] += value
+
+    def _collect_batch(self):
+        """Собирает пачку: ждёт первое событие, затем добирает до batch_size, но не дольше flush_interval."""
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            # При остановке не ждём, а сразу забираем то, что уже лежит в очереди
+            remaining = 0 if self._stop_event.is_set() else deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self.queue.get(timeout=remaining))
+                else:
+                    batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch):
+        """Записывает пачку, повторяя попытку с нарастающей паузой, если база недоступна."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                log_user_actions(batch)
+                self._count("written", len(batch))
+                break
+            except sqlite3.Error as e:
+                if attempt == self.max_retries:
+                    logging.error(f"Не удалось записать {len(batch)} действий пользователей: {e}")
+                    self._count("dropped", len(batch))
+                    return
+                self._count("delayed", len(batch))
+                time.sleep(min(0.1 * 2 ** attempt, 5))
+            except Exception:
+                # Повтор не поможет (например, некорректное событие) — теряем только эту пачку
+                logging.exception(f"Ошибка при записи {len(batch)} действий пользователей, пачка отброшена")
+                self._count("dropped", len(batch))
+                return
+
+        # Начался новый день — сворачиваем завершённые дни; при ошибке попробуем после следующей пачки
+        try:
+            rollup_user_visits_on_new_day()
+        except Exception:
+            logging.exception("Не удалось обновить дневную свёртку user_visits")
+
+    def _run(self):
+        while not (self._stop_event.is_set() and self.queue.empty()):
+            batch = self._collect_batch()
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+
+# Общий экземпляр для всех обработчиков; поток стартует при первом событии
+action_log_writer = ActionLogWriter()
+
+
 # Декоратор для логирования
 def log_action(action_type, action_details=None):
     def decorator(func):
+        @functools.wraps(func)
         def wrapper(*args, **kwargs):
             obj = args[0] if args else None
             if obj:
@@ -28,7 +163,8 @@ def log_action(action_type, action_details=None):
                 if str(user_id) == id_chat_owner:
                     return func(*args, **kwargs)
 
-                log_user_action(user_id, username, first_name, last_name, action_type, action_details)
+                # Запись в базу выполняется фоновым потоком, обработчик её не ждёт
+                action_log_writer.enqueue(user_id, username, first_name, last_name, action_type, action_details)
             return func(*args, **kwargs)
         return wrapper
     return decorator
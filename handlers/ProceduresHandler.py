@@ -1,27 +1,16 @@
-from telebot import types
 from handlers.UserRequestHandler import UserRequestHandler  # Исправлен импорт
+from handlers.ScreenCache import get_screen
 
 class ProceduresHandler:
-    def __init__(self, bot, admin_chat_id):
+    def __init__(self, bot, admin_chat_id, user_request_handler=None):
         self.bot = bot
         self.admin_chat_id = admin_chat_id
-        self.user_request_handler = UserRequestHandler(bot, admin_chat_id)  # Ссылка на существующий обработчик
+        # Ссылка на существующий обработчик
+        self.user_request_handler = user_request_handler or UserRequestHandler(bot, admin_chat_id)
 
     def show_procedures(self, message):
-        """Отображает список процедур с кратким описанием."""
-        procedures_message = (
-            "💉 **Виды процедур и их описание:**\n\n"
-            "1. **Ботокс инъекции** — разглаживают морщины, делают кожу молодой и сияющей. ✨\n"
-            "2. **Гиалуроновая кислота** — увлажняет кожу, возвращает ей упругость. 💧\n"
-            "3. **Мезотерапия лица** — улучшает текстуру кожи, устраняет мелкие недостатки. 🌸\n"
-            "4. **Пилинг лица** — очищает кожу, устраняет пигментные пятна. 🌿\n\n"
-            "Выберите интересующую процедуру, чтобы узнать больше. 😊"
-        )
-
-        markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("ℹ️ Узнать подробнее", callback_data="get_contact"))
-
-        self.bot.send_message(message.chat.id, procedures_message, reply_markup=markup, parse_mode="Markdown")
+        """Отображает список процедур с кратким описанием (текст и кнопка собраны заранее)."""
+        get_screen("procedures").send(self.bot, message.chat.id)
 
     def handle_booking_procedure(self, call):
         """Обрабатывает нажатие кнопки 'Узнать подробнее'."""
@@ -1,44 +1,173 @@
 from telebot import types
-from db import get_records_from_today
-from datetime import datetime
+import clock
+from db import get_records_page, iter_records
+from export import FORMATS, send_export
+from datetime import datetime, timedelta
+
+
+# Количество записей на одной странице
+PAGE_SIZE = 5
+# Окна просмотра: код в callback_data -> длительность окна в днях
+WINDOW_DAYS = {"d": 1, "w": 7}
+# Колонки выгрузки записей в файл
+EXPORT_HEADER = ["Заявка", "ID клиента", "Имя", "Фамилия", "Телефон", "Username", "Дата", "Время", "Статус", "Комментарий"]
 
 
 class RecordsHandler:
+    """
+    Просмотр записей по окнам (день или неделя) с постраничной навигацией.
+    Навигация редактирует одно и то же сообщение. Формат callback_data:
+    - 'rec_<d|w>_<ГГГГММДД>' — первая страница окна, начинающегося с указанной даты;
+    - 'rec_<d|w>_<ГГГГММДД>_<next|prev>_<начало приёма в секундах Unix>_<ID>' — страница после/перед записью;
+    - 'export_<csv|xlsx>_rec_<d|w>_<ГГГГММДД>' — выгрузка всех записей окна файлом.
+    """
     def __init__(self, bot):
         self.bot = bot
 
     def show_records(self, message):
-        """Показывает список записей начиная с сегодняшнего дня."""
-        records = get_records_from_today()
-        if not records:
-            self.bot.send_message(
-                message.chat.id,
-                "❌ Нет записей на сегодня или позже.",
-                parse_mode="HTML"
-            )
-            return
+        """Показывает записи на неделю, начиная с сегодняшнего дня."""
+        self.show_window(message.chat.id, "w", clock.today())
+
+    def handle_callback(self, call):
+        """Обрабатывает кнопки навигации по записям."""
+        parts = call.data.split("_")
+        mode, window_date = parts[1], datetime.strptime(parts[2], '%Y%m%d').date()
+        after = before = None
+        if len(parts) == 6:
+            key = (int(parts[4]), int(parts[5]))
+            if parts[3] == "next":
+                after = key
+            else:
+                before = key
+
+        self.show_window(call.message.chat.id, mode, window_date, after, before, call.message.message_id)
+
+    def show_window(self, chat_id, mode, window_date, after=None, before=None, message_id=None):
+        """
+        Отображает страницу записей окна.
+        - Загружает из базы только PAGE_SIZE + 1 записей окна (лишняя — признак следующей страницы).
+        - Без message_id отправляет новое сообщение, иначе редактирует существующее.
+        """
+        window_end_date = window_date + timedelta(days=WINDOW_DAYS[mode])
+        records = get_records_page(
+            clock.day_start(window_date),
+            clock.day_start(window_end_date),
+            after=after, before=before, limit=PAGE_SIZE + 1
+        )
+
+        if before:
+            has_prev, has_next = len(records) > PAGE_SIZE, True
+            records = records[-PAGE_SIZE:]
+        else:
+            has_prev, has_next = after is not None, len(records) > PAGE_SIZE
+            records = records[:PAGE_SIZE]
+
+        period = self.format_period(mode, window_date)
 
         # Формируем текст для отправки
-        records_text = "📋 <b>Текущие записи:</b>\n\n"
+        records_text = f"📋 <b>Записи на {period}:</b>\n\n"
+        if not records:
+            records_text += "❌ Записей в этом периоде нет."
         for record in records:
-            # Форматируем дату в формате DD.MM.YY
-            appointment_date = datetime.strptime(record['appointment_date'], '%Y-%m-%d').strftime('%d.%m.%y')
-
+            appointment_at = clock.to_local(record['appointment_at'])
             records_text += (
                 f"🆔 Заявка №{record['id']}\n"
                 f"👤 Клиент: {record['first_name']} {record['last_name'] or ''}\n"
                 f"📱 Телефон: {record['phone_number']}\n"
                 f"📧 Username: @{record['username'] or 'Не указан'}\n"
-                f"📅 Дата: {appointment_date}\n"
-                f"⏰ Время: {record['appointment_time']}\n"
+                f"📅 Дата: {appointment_at.strftime('%d.%m.%y')}\n"
+                f"⏰ Время: {appointment_at.strftime('%H:%M')}\n"
                 f"💬 Комментарий: {record['comments'] or 'Нет'}\n"
                 "-----------------------------\n"
             )
 
-        # Отправляем пользователю
-        self.bot.send_message(
-            message.chat.id,
-            records_text,
-            parse_mode="HTML"
+        markup = self.build_markup(mode, window_date, records, has_prev, has_next)
+
+        if message_id:
+            self.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=records_text,
+                reply_markup=markup,
+                parse_mode="HTML"
+            )
+        else:
+            self.bot.send_message(
+                chat_id,
+                records_text,
+                reply_markup=markup,
+                parse_mode="HTML"
+            )
+
+    def export(self, chat_id, fmt, params):
+        """
+        Выгружает все записи окна файлом (params — ['<d|w>', 'ГГГГММДД'] из callback_data).
+        Записи читаются из базы потоково (iter_records), поэтому размер окна не влияет на память.
+        """
+        mode, window_date = params[0], datetime.strptime(params[1], '%Y%m%d').date()
+        window_end_date = window_date + timedelta(days=WINDOW_DAYS[mode])
+        records = iter_records(clock.day_start(window_date), clock.day_start(window_end_date))
+        rows = (
+            [
+                record['id'], record['telegram_user_id'], record['first_name'], record['last_name'],
+                record['phone_number'], record['username'],
+                clock.format_local(record['appointment_at'], '%d.%m.%Y'),
+                clock.format_local(record['appointment_at'], '%H:%M'),
+                record['status'], record['comments']
+            ]
+            for record in records
+        )
+        period = self.format_period(mode, window_date)
+        filename = f"records_{window_date.strftime('%Y%m%d')}_{(window_end_date - timedelta(days=1)).strftime('%Y%m%d')}"
+        if not send_export(self.bot, chat_id, filename, fmt, EXPORT_HEADER, rows, caption=f"Записи на {period}"):
+            self.bot.send_message(chat_id, f"❌ Записей на {period} нет.", parse_mode="HTML")
+
+    @staticmethod
+    def format_period(mode, window_date):
+        """Подпись окна: день или диапазон дат недели."""
+        if mode == "d":
+            return window_date.strftime('%d.%m.%y')
+        window_last_date = window_date + timedelta(days=WINDOW_DAYS[mode] - 1)
+        return f"{window_date.strftime('%d.%m.%y')} - {window_last_date.strftime('%d.%m.%y')}"
+
+    @staticmethod
+    def build_markup(mode, window_date, records, has_prev, has_next):
+        """Кнопки листания страниц внутри окна, переключения окна и режима день/неделя."""
+        window = f"rec_{mode}_{window_date.strftime('%Y%m%d')}"
+
+        def page_key(record):
+            return f"{record['appointment_at']}_{record['id']}"
+
+        markup = types.InlineKeyboardMarkup()
+        page_buttons = []
+        if has_prev:
+            page_buttons.append(types.InlineKeyboardButton(
+                "⬅️ Назад", callback_data=f"{window}_prev_{page_key(records[0])}"
+            ))
+        if has_next:
+            page_buttons.append(types.InlineKeyboardButton(
+                "Вперёд ➡️", callback_data=f"{window}_next_{page_key(records[-1])}"
+            ))
+        if page_buttons:
+            markup.row(*page_buttons)
+
+        step = timedelta(days=WINDOW_DAYS[mode])
+        other_mode, other_label = ("w", "🗓 Неделя") if mode == "d" else ("d", "📅 День")
+        markup.row(
+            types.InlineKeyboardButton(
+                "⏪", callback_data=f"rec_{mode}_{(window_date - step).strftime('%Y%m%d')}"
+            ),
+            types.InlineKeyboardButton(
+                other_label, callback_data=f"rec_{other_mode}_{window_date.strftime('%Y%m%d')}"
+            ),
+            types.InlineKeyboardButton(
+                "⏩", callback_data=f"rec_{mode}_{(window_date + step).strftime('%Y%m%d')}"
+            )
         )
+        if records:
+            markup.row(*[
+                types.InlineKeyboardButton(f"📥 {fmt.upper()}", callback_data=f"export_{fmt}_{window}")
+                for fmt in FORMATS
+            ])
+        return markup
 
@@ -0,0 +1,145 @@
+from telebot import types
+from config import id_chat_owner
+
+
+class Screen:
+    """
+    Готовый статический экран: текст, клавиатура, уже сериализованная в JSON, и параметры отправки.
+    TeleBot передаёт строку reply_markup в Bot API как есть, поэтому клавиатура не собирается
+    и не сериализуется заново при каждой отправке.
+    """
+    __slots__ = ("text", "reply_markup", "options")
+
+    def __init__(self, text, markup=None, **options):
+        self.text = text
+        self.reply_markup = markup.to_json() if markup is not None else None
+        self.options = options
+
+    def send(self, bot, chat_id, text=None):
+        """Отправляет экран в чат; text подменяет текст, если клавиатура та же, а текст вычисляется."""
+        return bot.send_message(chat_id, text or self.text, reply_markup=self.reply_markup, **self.options)
+
+    def submit(self, bot, chat_id, text=None):
+        """Как send, но без ожидания ответа: возвращает Future (или asyncio.Task у асинхронного бота) из bot.submit."""
+        return bot.submit("send_message", chat_id, text or self.text, reply_markup=self.reply_markup, **self.options)
+
+    def edit_markup(self, bot, chat_id, message_id):
+        """Заменяет клавиатуру у уже отправленного сообщения."""
+        return bot.edit_message_reply_markup(chat_id, message_id, reply_markup=self.reply_markup)
+
+
+def _build_screens():
+    """Собирает все статические экраны один раз при импорте модуля."""
+    screens = {}
+
+    # Главное меню администратора
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.row("📝 Записать", "📋 Отобразить записи")
+    markup.add("👥 Посмотреть пользователей")
+    screens["main_menu_admin"] = Screen(
+        "👨‍💼 Здравствуйте, Администратор!\n\n"
+        "Выберите одну из опций ниже, чтобы продолжить.",
+        markup
+    )
+
+    # Главное меню пользователя
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.row("✨ Виды процедур", "🌐 Другие соц сети")
+    markup.add("📅 Узнать о свободных слотах")
+    screens["main_menu_user"] = Screen(
+        "🎉 Добро пожаловать! Я ваш личный помощник. 👋\n\n"
+        "Готов помочь вам с записью на процедуры и предоставить всю информацию о наших услугах! 😊\n\n"
+        "Выберите одну из опций ниже, чтобы продолжить:👇",
+        markup
+    )
+
+    # Кнопки главного меню (без приветствия)
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add("📝 Записать")
+    markup.add("📋 Отобразить записи")
+    markup.add("👥 Посмотреть пользователей")
+    screens["menu_buttons_admin"] = Screen("👇 Выберите действие из меню:", markup)
+
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.row("✨ Виды процедур", "🌐 Другие соц сети")
+    markup.add("📅 Узнать о свободных слотах")
+    markup.add("🙏 Спасибо, вернуться позже")
+    screens["menu_buttons_user"] = Screen("👇 Выберите действие из меню:", markup)
+
+    # Кнопка «Запустить» для скрытого меню
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add("🚀 Запустить")
+    screens["start_button"] = Screen("Добро пожаловать! Нажмите 'Запустить', чтобы начать. 🚀", markup)
+
+    # Прощание с кнопкой «Запустить»
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
+    markup.add(types.KeyboardButton("🚀 Запустить"))
+    screens["exit"] = Screen(
+        "💖 Спасибо, что воспользовались нашим ботом! Мы всегда рады вам помочь. Хорошего дня! 😊\n\n"
+        "🚀 Когда будете готовы вернуться, нажмите 'Запустить'.",
+        markup
+    )
+
+    # Виды процедур
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("ℹ️ Узнать подробнее", callback_data="get_contact"))
+    screens["procedures"] = Screen(
+        "💉 **Виды процедур и их описание:**\n\n"
+        "1. **Ботокс инъекции** — разглаживают морщины, делают кожу молодой и сияющей. ✨\n"
+        "2. **Гиалуроновая кислота** — увлажняет кожу, возвращает ей упругость. 💧\n"
+        "3. **Мезотерапия лица** — улучшает текстуру кожи, устраняет мелкие недостатки. 🌸\n"
+        "4. **Пилинг лица** — очищает кожу, устраняет пигментные пятна. 🌿\n\n"
+        "Выберите интересующую процедуру, чтобы узнать больше. 😊",
+        markup,
+        parse_mode="Markdown"
+    )
+
+    # Социальные сети
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("📲 Перейти в Instagram", url="https://www.instagram.com/your_instagram"))
+    screens["social_media"] = Screen(
+        "💖 Давайте оставаться на связи! Я выкладываю полезные посты, делюсь акциями, розыгрышами и новостями в Instagram.\n\n"
+        "📸 <b>Мой Instagram:</b> <a href='https://www.instagram.com/your_instagram'>@your_instagram</a>\n\n"
+        "Подписывайтесь, чтобы быть в курсе всех обновлений! 🥰",
+        markup,
+        parse_mode="HTML",
+        disable_web_page_preview=False  # Можно отключить или включить превью ссылки
+    )
+
+    # Запрос номера телефона (текст со свободными окнами подставляется при отправке)
+    markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add(types.KeyboardButton("📞 Отправить номер телефона", request_contact=True))
+    screens["contact_request"] = Screen(
+        "📋 Пожалуйста, оставьте ваш номер телефона, чтобы мы могли с вами связаться. 😊",
+        markup
+    )
+
+    # Меню разделов статистики
+    markup = types.InlineKeyboardMarkup()
+    markup.add(types.InlineKeyboardButton("👥 Уникальные пользователи", callback_data="unique_users"))
+    markup.add(types.InlineKeyboardButton("🔄 Повторные посещения", callback_data="repeat_visits"))
+    markup.add(types.InlineKeyboardButton("📭 Неактивные пользователи", callback_data="inactive_users"))
+    # markup.add(types.InlineKeyboardButton("📊 Посещенные разделы", callback_data="section_stats"))
+    # markup.add(types.InlineKeyboardButton("🔙 Вернуться в главное меню", callback_data="back_to_menu"))
+    screens["statistics_menu"] = Screen(
+        "📊 <b>Выберите раздел статистики:</b>\n\n"
+        "После выбора раздела вы можете указать даты или выбрать стандартный период.",
+        markup,
+        parse_mode="HTML"
+    )
+
+    return screens
+
+
+SCREENS = _build_screens()
+
+
+def get_screen(name, chat_id=None):
+    """
+    Возвращает готовый экран. Для экранов, зависящих от роли (main_menu, menu_buttons),
+    передаётся chat_id: администратор получает вариант '<name>_admin', остальные — '<name>_user'.
+    """
+    if chat_id is None:
+        return SCREENS[name]
+    role = "admin" if str(chat_id) == id_chat_owner else "user"
+    return SCREENS[f"{name}_{role}"]
@@ -1,7 +1,22 @@
-from handlers.StartHandler import StartHandler
-from datetime import datetime
+import logging
+import sqlite3
+from concurrent.futures import wait
+from handlers.ScreenCache import get_screen
 from telebot import types
-from db import save_appointment, get_last_appointment_id, save_message_id_to_db
+import clock
+from db import save_appointment, save_message_id_to_db
+from availability import availability
+from config import FREE_SLOTS_SHOWN
+
+# Краткие названия дней недели для списка свободных окон
+WEEKDAYS = ["пн", "вт", "ср", "чт", "пт", "сб", "вс"]
+
+SAVE_ERROR_TEXT = "❌ Произошла ошибка при сохранении записи. Попробуйте позже."
+CONTACT_THANKS_TEXT = (
+    "💖 Мы свяжемся с вами совсем скоро, чтобы обсудить все детали. 😊\n\n"
+    "📱 Номер нужен для связи в мессенджерах, а если не получится, то мы попробуем вам позвонить.\n\n"
+    "📋 Вы также можете ознакомиться с краткой информацией о наших процедурах или посетить наши страницы в социальных сетях."
+)
 
 
 class UserRequestHandler:
@@ -10,99 +25,111 @@ class UserRequestHandler:
         self.admin_chat_id = admin_chat_id
 
     def start_request(self, message):
-        """Запрашивает у пользователя номер телефона для связи."""
-        markup = types.ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        button = types.KeyboardButton("📞 Отправить номер телефона", request_contact=True)
-        markup.add(button)
-
-        self.bot.send_message(
-            message.chat.id,
-            "📋 Пожалуйста, оставьте ваш номер телефона, чтобы мы могли с вами связаться. 😊",
-            reply_markup=markup
+        """Показывает ближайшие свободные окна и запрашивает у пользователя номер телефона для связи."""
+        # Клавиатура с кнопкой контакта собрана заранее, меняется только список окон
+        screen = get_screen("contact_request")
+        screen.send(self.bot, message.chat.id, text=self.free_slots_text() + screen.text)
+
+    @staticmethod
+    def free_slots_text():
+        """Список ближайших свободных окон для экрана запроса контакта."""
+        slots = availability.next_free_slots(FREE_SLOTS_SHOWN)
+        if not slots:
+            return "🗓 В ближайшие дни свободных окон нет, но мы постараемся подобрать время.\n\n"
+        return "🗓 Ближайшие свободные окна:\n" + "\n".join(
+            f"• {slot.strftime('%d.%m')} ({WEEKDAYS[slot.weekday()]}) {slot.strftime('%H:%M')}" for slot in slots
+        ) + "\n\n"
+
+    @staticmethod
+    def contact_appointment(message):
+        """Аргументы save_appointment для новой заявки из присланного контакта."""
+        return {
+            "user_id": message.contact.user_id or "Не указан",
+            "username": message.from_user.username or "❌ Не указан",
+            "first_name": message.contact.first_name or "Пользователь",
+            "last_name": message.contact.last_name,
+            "phone_number": message.contact.phone_number,
+            "date": None,
+            "time": None,
+            "requested_at": clock.now(),
+            "comments": None,
+            "status": "ожидает",
+        }
+
+    @staticmethod
+    def admin_notification(message, record_id, appointment):
+        """Текст и клавиатура уведомления администратора о новой заявке."""
+        user_id = appointment["user_id"]
+        admin_message = (
+            f"📩 Запрос на запись (Заявка №{record_id}):\n\n"
+            f"👤 Имя: {message.from_user.first_name or 'Не указано'} {message.from_user.last_name or ''}\n"
+            f"📱 Телефон: {appointment['phone_number']}\n"
+            f"📧 Username: @{appointment['username']}\n"
+            f"🆔 ID клиента: <code>{user_id}</code>\n\n"
+            "💡 Нажмите на одну из кнопок ниже, чтобы записать клиента или написать ему сообщение."
         )
 
-    def handle_contact(self, message):
-        """Обрабатывает контакт, отправленный пользователем."""
-        if message.contact:
-            # Удаляем сообщение с номером телефона у пользователя
-            self.bot.delete_message(message.chat.id, message.message_id)
-
-            phone_number = message.contact.phone_number
-            user_name = message.contact.first_name or "Пользователь"
-            user_username = message.from_user.username or "❌ Не указан"
-            user_id = message.contact.user_id or "Не указан"
-
-            # Сохраняем данные в базу и получаем ID записи
-            save_appointment(
-                user_id=user_id,
-                username=user_username,
-                first_name=user_name,
-                last_name=message.contact.last_name,
-                phone_number=phone_number,
-                date=None,
-                time=None,
-                request_date=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),  # Форматируем дату и время
-                comments=None,
-                status="ожидает"
-            )
-            record_id = get_last_appointment_id(user_id)
-
-            if not record_id:
-                self.bot.send_message(
-                    message.chat.id,
-                    "❌ Произошла ошибка при сохранении записи. Попробуйте позже."
-                )
-                return
-
-            # Уведомление администратора
-            admin_message = (
-                f"📩 Запрос на запись (Заявка №{record_id}):\n\n"
-                f"👤 Имя: {message.from_user.first_name or 'Не указано'} {message.from_user.last_name or ''}\n"
-                f"📱 Телефон: {phone_number}\n"
-                f"📧 Username: @{user_username}\n"
-                f"🆔 ID клиента: <code>{user_id}</code>\n\n"
-                "💡 Нажмите на одну из кнопок ниже, чтобы записать клиента или написать ему сообщение."
-            )
-
-            markup = types.InlineKeyboardMarkup(row_width=2)  # Указываем, что в строке максимум 2 кнопки
+        markup = types.InlineKeyboardMarkup(row_width=2)  # Указываем, что в строке максимум 2 кнопки
 
-            # Добавляем кнопку "Написать сообщение" в отдельной строке
-            markup.add(
-                types.InlineKeyboardButton("✉️ Написать сообщение", url=f"tg://user?id={user_id}")
-            )
+        # Добавляем кнопку "Написать сообщение" в отдельной строке
+        markup.add(
+            types.InlineKeyboardButton("✉️ Написать сообщение", url=f"tg://user?id={user_id}")
+        )
 
-            # Добавляем кнопки "Записать" и "Отклонить" в одной строке
-            markup.row(
-                types.InlineKeyboardButton("📝 Записать", callback_data=f"record_{record_id}"),
-                types.InlineKeyboardButton("❌ Отклонить", callback_data=f"cancel_{record_id}")
-            )
+        # Добавляем кнопки "Записать" и "Отклонить" в одной строке
+        markup.row(
+            types.InlineKeyboardButton("📝 Записать", callback_data=f"record_{record_id}"),
+            types.InlineKeyboardButton("❌ Отклонить", callback_data=f"cancel_{record_id}")
+        )
+        return admin_message, markup
 
-            # Отправляем сообщение администратору с корректным parse_mode
-            sent_message = self.bot.send_message(
-                self.admin_chat_id,
-                admin_message,
-                reply_markup=markup,
-                parse_mode="HTML"  # Здесь указываем HTML, чтобы теги корректно обрабатывались
-            )
+    def handle_contact(self, message):
+        """
+        Обрабатывает контакт, отправленный пользователем. Вызовы Bot API идут через bot.submit параллельно:
+        - удаление сообщения с номером ставится в очередь сразу и не задерживает сохранение заявки;
+        - как только заявка сохранена, пользователю уходят благодарность и меню, а администратору — уведомление
+          (очереди разных чатов независимы, внутри чата пользователя порядок сохраняется);
+        - ID сообщения администратора записывается в базу после ответа на уведомление.
+        Обработчик дожидается всех вызовов, даже если уведомление или сохранение его ID упали:
+        ошибки вызовов пишутся в лог, а первая из них пробрасывается и видна в метриках обработчика.
+        """
+        if not message.contact:
+            return
+
+        chat_id = message.chat.id
+        # Удаляем сообщение с номером телефона у пользователя
+        calls = [self.bot.submit("delete_message", chat_id, message.message_id)]
+        try:
+            # Сохраняем данные в базу: save_appointment сразу возвращает ID записи
+            appointment = self.contact_appointment(message)
+            try:
+                record_id = save_appointment(**appointment)
+            except sqlite3.Error as e:
+                logging.error(f"Не удалось сохранить заявку пользователя {appointment['user_id']}: {e}")
+                self.bot.send_message(chat_id, SAVE_ERROR_TEXT)
+                return
 
-            # Сохраняем message_id в базу данных
-            save_message_id_to_db(record_id, sent_message.message_id)
+            # Заявка сохранена — отвечаем пользователю, не дожидаясь уведомления администратора
+            calls.append(self.bot.submit("send_message", chat_id, CONTACT_THANKS_TEXT, parse_mode="HTML"))
+            calls.append(get_screen("menu_buttons", chat_id).submit(self.bot, chat_id))
 
-            # Отправляем сообщение пользователю
-            self.bot.send_message(
-                message.chat.id,
-                "💖 Мы свяжемся с вами совсем скоро, чтобы обсудить все детали. 😊\n\n"
-                "📱 Номер нужен для связи в мессенджерах, а если не получится, то мы попробуем вам позвонить.\n\n"
-                "📋 Вы также можете ознакомиться с краткой информацией о наших процедурах или посетить наши страницы в социальных сетях.",
-                parse_mode="HTML"
+            # Уведомление администратора и сохранение его message_id идут строго друг за другом
+            admin_message, markup = self.admin_notification(message, record_id, appointment)
+            notification = self.bot.submit(
+                "send_message", self.admin_chat_id, admin_message, reply_markup=markup, parse_mode="HTML"
             )
-
-            # Вызов метода для отображения главного меню
-            start_handler = StartHandler(self.bot)
-            start_handler.show_main_menu_buttons(message.chat.id)
-
-
-
-
-
-
+            calls.append(notification)
+            save_message_id_to_db(record_id, notification.result().message_id)
+        finally:
+            errors = wait_calls(calls)
+        if errors:
+            raise errors[0]
+
+
+def wait_calls(futures):
+    """Дожидается всех вызовов Bot API из bot.submit и возвращает их ошибки, записав каждую в лог."""
+    wait(futures)
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    for error in errors:
+        logging.error(f"Ошибка вызова Bot API: {error!r}")
+    return errors
@@ -1,6 +1,19 @@
 from telebot import types
 from datetime import datetime, timedelta
-from db import get_users_by_date_range, get_repeat_visits, get_inactive_users
+import clock
+from db import (
+    get_users_by_date_range, get_repeat_visits, get_inactive_users,
+    iter_unique_users, iter_repeat_visits, iter_inactive_users
+)
+from export import FORMATS, send_export
+from handlers.ScreenCache import get_screen
+from state import chat_states
+
+# Сколько пользователей показывается на одной странице статистики (укладывается в лимит 4096 символов)
+PAGE_SIZE = 10
+# Колонки выгрузки пользователей в файл
+EXPORT_HEADER = ["ID", "Username", "Имя", "Фамилия", "Последний визит"]
+
 
 class BaseStatisticsHandler:
     """
@@ -9,37 +22,109 @@ class BaseStatisticsHandler:
     """
     def __init__(self, bot):
         self.bot = bot
-        self.pending_section = {}  # Для хранения выбранного раздела статистики
 
     def show_statistics(self, message):
         """
         Отображает главное меню статистики пользователей.
         - Выводит основные разделы статистики: уникальные пользователи, повторные посещения, неактивные пользователи, посещённые разделы.
-        - Отправляет сообщение с кнопками для выбора раздела.
+        - Отправляет заранее собранное сообщение с кнопками для выбора раздела.
         """
-        statistics_message = (
-            "📊 <b>Выберите раздел статистики:</b>\n\n"
-            "После выбора раздела вы можете указать даты или выбрать стандартный период."
-        )
+        get_screen("statistics_menu").send(self.bot, message.chat.id)
 
+    def handle_back_to_menu(self, call):
+        """Возвращает в главное меню (оно собрано заранее, поэтому обработчик меню не нужен)."""
+        get_screen("main_menu", call.message.chat.id).send(self.bot, call.message.chat.id)
+
+    def fetch_page(self, fetch, after_user_id=None, before_user_id=None):
+        """
+        Загружает одну страницу пользователей по ключу telegram_user_id (keyset-пагинация).
+        - Запрашивает на одну запись больше PAGE_SIZE, чтобы узнать, есть ли страница дальше.
+        - Возвращает (пользователи, есть_предыдущая, есть_следующая).
+        """
+        users = fetch(after_user_id=after_user_id, before_user_id=before_user_id, limit=PAGE_SIZE + 1)
+
+        if before_user_id is not None:
+            # Листаем назад: лишняя запись оказывается в начале, а следующая страница точно есть
+            return users[-PAGE_SIZE:], len(users) > PAGE_SIZE, True
+
+        return users[:PAGE_SIZE], after_user_id is not None, len(users) > PAGE_SIZE
+
+    def send_page(self, chat_id, text, users, callback_prefix, has_prev, has_next, message_id=None):
+        """
+        Отправляет страницу статистики с кнопками навигации.
+        - callback_data кнопок: '<callback_prefix>_prev_<ID первого>' и '<callback_prefix>_next_<ID последнего>'.
+        - Кнопки выгрузки всего раздела в файл: 'export_<csv|xlsx>_<раздел>[_<параметры>]'
+          (callback_prefix имеет вид 'stats_<раздел>[_<параметры>]').
+        - Первая страница отправляется новым сообщением, остальные редактируют его на месте.
+        """
         markup = types.InlineKeyboardMarkup()
-        markup.add(types.InlineKeyboardButton("👥 Уникальные пользователи", callback_data="unique_users"))
-        markup.add(types.InlineKeyboardButton("🔄 Повторные посещения", callback_data="repeat_visits"))
-        markup.add(types.InlineKeyboardButton("📭 Неактивные пользователи", callback_data="inactive_users"))
-        # markup.add(types.InlineKeyboardButton("📊 Посещенные разделы", callback_data="section_stats"))
-        # markup.add(types.InlineKeyboardButton("🔙 Вернуться в главное меню", callback_data="back_to_menu"))
+        buttons = []
+        if has_prev:
+            buttons.append(types.InlineKeyboardButton(
+                "⬅️ Назад", callback_data=f"{callback_prefix}_prev_{users[0]['telegram_user_id']}"
+            ))
+        if has_next:
+            buttons.append(types.InlineKeyboardButton(
+                "Вперёд ➡️", callback_data=f"{callback_prefix}_next_{users[-1]['telegram_user_id']}"
+            ))
+        if buttons:
+            markup.row(*buttons)
+        section = callback_prefix.split("_", 1)[1]
+        markup.row(*[
+            types.InlineKeyboardButton(f"📥 {fmt.upper()}", callback_data=f"export_{fmt}_{section}")
+            for fmt in FORMATS
+        ])
+
+        if message_id:
+            self.bot.edit_message_text(
+                chat_id=chat_id,
+                message_id=message_id,
+                text=text,
+                reply_markup=markup,
+                parse_mode="HTML"
+            )
+        else:
+            self.bot.send_message(
+                chat_id,
+                text,
+                reply_markup=markup,
+                parse_mode="HTML"
+            )
 
-        self.bot.send_message(
-            message.chat.id,
-            statistics_message,
-            reply_markup=markup,
-            parse_mode="HTML"
+    @staticmethod
+    def parse_page_callback(data):
+        """
+        Разбирает callback_data страницы: 'stats_<раздел>_[<параметры>_]<next|prev>_<ID>'.
+        Возвращает (параметры, after_user_id, before_user_id).
+        """
+        parts = data.split("_")
+        params, direction, user_id = parts[2:-2], parts[-2], int(parts[-1])
+        if direction == "prev":
+            return params, None, user_id
+        return params, user_id, None
+
+    def send_users_export(self, chat_id, fmt, filename, title, users, columns=(), values=None):
+        """
+        Выгружает пользователей раздела файлом через send_export.
+        - users — генератор из db.iter_*: пользователи читаются с курсора по одному.
+        - columns и values(user) — дополнительные колонки раздела после общих EXPORT_HEADER.
+        """
+        rows = (
+            [
+                user["telegram_user_id"], user["username"], user["first_name"], user["last_name"],
+                clock.format_local(user["visited_at"]),
+                *(values(user) if values else ())
+            ]
+            for user in users
         )
+        if not send_export(self.bot, chat_id, filename, fmt, EXPORT_HEADER + list(columns), rows, caption=title):
+            self.bot.send_message(chat_id, f"❌ Нет данных для выгрузки: {title}.", parse_mode="HTML")
 
-    def handle_back_to_menu(self, call):
-        from handlers.StartHandler import StartHandler
-        start_handler = StartHandler(self.bot)
-        start_handler.main_menu(call.message)
+    @staticmethod
+    def parse_export_period(params):
+        """Период выгрузки из параметров callback_data: ['ГГГГММДД', 'ГГГГММДД'] -> (date, date)."""
+        start, end = params
+        return datetime.strptime(start, '%Y%m%d').date(), datetime.strptime(end, '%Y%m%d').date()
 
 
 class UniqueUsersStatisticsHandler(BaseStatisticsHandler):
@@ -52,7 +137,7 @@ class UniqueUsersStatisticsHandler(BaseStatisticsHandler):
         - Отправляет сообщение с подсказками для ввода диапазона дат.
         - Показывает примеры для выбора периода: за день, неделю, две недели, месяц или всё время.
         """
-        today = datetime.now().date()
+        today = clock.today()
         week_ago = today - timedelta(days=7)
         two_weeks_ago = today - timedelta(days=14)
         month_ago = today - timedelta(days=30)
@@ -87,6 +172,8 @@ class UniqueUsersStatisticsHandler(BaseStatisticsHandler):
             if start_date > end_date:
                 raise ValueError("Начальная дата больше конечной")
 
+            # Диапазон принят — дальнейший текст больше не считается вводом дат
+            chat_states.update(message.chat.id, stats_section=None)
             # Генерация статистики
             self.generate_statistics_unique_users(message.chat.id, start_date, end_date)
 
@@ -97,28 +184,34 @@ class UniqueUsersStatisticsHandler(BaseStatisticsHandler):
                 parse_mode="HTML"
             )
 
-    def generate_statistics_unique_users(self, chat_id, start_date, end_date):
+    def generate_statistics_unique_users(self, chat_id, start_date, end_date,
+                                         after_user_id=None, before_user_id=None, message_id=None):
         """
         Генерирует статистику уникальных пользователей за указанный период.
-        - Извлекает данные из базы через get_users_by_date_range.
+        - Извлекает из базы через get_users_by_date_range только одну страницу пользователей.
         - Форматирует данные для удобного чтения.
         - Отправляет сообщение пользователю с результатами или уведомляет об отсутствии данных.
         """
-        stats = get_users_by_date_range(start_date, end_date, unique=True)
+        stats, has_prev, has_next = self.fetch_page(
+            lambda **page: get_users_by_date_range(start_date, end_date, unique=True, **page),
+            after_user_id, before_user_id
+        )
 
         if stats:
             readable_stats = "\n\n".join([
                 f"👤 Имя: {user['first_name']} {user['last_name'] or ''}\n"
                 f"📧 Username: @{user['username'] if user['username'] else 'Не указан'}\n"
                 f"🆔 ID: <code>{user['telegram_user_id']}</code>\n"
-                f"🕒 Последний визит: {datetime.strptime(user['visit_date'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}"
+                f"🕒 Последний визит: {clock.format_local(user['visited_at'])}"
                 for user in stats
             ])
-            self.bot.send_message(
+            self.send_page(
                 chat_id,
                 f"📊 Уникальные пользователи за период {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}:\n\n"
                 f"{readable_stats}",
-                parse_mode="HTML"
+                stats,
+                f"stats_unique_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}",
+                has_prev, has_next, message_id
             )
         else:
             self.bot.send_message(
@@ -127,6 +220,26 @@ class UniqueUsersStatisticsHandler(BaseStatisticsHandler):
                 parse_mode="HTML"
             )
 
+    def handle_page(self, call):
+        """Обрабатывает кнопки навигации по страницам уникальных пользователей."""
+        (start, end), after_user_id, before_user_id = self.parse_page_callback(call.data)
+        self.generate_statistics_unique_users(
+            call.message.chat.id,
+            datetime.strptime(start, '%Y%m%d').date(),
+            datetime.strptime(end, '%Y%m%d').date(),
+            after_user_id, before_user_id, call.message.message_id
+        )
+
+    def export(self, chat_id, fmt, params):
+        """Выгружает всех уникальных пользователей за период файлом (params — период из callback_data)."""
+        start_date, end_date = self.parse_export_period(params)
+        self.send_users_export(
+            chat_id, fmt,
+            f"unique_users_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}",
+            f"Уникальные пользователи за период {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+            iter_unique_users(start_date, end_date)
+        )
+
 
 class RepeatVisitsStatisticsHandler(BaseStatisticsHandler):
     """
@@ -137,28 +250,30 @@ class RepeatVisitsStatisticsHandler(BaseStatisticsHandler):
     def handle_statistics(self, call):
         self.generate_statistics_repeat_visits(call.message.chat.id)  # Не требует ввода дат
 
-    def generate_statistics_repeat_visits(self, chat_id):
+    def generate_statistics_repeat_visits(self, chat_id, after_user_id=None, before_user_id=None, message_id=None):
         """
-        Генерирует статистику повторных посещений.
+        Генерирует статистику повторных посещений (по одной странице пользователей).
         - Проверяет, оставляли ли пользователи номер телефона и возвращает дату действия, если оно есть.
         """
-        stats = get_repeat_visits()
+        stats, has_prev, has_next = self.fetch_page(get_repeat_visits, after_user_id, before_user_id)
 
         if stats:
             readable_stats = "\n\n".join([
                 f"👤 Имя: {user['first_name']} {user['last_name'] or ''}\n"
                 f"📧 Username: @{user['username'] if user['username'] else 'Не указан'}\n"
                 f"🆔 ID: <code>{user['telegram_user_id']}</code>\n"
-                f"🕒 Последний визит: {datetime.strptime(user['visit_date'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}\n"
+                f"🕒 Последний визит: {clock.format_local(user['visited_at'])}\n"
                 f"📞 Отправлял телефон: "
-                f"{datetime.strptime(user['phone_action_date'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M') if user['phone_action_date'] else 'Нет'}\n"
+                f"{clock.format_local(user['phone_action_at'], default='Нет')}\n"
                 f"🔢 Общее количество визитов: {user['visit_count']}"
                 for user in stats
             ])
-            self.bot.send_message(
+            self.send_page(
                 chat_id,
                 f"📊 Статистика пользователей с повторной активностью:\n\n{readable_stats}",
-                parse_mode="HTML"
+                stats,
+                "stats_repeat",
+                has_prev, has_next, message_id
             )
         else:
             self.bot.send_message(
@@ -167,6 +282,21 @@ class RepeatVisitsStatisticsHandler(BaseStatisticsHandler):
                 parse_mode="HTML"
             )
 
+    def handle_page(self, call):
+        """Обрабатывает кнопки навигации по страницам повторных посещений."""
+        _, after_user_id, before_user_id = self.parse_page_callback(call.data)
+        self.generate_statistics_repeat_visits(
+            call.message.chat.id, after_user_id, before_user_id, call.message.message_id
+        )
+
+    def export(self, chat_id, fmt, params):
+        """Выгружает всех пользователей с повторной активностью файлом."""
+        self.send_users_export(
+            chat_id, fmt, "repeat_visits", "Пользователи с повторной активностью", iter_repeat_visits(),
+            columns=["Отправлял телефон", "Количество визитов"],
+            values=lambda user: [clock.format_local(user["phone_action_at"]), user["visit_count"]]
+        )
+
 
 class InactiveUsersStatisticsHandler(BaseStatisticsHandler):
     """
@@ -181,7 +311,7 @@ class InactiveUsersStatisticsHandler(BaseStatisticsHandler):
         Запрашивает диапазон дат для неактивных пользователей.
         - Показывает подсказки с примерами для выбора периода.
         """
-        today = datetime.now().date()
+        today = clock.today()
         week_ago = today - timedelta(days=7)
         two_weeks_ago = today - timedelta(days=14)
         month_ago = today - timedelta(days=30)
@@ -217,6 +347,8 @@ class InactiveUsersStatisticsHandler(BaseStatisticsHandler):
             if start_date > end_date:
                 raise ValueError("Начальная дата больше конечной")
 
+            # Диапазон принят — дальнейший текст больше не считается вводом дат
+            chat_states.update(message.chat.id, stats_section=None)
             self.generate_statistics_inactive_users(message.chat.id, start_date, end_date)
 
         except ValueError as e:
@@ -226,25 +358,31 @@ class InactiveUsersStatisticsHandler(BaseStatisticsHandler):
                 parse_mode="HTML"
             )
 
-    def generate_statistics_inactive_users(self, chat_id, start_date, end_date):
+    def generate_statistics_inactive_users(self, chat_id, start_date, end_date,
+                                           after_user_id=None, before_user_id=None, message_id=None):
         """
-        Генерирует статистику неактивных пользователей за указанный период.
+        Генерирует статистику неактивных пользователей за указанный период (по одной странице пользователей).
         """
-        stats = get_inactive_users(start_date, end_date)
+        stats, has_prev, has_next = self.fetch_page(
+            lambda **page: get_inactive_users(start_date, end_date, **page),
+            after_user_id, before_user_id
+        )
 
         if stats:
             readable_stats = "\n\n".join([
                 f"👤 Имя: {user['first_name']} {user['last_name'] or ''}\n"
                 f"📧 Username: @{user['username'] if user['username'] else 'Не указан'}\n"
                 f"🆔 ID: <code>{user['telegram_user_id']}</code>\n"
-                f"🕒 Последний визит: {datetime.strptime(user['visit_date'], '%Y-%m-%d %H:%M:%S').strftime('%d.%m.%Y %H:%M')}"
+                f"🕒 Последний визит: {clock.format_local(user['visited_at'])}"
                 for user in stats
             ])
-            self.bot.send_message(
+            self.send_page(
                 chat_id,
                 f"📊 Неактивные пользователи за период {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}:\n\n"
                 f"{readable_stats}",
-                parse_mode="HTML"
+                stats,
+                f"stats_inactive_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}",
+                has_prev, has_next, message_id
             )
         else:
             self.bot.send_message(
@@ -253,6 +391,26 @@ class InactiveUsersStatisticsHandler(BaseStatisticsHandler):
                 parse_mode="HTML"
             )
 
+    def handle_page(self, call):
+        """Обрабатывает кнопки навигации по страницам неактивных пользователей."""
+        (start, end), after_user_id, before_user_id = self.parse_page_callback(call.data)
+        self.generate_statistics_inactive_users(
+            call.message.chat.id,
+            datetime.strptime(start, '%Y%m%d').date(),
+            datetime.strptime(end, '%Y%m%d').date(),
+            after_user_id, before_user_id, call.message.message_id
+        )
+
+    def export(self, chat_id, fmt, params):
+        """Выгружает всех неактивных за период пользователей файлом (params — период из callback_data)."""
+        start_date, end_date = self.parse_export_period(params)
+        self.send_users_export(
+            chat_id, fmt,
+            f"inactive_users_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}",
+            f"Неактивные пользователи за период {start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}",
+            iter_inactive_users(start_date, end_date)
+        )
+
 
 class VisitedSectionsStatisticsHandler(BaseStatisticsHandler):
     """
@@ -0,0 +1,280 @@
+import functools
+import inspect
+import logging
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Границы корзин гистограмм в секундах: от долей миллисекунды (запросы к SQLite) до секунд (Bot API)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с фиксированными корзинами (как histogram в Prometheus).
+    observe() — поиск корзины делением пополам и три сложения под блокировкой, поэтому гистограммы
+    можно держать включёнными постоянно.
+    """
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Последняя корзина — больше самой верхней границы
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Возвращает (счётчики корзин, сумма, количество) согласованно."""
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+    def quantile(self, q):
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile в Prometheus)."""
+        counts, _, count = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket in enumerate(counts):
+            if seen + bucket >= rank and bucket:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0
+                return lower + (self.bounds[index] - lower) * (rank - seen) / bucket
+            seen += bucket
+        return self.bounds[-1]
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+class MetricsRegistry:
+    """
+    Метрики бота: гистограммы и счётчики с метками, плюс словари stats уже существующих компонентов
+    (диспетчер, планировщик исходящих, запись действий), которые читаются только при выгрузке.
+    Метрики создаются один раз при регистрации (обёртка обработчика или функции db.py),
+    поэтому на горячем пути нет поиска по словарю меток.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._families = {}  # Имя -> (тип, описание, {метки: метрика})
+        self._stats = []  # (префикс, словарь stats)
+        self._lock = threading.Lock()
+
+    def _get(self, kind, name, description, factory, labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, description, {}))
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def histogram(self, name, description, **labels):
+        return self._get("histogram", name, description, lambda: Histogram(self.buckets), labels)
+
+    def counter(self, name, description, **labels):
+        return self._get("counter", name, description, Counter, labels)
+
+    def add_stats(self, prefix, stats):
+        """Выгружать числовые значения словаря stats как bot_<prefix>_<ключ>."""
+        self._stats.append((prefix, stats))
+
+    def timed(self, name, errors_name, description, **labels):
+        """
+        Декоратор: длительность вызова пишется в гистограмму name, исключения считаются в errors_name
+        и пробрасываются дальше.
+        """
+        def decorator(func):
+            histogram = self.histogram(name, description, **labels)
+            errors = self.counter(errors_name, f"Ошибки: {description.lower()}", **labels)
+
+            # Корутина (в том числе под синхронным декоратором вроде log_action) замеряется до завершения await
+            if inspect.iscoroutinefunction(inspect.unwrap(func)):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return await func(*args, **kwargs)
+                    except BaseException:
+                        errors.inc()
+                        raise
+                    finally:
+                        histogram.observe(time.perf_counter() - started)
+                return async_wrapper
+
+            # Генератор (потоковое чтение из базы) замеряется до исчерпания или закрытия, а не до первой строки
+            if inspect.isgeneratorfunction(inspect.unwrap(func)):
+                @functools.wraps(func)
+                def generator_wrapper(*args, **kwargs):
+                    started = time.perf_counter()
+                    try:
+                        return (yield from func(*args, **kwargs))
+                    except GeneratorExit:
+                        raise
+                    except BaseException:
+                        errors.inc()
+                        raise
+                    finally:
+                        histogram.observe(time.perf_counter() - started)
+                return generator_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    errors.inc()
+                    raise
+                finally:
+                    histogram.observe(time.perf_counter() - started)
+            return wrapper
+        return decorator
+
+    def instrument_module(self, module, name, errors_name, description, label="function", exclude=()):
+        """Оборачивает все публичные функции, объявленные в модуле, декоратором timed."""
+        for attr, value in list(vars(module).items()):
+            if (attr.startswith("_") or attr in exclude or not inspect.isfunction(value)
+                    or value.__module__ != module.__name__):
+                continue
+            setattr(module, attr, self.timed(name, errors_name, description, **{label: attr})(value))
+
+    def render_prometheus(self):
+        """Текст в формате выгрузки Prometheus (text/plain; version=0.0.4)."""
+        lines = []
+        with self._lock:
+            families = [(name, kind, description, list(metrics.items()))
+                        for name, (kind, description, metrics) in sorted(self._families.items())]
+
+        for name, kind, description, metrics in families:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(metrics, key=lambda item: item[0]):
+                if kind == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                    continue
+                counts, total, count = metric.snapshot()
+                cumulative = 0
+                for bound, bucket in zip(list(metric.bounds) + ["+Inf"], counts):
+                    cumulative += bucket
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', bound))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        # Каждое имя выгружается один раз: повторно зарегистрированный словарь или совпавшее имя
+        # (префикс "a_b" и ключ "c" против префикса "a" и ключа "b_c") пропускаются
+        emitted = {name for name, *_ in families}
+        for prefix, stats in self._stats:
+            for key, value in list(stats.items()):
+                name = f"bot_{prefix}_{key}"
+                if not isinstance(value, (int, float)) or name in emitted:
+                    continue
+                emitted.add(name)
+                lines.append(f"# HELP {name} Значение {key} из stats компонента {prefix}")
+                lines.append(f"# TYPE {name} untyped")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name, errors_name, limit=10):
+        """
+        Краткая сводка гистограммы name для чата: метки с наибольшим суммарным временем,
+        количество вызовов, p50/p95 и ошибки. Возвращает список строк.
+        """
+        with self._lock:
+            histograms = list(self._families.get(name, (None, None, {}))[2].items())
+            errors = dict(self._families.get(errors_name, (None, None, {}))[2])
+
+        rows = []
+        for labels, histogram in histograms:
+            _, total, count = histogram.snapshot()
+            if count:
+                rows.append((total, count, labels, histogram))
+        rows.sort(key=lambda row: row[0], reverse=True)
+
+        lines = []
+        for total, count, labels, histogram in rows[:limit]:
+            label = ",".join(str(value) for _, value in labels)
+            error_count = errors[labels].value if labels in errors else 0
+            lines.append(
+                f"{label}: n={count} p50={histogram.quantile(0.5) * 1000:.1f}мс "
+                f"p95={histogram.quantile(0.95) * 1000:.1f}мс Σ={total:.2f}с"
+                + (f" ошибок={error_count}" if error_count else "")
+            )
+        return lines
+
+
+class MetricsServer:
+    """HTTP-выгрузка метрик для Prometheus: GET /metrics на локальном порту, в фоновом потоке."""
+    def __init__(self, registry, host, port):
+        self.registry = registry
+        self.httpd = ThreadingHTTPServer((host, port), self._make_request_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    def _make_request_handler(self):
+        registry = self.registry
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return RequestHandler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+        logging.info(f"Метрики доступны на http://{self.httpd.server_address[0]}:{self.httpd.server_address[1]}/metrics")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+        self._thread = None
+
+
+# Общий реестр метрик процесса
+metrics = MetricsRegistry()
@@ -0,0 +1,455 @@
+import logging
+from datetime import datetime
+import pytz
+import clock
+import config
+
+
+# ===== Версионные миграции схемы =====
+# Текущая версия схемы хранится в PRAGMA user_version самого файла базы.
+# Каждая миграция применяется в отдельной транзакции вместе с повышением версии,
+# поэтому прерванный запуск просто повторит её при следующем старте.
+
+def _create_base_tables(cursor):
+    """Базовые таблицы records и user_visits (схема до появления миграций)."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        phone_number TEXT,
+        appointment_date DATE,
+        appointment_time TIME,
+        request_date DATETIME,
+        comments TEXT,
+        status TEXT,
+        message_id INTEGER
+    );
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_visits (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        visit_date DATETIME,
+        unique_until DATETIME,
+        action_type TEXT,
+        action_details TEXT
+    );
+    """)
+
+    # В старых файлах базы message_id добавлялся вручную, проверяем его наличие
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(records);")]
+    if "message_id" not in columns:
+        cursor.execute("ALTER TABLE records ADD COLUMN message_id INTEGER;")
+
+
+def _create_lookup_indexes(cursor):
+    """Индексы под реальные запросы к records и user_visits."""
+    # save_appointment: поиск записи по пользователю и дате
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_user_date
+        ON records (telegram_user_id, appointment_date);
+    """)
+    # get_last_appointment_id: последняя заявка пользователя в статусе 'ожидает'
+    # (rowid входит в индекс, поэтому ORDER BY id DESC читается прямо из него)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_pending
+        ON records (telegram_user_id)
+        WHERE status = 'ожидает';
+    """)
+    # save_user_visit и группировки статистики по пользователю
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_visits_user_date
+        ON user_visits (telegram_user_id, visit_date);
+    """)
+
+
+def _add_appointment_start(cursor):
+    """Столбец appointment_start с началом приёма, заполненный для старых записей, и индекс по нему."""
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(records);")]
+    if "appointment_start" not in columns:
+        cursor.execute("ALTER TABLE records ADD COLUMN appointment_start DATETIME;")
+
+    # Заполняем для уже существующих записей тем же выражением, что раньше считалось в запросе
+    cursor.execute("""
+        UPDATE records
+        SET appointment_start = datetime(appointment_date || ' ' || appointment_time)
+        WHERE appointment_start IS NULL
+          AND appointment_date IS NOT NULL
+          AND appointment_time IS NOT NULL;
+    """)
+    # get_records_from_today: диапазон по началу приёма с сортировкой по нему же
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_records_appointment_start
+        ON records (appointment_start);
+    """)
+
+
+def _create_visit_date_index(cursor):
+    """Индекс по visit_date для статистики по диапазонам дат."""
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_visits_visit_date
+        ON user_visits (visit_date);
+    """)
+
+
+def _create_user_visits_rollup(cursor):
+    """
+    Дневная свёртка user_visits по пользователям и таблица состояния свёртки.
+    Заполняется инкрементально (см. db.rollup_user_visits), поэтому миграция создаёт только структуру.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_visits_daily (
+        telegram_user_id INTEGER NOT NULL,
+        visit_day DATE NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        visit_count INTEGER NOT NULL,
+        last_visit DATETIME,
+        phone_action_date DATETIME,
+        PRIMARY KEY (telegram_user_id, visit_day)
+    ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_user_visits_daily_day
+        ON user_visits_daily (visit_day);
+    """)
+    # Служебные значения свёрток, например граница уже свёрнутых дней
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name TEXT PRIMARY KEY,
+        value TEXT
+    );
+    """)
+
+
+def _create_chat_state(cursor):
+    """Состояние диалогов по чатам (шаги записи, выбранный раздел статистики) с временем истечения."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS chat_state (
+        chat_id INTEGER PRIMARY KEY,
+        state TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    """)
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_state_expires_at
+        ON chat_state (expires_at);
+    """)
+
+
+def _rebuild_table(cursor, table, create_sql, columns, select_sql):
+    """
+    Пересоздаёт таблицу с новой схемой (CREATE новой, INSERT ... SELECT, DROP старой, RENAME),
+    сохраняя счётчик AUTOINCREMENT. Индексы старой таблицы удаляются вместе с ней.
+    """
+    sequence = None
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence';").fetchone():
+        row = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?;", (table,)).fetchone()
+        sequence = row[0] if row else None
+
+    cursor.execute(create_sql.format(table=f"{table}_new"))
+    cursor.execute(f"INSERT INTO {table}_new ({columns}) {select_sql};")
+    cursor.execute(f"DROP TABLE {table};")
+    cursor.execute(f"ALTER TABLE {table}_new RENAME TO {table};")
+    if sequence is not None:
+        cursor.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?;", (sequence, table))
+
+
+# Строки дат раньше этого момента бот записать не мог (заглушки вроде '2000-01-01' в тестовых данных)
+LEGACY_EARLIEST = datetime(2020, 1, 1)
+
+
+def _convert_timestamps(cursor):
+    """
+    Переводит даты из строк 'ГГГГ-ММ-ДД ЧЧ:ММ:СС' в целые секунды Unix (UTC):
+    - records: request_date -> requested_at, appointment_date/appointment_time/appointment_start -> appointment_at;
+    - user_visits: visit_date -> visited_at, unique_until -> секунды Unix;
+    - user_visits_daily: visit_day, last_visit, phone_action_date -> секунды Unix (день — начало местных суток);
+    - граница свёртки в rollup_state — тоже секунды Unix.
+    Часовой пояс строки зависит от того, как её писал прежний код: request_date — наивным datetime.now()
+    в поясе сервера (config.LEGACY_SERVER_TIMEZONE, на Heroku это UTC), остальное — явно в местном времени бота.
+    Строки, которые не разбираются или раньше LEGACY_EARLIEST, не переводятся: в таблице остаётся NULL,
+    а исходное значение сохраняется в legacy_timestamps_skipped и попадает в лог.
+    """
+    zones = {"local": clock.TZ, "server": pytz.timezone(config.LEGACY_SERVER_TIMEZONE)}
+    skipped = {}  # (источник, ключ строки) -> исходное значение
+
+    def to_epoch(value, zone, source, key):
+        if not value:
+            return None
+        try:
+            parsed = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            parsed = None
+        if parsed is None or parsed.tzinfo is not None or parsed < LEGACY_EARLIEST:
+            skipped[(source, str(key))] = value
+            return None
+        return int(zones[zone].localize(parsed).timestamp())
+
+    cursor.connection.create_function("to_epoch", 4, to_epoch)
+
+    _rebuild_table(cursor, "records", """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        phone_number TEXT,
+        requested_at INTEGER,
+        appointment_at INTEGER,
+        comments TEXT,
+        status TEXT,
+        message_id INTEGER
+    );
+    """, "id, telegram_user_id, username, first_name, last_name, phone_number, "
+         "requested_at, appointment_at, comments, status, message_id", """
+        SELECT id, telegram_user_id, username, first_name, last_name, phone_number,
+               to_epoch(request_date, 'server', 'records.request_date', id),
+               to_epoch(COALESCE(appointment_start, appointment_date || ' ' || appointment_time),
+                        'local', 'records.appointment_at', id),
+               comments, status, message_id
+        FROM records
+    """)
+    # save_appointment: поиск записи по пользователю и времени приёма
+    cursor.execute("""
+        CREATE INDEX idx_records_user_appointment
+        ON records (telegram_user_id, appointment_at);
+    """)
+    cursor.execute("""
+        CREATE INDEX idx_records_pending
+        ON records (telegram_user_id)
+        WHERE status = 'ожидает';
+    """)
+    # get_records_from_today, get_records_page: диапазон по началу приёма
+    cursor.execute("""
+        CREATE INDEX idx_records_appointment_at
+        ON records (appointment_at);
+    """)
+
+    _rebuild_table(cursor, "user_visits", """
+    CREATE TABLE {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        telegram_user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        visited_at INTEGER,
+        unique_until INTEGER,
+        action_type TEXT,
+        action_details TEXT
+    );
+    """, "id, telegram_user_id, username, first_name, last_name, visited_at, unique_until, action_type, action_details", """
+        SELECT id, telegram_user_id, username, first_name, last_name,
+               to_epoch(visit_date, 'local', 'user_visits.visit_date', id),
+               to_epoch(unique_until, 'local', 'user_visits.unique_until', id),
+               action_type, action_details
+        FROM user_visits
+    """)
+    cursor.execute("""
+        CREATE INDEX idx_user_visits_user_visited_at
+        ON user_visits (telegram_user_id, visited_at);
+    """)
+    cursor.execute("""
+        CREATE INDEX idx_user_visits_visited_at
+        ON user_visits (visited_at);
+    """)
+
+    _rebuild_table(cursor, "user_visits_daily", """
+    CREATE TABLE {table} (
+        telegram_user_id INTEGER NOT NULL,
+        visit_day INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        visit_count INTEGER NOT NULL,
+        last_visit INTEGER,
+        phone_action_at INTEGER,
+        PRIMARY KEY (telegram_user_id, visit_day)
+    ) WITHOUT ROWID;
+    """, "telegram_user_id, visit_day, username, first_name, last_name, visit_count, last_visit, phone_action_at", """
+        SELECT telegram_user_id, to_epoch(visit_day, 'local', 'user_visits_daily.visit_day', telegram_user_id),
+               username, first_name, last_name, visit_count,
+               to_epoch(last_visit, 'local', 'user_visits_daily.last_visit', telegram_user_id),
+               to_epoch(phone_action_date, 'local', 'user_visits_daily.phone_action_date', telegram_user_id)
+        FROM user_visits_daily
+        -- Свёртка пересобирается из user_visits, поэтому дни с неразобранной датой просто не переносятся
+        WHERE to_epoch(visit_day, 'local', 'user_visits_daily.visit_day', telegram_user_id) IS NOT NULL
+    """)
+    cursor.execute("""
+        CREATE INDEX idx_user_visits_daily_day
+        ON user_visits_daily (visit_day);
+    """)
+
+    cursor.execute("""
+        UPDATE rollup_state SET value = to_epoch(value, 'local', 'rollup_state.value', name)
+        WHERE name = 'user_visits_daily' AND value IS NOT NULL;
+    """)
+
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS legacy_timestamps_skipped (
+        source TEXT NOT NULL,   -- Таблица и столбец, например user_visits.visit_date
+        row_key TEXT NOT NULL,  -- id строки (для свёртки — telegram_user_id)
+        value TEXT
+    );
+    """)
+    cursor.executemany(
+        "INSERT INTO legacy_timestamps_skipped (source, row_key, value) VALUES (?, ?, ?);",
+        [(source, key, value) for (source, key), value in skipped.items()]
+    )
+    for (source, key), value in skipped.items():
+        logging.warning(f"Миграция 7: дата {value!r} в {source} (строка {key}) не переведена, оставлен NULL")
+
+
+def _create_visit_partitions(cursor):
+    """
+    Реестр помесячных разделов user_visits: завершённые месяцы переносятся из основной таблицы
+    в отдельные файлы SQLite (см. db.rotate_user_visits), а здесь хранятся их границы.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS user_visits_partitions (
+        month_start INTEGER PRIMARY KEY,  -- Начало местного месяца, секунды Unix
+        month_end INTEGER NOT NULL,       -- Начало следующего месяца
+        row_count INTEGER NOT NULL DEFAULT 0,
+        sealed_at INTEGER                 -- Когда перенос месяца завершён (NULL — перенос ещё идёт)
+    );
+    """)
+
+
+def _create_upsert_keys(cursor):
+    """
+    Уникальные ключи, на которых построены UPSERT в db.save_appointment и db.save_user_visit:
+    - records: одна запись на пользователя и начало приёма (заявки без времени, NULL, не конфликтуют);
+    - user_visits: одна строка-отметка посещения (action_type IS NULL) на пользователя.
+    Дубли, которые могли появиться при гонке прежних SELECT-затем-INSERT, не удаляются бесследно:
+    - лишние записи records (кроме первой, её и обновлял прежний код) переносятся в records_duplicates;
+    - лишние отметки user_visits (кроме последней) остаются на месте с action_type 'visit_mark',
+      поэтому дневная свёртка, где они уже посчитаны, по-прежнему сходится с сырыми строками.
+    """
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS records_duplicates (
+        id INTEGER PRIMARY KEY,
+        telegram_user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        phone_number TEXT,
+        requested_at INTEGER,
+        appointment_at INTEGER,
+        comments TEXT,
+        status TEXT,
+        message_id INTEGER,
+        kept_id INTEGER NOT NULL  -- Запись, оставшаяся в records для того же пользователя и времени
+    );
+    """)
+    cursor.execute("""
+        INSERT INTO records_duplicates (
+            id, telegram_user_id, username, first_name, last_name, phone_number,
+            requested_at, appointment_at, comments, status, message_id, kept_id
+        )
+        SELECT r.id, r.telegram_user_id, r.username, r.first_name, r.last_name, r.phone_number,
+               r.requested_at, r.appointment_at, r.comments, r.status, r.message_id, k.kept_id
+        FROM records AS r
+        JOIN (
+            SELECT telegram_user_id, appointment_at, MIN(id) AS kept_id FROM records
+            WHERE appointment_at IS NOT NULL
+            GROUP BY telegram_user_id, appointment_at
+            HAVING COUNT(*) > 1
+        ) AS k USING (telegram_user_id, appointment_at)
+        WHERE r.id <> k.kept_id;
+    """)
+    moved = cursor.rowcount
+    if moved:
+        cursor.execute("SELECT group_concat(id, ', ') FROM records_duplicates;")
+        logging.warning(f"Миграция 9: дубли заявок перенесены в records_duplicates ({moved} шт., "
+                        f"id: {cursor.fetchone()[0]})")
+    cursor.execute("DELETE FROM records WHERE id IN (SELECT id FROM records_duplicates);")
+    cursor.execute("DROP INDEX IF EXISTS idx_records_user_appointment;")
+    cursor.execute("""
+        CREATE UNIQUE INDEX uq_records_user_appointment
+        ON records (telegram_user_id, appointment_at);
+    """)
+
+    cursor.execute("""
+        UPDATE user_visits SET action_type = 'visit_mark'
+        WHERE action_type IS NULL
+          AND id NOT IN (
+              SELECT MAX(id) FROM user_visits
+              WHERE action_type IS NULL
+              GROUP BY telegram_user_id
+          );
+    """)
+    if cursor.rowcount:
+        logging.warning(f"Миграция 9: повторные отметки посещения помечены action_type 'visit_mark' "
+                        f"({cursor.rowcount} шт.)")
+    cursor.execute("""
+        CREATE UNIQUE INDEX uq_user_visits_user_mark
+        ON user_visits (telegram_user_id)
+        WHERE action_type IS NULL;
+    """)
+
+
+def _add_reminded_offset(cursor):
+    """
+    Столбец reminded_offset: за сколько минут до приёма отправлено последнее успешное напоминание.
+    По нему ReminderScheduler после перезапуска не повторяет уже доставленные напоминания.
+    """
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(records);")]
+    if "reminded_offset" not in columns:
+        cursor.execute("ALTER TABLE records ADD COLUMN reminded_offset INTEGER;")
+
+
+# Список миграций: (версия, описание, функция). Новые миграции добавляются только в конец.
+MIGRATIONS = [
+    (1, "Базовые таблицы records и user_visits", _create_base_tables),
+    (2, "Индексы по пользователю, дате и статусу 'ожидает'", _create_lookup_indexes),
+    (3, "Индексируемый столбец appointment_start", _add_appointment_start),
+    (4, "Индекс по user_visits.visit_date", _create_visit_date_index),
+    (5, "Дневная свёртка user_visits", _create_user_visits_rollup),
+    (6, "Состояние диалогов по чатам", _create_chat_state),
+    (7, "Время в секундах Unix вместо строк дат", _convert_timestamps),
+    (8, "Реестр помесячных разделов user_visits", _create_visit_partitions),
+    (9, "Уникальные ключи для UPSERT в records и user_visits", _create_upsert_keys),
+    (10, "Отметка отправленных напоминаний в records", _add_reminded_offset),
+]
+
+
+def get_schema_version(conn):
+    """Возвращает текущую версию схемы базы."""
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+
+def run_migrations(conn):
+    """
+    Применяет к базе все миграции новее её текущей версии.
+    - Каждая миграция выполняется в BEGIN IMMEDIATE: параллельный процесс бота дождётся её окончания,
+      а читатели в режиме WAL продолжают работать без остановки.
+    - Версия перепроверяется внутри транзакции, чтобы два процесса не применили миграцию дважды.
+    """
+    for version, description, apply in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE;")
+            if get_schema_version(conn) < version:
+                apply(cursor)
+                cursor.execute(f"PRAGMA user_version = {version};")
+                logging.info(f"Миграция базы до версии {version}: {description}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    return get_schema_version(conn)
@@ -0,0 +1,339 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from telebot.apihelper import ApiTelegramException
+from metrics import metrics
+
+
+# Методы, которые Telegram ограничивает по чату (около одного сообщения в секунду)
+CHAT_LIMITED_METHODS = {
+    "send_message", "send_document", "send_photo", "edit_message_text", "edit_message_reply_markup"
+}
+# Все исходящие методы, которые идут через планировщик; chat_id у них — первый аргумент
+CHAT_METHODS = CHAT_LIMITED_METHODS | {"delete_message"}
+OUTBOUND_METHODS = CHAT_METHODS | {"answer_callback_query"}
+
+# Приоритеты очереди: меньше — раньше
+PRIORITY_ADMIN = 0
+PRIORITY_USER = 1
+
+
+def observe_api_call(method, started, failed=False):
+    """Время запроса к Bot API по методу (bot_telegram_api_seconds{method=...}) и ошибки, включая 429."""
+    metrics.histogram("bot_telegram_api_seconds", "Время запроса к Bot API", method=method).observe(
+        time.perf_counter() - started
+    )
+    if failed:
+        metrics.counter("bot_telegram_api_errors_total", "Ошибки запросов к Bot API", method=method).inc()
+
+
+def file_positions(args, kwargs):
+    """
+    Файловые аргументы вызова (документ в send_document и т.п.) с их позициями на момент постановки в очередь.
+    Неудачная попытка могла дочитать файл до конца, поэтому перед повтором его нужно перемотать (rewind_files).
+    """
+    positions = []
+    for value in itertools.chain(args, kwargs.values()):
+        if hasattr(value, "read"):
+            try:
+                positions.append((value, value.tell()))
+            except (OSError, ValueError):
+                positions.append((value, None))  # Поток без позиции повторно не прочитать
+    return positions
+
+
+def rewind_files(positions):
+    """Возвращает файлы к исходным позициям; False, если какой-то файл перемотать нельзя и повторять вызов нельзя."""
+    for file, position in positions:
+        if position is None:
+            return False
+        try:
+            file.seek(position)
+        except (OSError, ValueError):
+            return False
+    return True
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity про запас."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько секунд ждать до появления токена (0 — можно отправлять сейчас)."""
+        self._refill(now)
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class _Job:
+    __slots__ = ("priority", "seq", "limited", "method", "args", "kwargs", "files", "future", "attempts")
+
+    def __init__(self, priority, seq, limited, method, args, kwargs):
+        self.priority = priority
+        self.seq = seq
+        self.limited = limited
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.files = file_positions(args, kwargs)
+        self.future = Future()
+        self.attempts = 0
+
+
+class OutboundScheduler:
+    """
+    Планировщик исходящих запросов к Bot API.
+    - Общая корзина токенов держит суммарный поток на уровне global_rate (по умолчанию 30 в секунду),
+      корзины чатов — chat_rate сообщений в секунду на чат с небольшим запасом chat_burst.
+    - У каждого чата своя очередь: в полёте не больше одного запроса на чат, поэтому порядок
+      сообщений чата сохраняется. Из чатов, готовых к отправке, первым идёт тот, чей запрос важнее
+      (уведомления администратору), при равенстве — более ранний.
+    - Ответ 429 не теряет сообщение: запрос возвращается в начало очереди чата, и чат молчит retry_after секунд.
+      Сетевые ошибки повторяются с нарастающей паузой до max_retries раз.
+      Файлы из аргументов (send_document) перед повтором перематываются; если это невозможно, запрос не повторяется.
+    - Сами HTTP-запросы выполняет пул потоков, так что задержка сети не снижает пропускную способность.
+    """
+    def __init__(self, bot, global_rate=30, global_burst=1, chat_rate=1, chat_burst=3, workers=8, max_retries=5):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.workers = workers
+        self.stats = {"sent": 0, "failed": 0, "rate_limited": 0, "retried": 0, "max_queued": 0}
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._global_blocked_until = 0
+        self._queues = {}  # Ключ чата -> очередь его запросов; ключ есть, пока очередь не пуста или запрос в полёте
+        self._buckets = {}  # Ключ чата -> корзина токенов чата
+        self._blocked_until = {}  # Ключ чата -> момент, до которого чат ждёт после 429
+        self._in_flight = set()
+        self._ready = []  # Куча (приоритет, порядковый номер, ключ) чатов, готовых к отправке
+        self._waiting = []  # Куча (момент готовности, порядковый номер, ключ) чатов, ждущих токена
+        self._queued = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        self._executor = None
+        self._next_prune = 0
+
+    def start(self):
+        """Запускает поток планировщика и пул отправки (повторный вызов ничего не делает)."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbound-sender")
+            self._thread = threading.Thread(target=self._run, name="outbound-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=30):
+        """Отправляет всё, что уже стоит в очереди, и останавливает потоки."""
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is None:
+            return
+        thread.join(timeout)
+        self._executor.shutdown(wait=True)
+
+    def submit(self, method, args=(), kwargs=None, chat_id=None, priority=PRIORITY_USER):
+        """
+        Ставит вызов метода бота в очередь и возвращает Future с его результатом.
+        Запросы без chat_id (например, answer_callback_query) не упорядочиваются и не ограничиваются по чату.
+        """
+        if self._thread is None:
+            self.start()
+
+        with self._cond:
+            seq = next(self._seq)
+            key = chat_id if chat_id is not None else ("call", seq)
+            job = _Job(priority, seq, chat_id is not None and method in CHAT_LIMITED_METHODS,
+                       method, args, kwargs or {})
+
+            queue = self._queues.get(key)
+            if queue is None:
+                queue = self._queues[key] = deque()
+                queue.append(job)
+                self._schedule(key, time.monotonic())
+            else:
+                queue.append(job)
+            self._queued += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], self._queued)
+            self._cond.notify_all()
+        return job.future
+
+    def _bucket(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _schedule(self, key, now):
+        """Кладёт чат в кучу готовых или ожидающих — по тому, когда его первый запрос можно отправить."""
+        job = self._queues[key][0]
+        delay = self._blocked_until.get(key, 0) - now
+        if job.limited:
+            delay = max(delay, self._bucket(key).delay(now))
+        if delay > 0:
+            heapq.heappush(self._waiting, (now + delay, job.seq, key))
+        else:
+            heapq.heappush(self._ready, (job.priority, job.seq, key))
+
+    def _prune_buckets(self, now):
+        """Раз в минуту забывает корзины и блокировки чатов, которым нечего отправлять."""
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 60
+        for key in [key for key, bucket in self._buckets.items() if key not in self._queues and bucket.is_full(now)]:
+            del self._buckets[key]
+        for key in [key for key, until in self._blocked_until.items() if until <= now]:
+            del self._blocked_until[key]
+
+    def _next_job(self):
+        """Ждёт, пока какой-то чат готов и есть общий токен; возвращает (ключ, запрос) или None при остановке."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._waiting and self._waiting[0][0] <= now:
+                    _, _, key = heapq.heappop(self._waiting)
+                    self._schedule(key, now)
+
+                if self._ready:
+                    timeout = max(self._global_bucket.delay(now), self._global_blocked_until - now)
+                    if timeout <= 0:
+                        break
+                elif self._stopping and not self._queues:
+                    return None
+                else:
+                    timeout = self._waiting[0][0] - now if self._waiting else None
+                self._cond.wait(timeout)
+
+            _, _, key = heapq.heappop(self._ready)
+            job = self._queues[key].popleft()
+            self._in_flight.add(key)
+            self._global_bucket.take(now)
+            if job.limited:
+                self._bucket(key).take(now)
+            self._prune_buckets(now)
+            return key, job
+
+    def _run(self):
+        while True:
+            next_job = self._next_job()
+            if next_job is None:
+                return
+            self._executor.submit(self._send, *next_job)
+
+    def _send(self, key, job):
+        retry_at = None
+        started = time.perf_counter()
+        try:
+            result = getattr(self.bot, job.method)(*job.args, **job.kwargs)
+        except ApiTelegramException as e:
+            observe_api_call(job.method, started, failed=True)
+            if e.error_code == 429 and job.attempts < self.max_retries and rewind_files(job.files):
+                retry_after = (e.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                retry_at = time.monotonic() + retry_after
+                self._count("rate_limited")
+                logging.warning(f"Telegram ограничил отправку ({job.method}), повтор через {retry_after} с")
+            else:
+                job.future.set_exception(e)
+                self._count("failed")
+        except OSError as e:
+            observe_api_call(job.method, started, failed=True)
+            # Ошибки сети (requests.RequestException наследует OSError)
+            if job.attempts < self.max_retries and rewind_files(job.files):
+                retry_at = time.monotonic() + min(0.5 * 2 ** job.attempts, 10)
+                self._count("retried")
+            else:
+                logging.error(f"Не удалось выполнить {job.method}: {e}")
+                job.future.set_exception(e)
+                self._count("failed")
+        except Exception as e:
+            observe_api_call(job.method, started, failed=True)
+            job.future.set_exception(e)
+            self._count("failed")
+        else:
+            observe_api_call(job.method, started)
+            job.future.set_result(result)
+            self._count("sent")
+
+        with self._cond:
+            self._in_flight.discard(key)
+            queue = self._queues[key]
+            if retry_at is not None:
+                job.attempts += 1
+                queue.appendleft(job)
+                if isinstance(key, tuple):
+                    # 429 без привязки к чату тормозит все отправки
+                    self._global_blocked_until = max(self._global_blocked_until, retry_at)
+                else:
+                    self._blocked_until[key] = retry_at
+            else:
+                self._queued -= 1
+
+            if queue:
+                self._schedule(key, time.monotonic())
+            else:
+                del self._queues[key]
+            self._cond.notify_all()
+
+    def _count(self, name):
+        with self._cond:
+            self.stats[name] += 1
+
+
+class RateLimitedBot:
+    """
+    Обёртка над TeleBot: исходящие методы (OUTBOUND_METHODS) идут через OutboundScheduler,
+    остальное (декораторы обработчиков, get_updates, set_webhook и т.д.) — напрямую к боту.
+    Вызов send_message и подобных по-прежнему синхронный и возвращает результат Bot API,
+    поэтому обработчики не меняются. Для отправки без ожидания есть submit(), возвращающий Future.
+    """
+    def __init__(self, bot, scheduler, admin_chat_id=None):
+        self.bot = bot
+        self.scheduler = scheduler
+        self.admin_chat_id = admin_chat_id
+
+    def __getattr__(self, name):
+        attr = getattr(self.bot, name)
+        if name not in OUTBOUND_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            return self.submit(name, *args, **kwargs).result()
+        return call
+
+    def _route(self, method, args, kwargs, priority=None):
+        """Возвращает (chat_id, приоритет) вызова; сообщения администратору по умолчанию идут первыми."""
+        chat_id = None
+        if method in CHAT_METHODS:
+            chat_id = kwargs["chat_id"] if "chat_id" in kwargs else args[0]
+        if priority is None:
+            priority = PRIORITY_ADMIN if chat_id is not None and str(chat_id) == str(self.admin_chat_id) else PRIORITY_USER
+        return chat_id, priority
+
+    def submit(self, method, *args, priority=None, **kwargs):
+        """Ставит исходящий вызов в очередь и возвращает Future с его результатом."""
+        chat_id, priority = self._route(method, args, kwargs, priority)
+        return self.scheduler.submit(method, args, kwargs, chat_id=chat_id, priority=priority)
@@ -0,0 +1,195 @@
+import functools
+import heapq
+import itertools
+import logging
+import threading
+import time
+import clock
+from db import get_upcoming_reminders, mark_reminder_sent
+
+
+def _format_offset(minutes):
+    """Человекочитаемое «через сколько» для текста напоминания."""
+    if minutes % 1440 == 0:
+        days = minutes // 1440
+        return "завтра" if days == 1 else f"через {days} дн."
+    if minutes % 60 == 0:
+        return f"через {minutes // 60} ч."
+    return f"через {minutes} мин."
+
+
+class ReminderScheduler:
+    """
+    Напоминания клиентам о подтверждённых записях.
+    - Все будущие напоминания лежат в min-куче (время отправки, ...); один поток спит до ближайшего
+      и просыпается только по нему или при изменении расписания — без опроса базы раз в минуту.
+    - База читается один раз при старте (load); дальше расписание меняют schedule()/cancel()
+      в местах, где запись подтверждается или отклоняется.
+    - Отмена и перенос не ищут элементы в куче: у записи в словаре хранится номер текущего расписания,
+      а элементы со старым номером просто пропускаются, когда доходят до вершины.
+    - Доставленное напоминание отмечается в records.reminded_offset, и load() после перезапуска
+      его пропускает; недоставленные, опоздавшие не более чем на grace секунд, отправляются заново.
+      Более старые пропущенные напоминания не отправляются.
+    - Отметка в базе и счётчик sent обновляются по результату вызова Bot API, а не по постановке в очередь.
+      send() возвращает Future; его колбэк лишь передаёт результат потоку напоминаний, и тот пишет в базу сам,
+      не занимая поток отправки.
+    """
+    def __init__(self, send, offsets, grace=600):
+        self.send = send  # Вызывается как send(chat_id, text) и возвращает Future с результатом
+        self.offsets = sorted(offsets, reverse=True)  # Минуты до начала приёма
+        self.grace = grace
+        self.stats = {"scheduled": 0, "sent": 0, "skipped": 0, "failed": 0}
+        self._heap = []  # (время отправки, номер расписания, ID записи, минут до начала)
+        self._appointments = {}  # ID записи -> [номер расписания, ID клиента, начало приёма (секунды Unix), осталось напоминаний]
+        self._seq = itertools.count()
+        self._delivered = []  # (ID записи, начало приёма, минут до начала) — ждут отметки в базе
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        """Загружает предстоящие записи и запускает поток напоминаний."""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+        self.load()
+        with self._cond:
+            self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None:
+            thread.join()
+        self._mark_delivered()
+
+    def load(self):
+        """Заполняет кучу подтверждёнными записями, которые ещё не начались, без уже доставленных напоминаний."""
+        appointments = get_upcoming_reminders(clock.now())
+        for record_id, user_id, appointment_at, reminded_offset in appointments:
+            self.schedule(record_id, user_id, appointment_at, reminded_offset)
+        logging.info(f"Загружено напоминаний для {len(appointments)} записей")
+
+    def schedule(self, record_id, user_id, appointment_at, reminded_offset=None):
+        """
+        Ставит (или переносит) напоминания по записи. appointment_at — начало приёма в секундах Unix.
+        reminded_offset — последнее доставленное напоминание (минут до начала): оно и более ранние не ставятся.
+        """
+        start = appointment_at
+        now = time.time()
+        due = [
+            (start - minutes * 60, minutes) for minutes in self.offsets
+            if start - minutes * 60 >= now - self.grace and (reminded_offset is None or minutes < reminded_offset)
+        ]
+        with self._cond:
+            self._appointments.pop(record_id, None)
+            if not due:
+                return
+            generation = next(self._seq)
+            self._appointments[record_id] = [generation, user_id, appointment_at, len(due)]
+            for fire_at, minutes in due:
+                heapq.heappush(self._heap, (fire_at, generation, record_id, minutes))
+            self.stats["scheduled"] += len(due)
+            # Поток мог уснуть до более позднего напоминания
+            self._cond.notify_all()
+
+    def cancel(self, record_id):
+        """Отменяет напоминания по записи (элементы кучи станут устаревшими)."""
+        with self._cond:
+            self._appointments.pop(record_id, None)
+
+    def pending(self):
+        """Количество элементов в куче, включая ещё не пропущенные устаревшие."""
+        with self._cond:
+            return len(self._heap)
+
+    def _next_due(self):
+        """
+        Спит до ближайшего напоминания и возвращает (напоминание или None, доставленные с прошлого вызова).
+        Напоминание None без доставленных — остановка.
+        """
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None, []
+                if self._delivered:
+                    delivered, self._delivered = self._delivered, []
+                    return None, delivered
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+
+                fire_at, generation, record_id, minutes = self._heap[0]
+                current = self._appointments.get(record_id)
+                if current is None or current[0] != generation:
+                    # Запись отменена или перенесена
+                    heapq.heappop(self._heap)
+                    self.stats["skipped"] += 1
+                    continue
+
+                delay = fire_at - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                current[3] -= 1
+                if not current[3]:
+                    # Последнее напоминание по записи — она больше не нужна в словаре
+                    del self._appointments[record_id]
+                return (record_id, current[1], current[2], minutes), []
+
+    def _run(self):
+        while True:
+            due, delivered = self._next_due()
+            if delivered:
+                self._mark_delivered(delivered)
+                continue
+            if due is None:
+                return
+            record_id, user_id, appointment_at, minutes = due
+            start = clock.to_local(appointment_at)
+            try:
+                future = self.send(
+                    user_id,
+                    f"⏰ Напоминание: {_format_offset(minutes)} у вас запись!\n\n"
+                    f"📅 Дата: {start.strftime('%d.%m.%y')}\n"
+                    f"⏰ Время: {start.strftime('%H:%M')}\n\n"
+                    "Если планы изменились, пожалуйста, сообщите нам заранее. 😊"
+                )
+            except Exception as e:
+                self._failed(user_id, e)
+                continue
+            future.add_done_callback(functools.partial(self._on_sent, record_id, user_id, appointment_at, minutes))
+
+    def _failed(self, user_id, error):
+        with self._cond:
+            self.stats["failed"] += 1
+        logging.error(f"Не удалось отправить напоминание клиенту {user_id}: {error}")
+
+    def _on_sent(self, record_id, user_id, appointment_at, minutes, future):
+        """Колбэк Future отправки: выполняется в потоке отправки, поэтому только передаёт результат дальше."""
+        try:
+            future.result()
+        except Exception as e:
+            self._failed(user_id, e)
+            return
+        with self._cond:
+            self.stats["sent"] += 1
+            self._delivered.append((record_id, appointment_at, minutes))
+            self._cond.notify_all()
+
+    def _mark_delivered(self, delivered=None):
+        """Записывает в базу отметки доставленных напоминаний."""
+        if delivered is None:
+            with self._cond:
+                delivered, self._delivered = self._delivered, []
+        for record_id, appointment_at, minutes in delivered:
+            try:
+                mark_reminder_sent(record_id, appointment_at, minutes)
+            except Exception as e:
+                logging.error(f"Не удалось отметить напоминание по записи №{record_id}: {e}")
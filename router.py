@@ -0,0 +1,167 @@
+import logging
+
+
+class Router:
+    """
+    Маршрутизация обновлений по таблицам вместо цепочки фильтров TeleBot.
+    - Текст кнопок и команды лежат в словарях: обработчик находится одним поиском, сколько бы экранов ни было.
+    - callback_data ищется сначала целиком (confirm_booking), затем по префиксу до первого «_»
+      (record_15 -> «record»). Остаток после префикса разбирается в аргументы заданных типов.
+    - Проверки состояния чата (незавершённый шаг диалога) выполняются до таблиц в порядке регистрации,
+      а текст, не найденный в таблицах, получает fallback.
+    Маршрутизатор не зависит от сети: route_message/route_callback можно вызывать с любыми объектами,
+    у которых есть нужные поля.
+    Если передан реестр метрик (metrics.MetricsRegistry), каждый обработчик при регистрации оборачивается
+    замером времени и счётчиком ошибок с меткой handler=<имя функции>; в модуле остаётся исходная функция.
+    """
+    def __init__(self, registry=None):
+        self.registry = registry
+        self._guards = []  # [(условие, обработчик)] для текстовых сообщений
+        self._commands = {}  # Имя команды без «/» -> обработчик
+        self._texts = {}  # Текст сообщения -> обработчик
+        self._content_types = {}  # Тип содержимого (contact и т.п.) -> обработчик
+        self._callbacks = {}  # callback_data целиком -> обработчик
+        self._prefixes = {}  # Префикс callback_data -> (типы аргументов, обработчик)
+        self._fallback = None
+
+    def _instrument(self, handler):
+        if self.registry is None:
+            return handler
+        return self.registry.timed(
+            "bot_handler_seconds", "bot_handler_errors_total", "Время обработчика", handler=handler.__name__
+        )(handler)
+
+    def guard(self, predicate):
+        """Регистрирует обработчик текста, который срабатывает раньше таблиц, если predicate(message) истинно."""
+        def decorator(handler):
+            self._guards.append((predicate, self._instrument(handler)))
+            return handler
+        return decorator
+
+    def command(self, *names):
+        def decorator(handler):
+            instrumented = self._instrument(handler)
+            for name in names:
+                self._register(self._commands, name, instrumented)
+            return handler
+        return decorator
+
+    def text(self, *texts):
+        def decorator(handler):
+            instrumented = self._instrument(handler)
+            for text in texts:
+                self._register(self._texts, text, instrumented)
+            return handler
+        return decorator
+
+    def content(self, *content_types):
+        """Обработчик нетекстовых сообщений (например, contact)."""
+        def decorator(handler):
+            instrumented = self._instrument(handler)
+            for content_type in content_types:
+                self._register(self._content_types, content_type, instrumented)
+            return handler
+        return decorator
+
+    def callback(self, *data):
+        """Обработчик callback_data, совпадающей целиком."""
+        def decorator(handler):
+            instrumented = self._instrument(handler)
+            for value in data:
+                self._register(self._callbacks, value, instrumented)
+            return handler
+        return decorator
+
+    def callback_prefix(self, prefix, *arg_types):
+        """
+        Обработчик callback_data вида '<prefix>_<аргументы>'. Если заданы arg_types, остаток делится по «_»
+        на столько частей и каждая приводится к своему типу (последняя забирает всё оставшееся):
+        callback_prefix("record", int) вызовет handler(call, 15) для 'record_15'.
+        Без arg_types обработчик получает только call и разбирает данные сам.
+        """
+        if "_" in prefix:
+            raise ValueError(f"Префикс callback_data не может содержать '_': {prefix}")
+
+        def decorator(handler):
+            self._register(self._prefixes, prefix, (arg_types, self._instrument(handler)))
+            return handler
+        return decorator
+
+    def fallback(self, handler):
+        """Обработчик текста, для которого не нашлось ни команды, ни кнопки."""
+        self._fallback = self._instrument(handler)
+        return handler
+
+    @staticmethod
+    def _register(table, key, value):
+        if key in table:
+            raise ValueError(f"Маршрут уже зарегистрирован: {key!r}")
+        table[key] = value
+
+    @property
+    def content_types(self):
+        """Типы сообщений, которые нужно получать от TeleBot."""
+        return ["text", *self._content_types]
+
+    def resolve_message(self, message):
+        """Возвращает обработчик сообщения или None."""
+        if message.content_type != "text":
+            return self._content_types.get(message.content_type)
+
+        for predicate, handler in self._guards:
+            if predicate(message):
+                return handler
+
+        text = message.text or ""
+        if text.startswith("/"):
+            # '/start@bot_name payload' -> 'start'
+            name = text[1:].split(maxsplit=1)[0].split("@", 1)[0] if len(text) > 1 else ""
+            handler = self._commands.get(name)
+            if handler is not None:
+                return handler
+        return self._texts.get(text, self._fallback)
+
+    def resolve_callback(self, data):
+        """Возвращает (обработчик, аргументы) для callback_data или None, если маршрута нет или аргументы не разобрались."""
+        handler = self._callbacks.get(data)
+        if handler is not None:
+            return handler, ()
+
+        prefix, sep, rest = (data or "").partition("_")
+        route = self._prefixes.get(prefix) if sep else None
+        if route is None:
+            return None
+        arg_types, handler = route
+        if not arg_types:
+            return handler, ()
+
+        parts = rest.split("_", len(arg_types) - 1)
+        if len(parts) != len(arg_types):
+            return None
+        try:
+            return handler, tuple(arg_type(part) for arg_type, part in zip(arg_types, parts))
+        except ValueError:
+            return None
+
+    def route_message(self, message):
+        """Вызывает обработчик сообщения; возвращает False, если маршрута нет."""
+        handler = self.resolve_message(message)
+        if handler is None:
+            return False
+        handler(message)
+        return True
+
+    def route_callback(self, call):
+        """Вызывает обработчик нажатия инлайн-кнопки; возвращает False, если маршрута нет."""
+        route = self.resolve_callback(call.data)
+        if route is None:
+            logging.warning(f"Нет обработчика для callback_data: {call.data!r}")
+            return False
+        handler, args = route
+        handler(call, *args)
+        return True
+
+    def install(self, bot):
+        """Регистрирует в TeleBot по одному обработчику сообщений и нажатий, передающих всё маршрутизатору."""
+        bot.message_handler(func=lambda message: True, content_types=self.content_types)(self.route_message)
+        bot.callback_query_handler(func=lambda call: True)(self.route_callback)
@@ -0,0 +1,117 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+import config
+from db import save_chat_state, load_chat_state, delete_chat_state, purge_chat_states
+
+
+class ChatStateStore:
+    """
+    Состояние диалогов по чатам: текущий шаг записи, выбранные дата и время, раздел статистики и т.п.
+    - У каждого чата свой небольшой словарь значений, поэтому параллельные сессии разных администраторов
+      не перетирают друг друга (раньше всё хранилось в атрибутах одного экземпляра обработчика).
+    - Состояние живёт ttl секунд с последнего изменения; истёкшие и самые старые сверх max_chats вытесняются,
+      так что память долго работающего процесса ограничена.
+    - При persistent=True состояние дублируется в таблицу chat_state и переживает перезапуск бота.
+      Значения должны сериализоваться в JSON (даты храним строками ISO).
+    """
+    def __init__(self, ttl=1800, max_chats=10000, persistent=False):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.persistent = persistent
+        self.stats = {"expired": 0, "evicted": 0}
+        self._states = OrderedDict()  # chat_id -> (истекает_в, значения); порядок — от давно изменённых к свежим
+        self._lock = threading.Lock()
+        self._next_purge = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._states)
+
+    def get(self, chat_id, key=None, default=None):
+        """Возвращает копию состояния чата (или одно значение key), если оно не истекло."""
+        now = time.time()
+        with self._lock:
+            entry = self._states.get(chat_id)
+            if entry is not None and entry[0] <= now:
+                del self._states[chat_id]
+                self.stats["expired"] += 1
+                entry = None
+
+        if entry is None and self.persistent:
+            entry = self._load(chat_id, now)
+
+        if entry is None:
+            return default if key is not None else {}
+        if key is not None:
+            return entry[1].get(key, default)
+        return dict(entry[1])
+
+    def update(self, chat_id, **values):
+        """Дополняет состояние чата значениями и продлевает его срок жизни. Значение None удаляет ключ."""
+        now = time.time()
+        current = self.get(chat_id)
+        current.update(values)
+        current = {key: value for key, value in current.items() if value is not None}
+        if not current:
+            self.clear(chat_id)
+            return
+
+        expires_at = now + self.ttl
+        with self._lock:
+            self._states[chat_id] = (expires_at, current)
+            self._states.move_to_end(chat_id)
+            self._evict(now)
+
+        if self.persistent:
+            save_chat_state(chat_id, json.dumps(current, ensure_ascii=False), expires_at)
+            self._purge_persistent(now)
+
+    def clear(self, chat_id):
+        """Завершает диалог чата: удаляет всё его состояние."""
+        with self._lock:
+            self._states.pop(chat_id, None)
+        if self.persistent:
+            delete_chat_state(chat_id)
+
+    def _load(self, chat_id, now):
+        row = load_chat_state(chat_id, now)
+        if row is None:
+            return None
+        entry = (row[1], json.loads(row[0]))
+        with self._lock:
+            self._states[chat_id] = entry
+            self._states.move_to_end(chat_id)
+            self._evict(now)
+        return entry
+
+    def _evict(self, now):
+        """
+        Вытесняет истёкшие состояния и самые давние сверх max_chats.
+        Срок жизни у всех одинаковый, поэтому истёкшие всегда в начале OrderedDict — проверка стоит O(1) на вызов.
+        """
+        while self._states:
+            chat_id, (expires_at, _) = next(iter(self._states.items()))
+            if expires_at <= now:
+                self.stats["expired"] += 1
+            elif len(self._states) > self.max_chats:
+                self.stats["evicted"] += 1
+            else:
+                break
+            del self._states[chat_id]
+
+    def _purge_persistent(self, now):
+        """Не чаще раза в десятую долю ttl удаляет из базы истёкшие состояния."""
+        if now < self._next_purge:
+            return
+        self._next_purge = now + self.ttl / 10
+        purge_chat_states(now)
+
+
+# Общее хранилище состояний диалогов для всех обработчиков
+chat_states = ChatStateStore(
+    ttl=config.CHAT_STATE_TTL,
+    max_chats=config.CHAT_STATE_MAX_CHATS,
+    persistent=config.CHAT_STATE_PERSISTENT
+)
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """Пустая база актуальной схемы во временном каталоге; после теста соединения закрываются."""
+    previous = db.DB_NAME
+    db.DB_NAME = str(tmp_path / "test.db")
+    db.create_tables()
+    try:
+        yield db
+    finally:
+        db.close_connections()
+        db.DB_NAME = previous
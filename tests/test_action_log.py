@@ -0,0 +1,48 @@
+import sqlite3
+
+import handlers.Logger as logger_module
+from handlers.Logger import ActionLogWriter
+
+
+def test_writer_survives_unexpected_error(temp_db, monkeypatch):
+    writes = []
+
+    def log_user_actions(batch):
+        if not writes:
+            writes.append(None)
+            raise TypeError("некорректное событие")
+        writes.append(batch)
+
+    monkeypatch.setattr(logger_module, "log_user_actions", log_user_actions)
+    writer = ActionLogWriter(flush_interval=0.01)
+    try:
+        writer.enqueue(1, "u", "U", None, "menu_click")
+        writer.flush()
+        writer.enqueue(2, "u", "U", None, "menu_click")
+        writer.flush()
+        assert writer._thread.is_alive()
+    finally:
+        writer.stop()
+
+    assert writer.stats["dropped"] == 1
+    assert writer.stats["written"] == 1
+    assert [event[0] for event in writes[1]] == [2]
+
+
+def test_rollup_failure_does_not_rewrite_batch(temp_db, monkeypatch):
+    def rollup_user_visits_on_new_day():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(logger_module, "rollup_user_visits_on_new_day", rollup_user_visits_on_new_day)
+    writer = ActionLogWriter(flush_interval=0.01)
+    try:
+        writer.enqueue(1, "u", "U", None, "menu_click")
+        writer.flush()
+    finally:
+        writer.stop()
+
+    with temp_db.db_cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM user_visits WHERE telegram_user_id = 1;")
+        assert cursor.fetchone()[0] == 1
+    assert writer.stats["written"] == 1
+    assert writer.stats["delayed"] == 0
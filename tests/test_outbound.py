@@ -0,0 +1,103 @@
+import tempfile
+import threading
+import time
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from outbound import OutboundScheduler, RateLimitedBot
+
+
+class FakeBot:
+    """Записывает вызовы; первые fail_times вызовов метода fail_method завершаются ответом 429."""
+    def __init__(self, delay=0.0, fail_method=None, fail_times=0):
+        self.delay = delay
+        self.fail_method = fail_method
+        self.fail_times = fail_times
+        self.calls = []
+        self.uploads = []
+        self._lock = threading.Lock()
+
+    def _call(self, method, chat_id, payload):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls.append((method, chat_id, payload))
+            if method == self.fail_method and self.fail_times:
+                self.fail_times -= 1
+                raise ApiTelegramException(method, None, {
+                    "error_code": 429, "description": "Too Many Requests", "parameters": {"retry_after": 0.05}
+                })
+        return payload
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._call("send_message", chat_id, text)
+
+    def delete_message(self, chat_id, message_id):
+        return self._call("delete_message", chat_id, message_id)
+
+    def send_document(self, chat_id, document, **kwargs):
+        self.uploads.append(document.read())
+        return self._call("send_document", chat_id, None)
+
+
+@pytest.fixture
+def make_bot():
+    schedulers = []
+
+    def make(fake, **options):
+        options.setdefault("chat_rate", 1000)
+        options.setdefault("chat_burst", 1000)
+        scheduler = OutboundScheduler(fake, global_rate=1000, global_burst=1000, workers=4, **options)
+        schedulers.append(scheduler)
+        return RateLimitedBot(fake, scheduler, admin_chat_id=1)
+
+    yield make
+    for scheduler in schedulers:
+        scheduler.stop()
+
+
+def test_sync_call_returns_api_result(make_bot):
+    bot = make_bot(FakeBot())
+    assert bot.send_message(10, "привет") == "привет"
+
+
+def test_messages_of_one_chat_keep_order(make_bot):
+    fake = FakeBot(delay=0.005)
+    bot = make_bot(fake)
+    futures = [bot.submit("send_message", chat_id, f"{chat_id}:{n}") for n in range(10) for chat_id in (10, 20)]
+    for future in futures:
+        future.result(timeout=5)
+
+    for chat_id in (10, 20):
+        sent = [payload for _, chat, payload in fake.calls if chat == chat_id]
+        assert sent == [f"{chat_id}:{n}" for n in range(10)]
+
+
+def test_rate_limited_message_is_retried_in_order(make_bot):
+    fake = FakeBot(fail_method="send_message", fail_times=1)
+    bot = make_bot(fake)
+    first = bot.submit("send_message", 10, "первое")
+    second = bot.submit("send_message", 10, "второе")
+    assert (first.result(timeout=5), second.result(timeout=5)) == ("первое", "второе")
+    assert [payload for _, _, payload in fake.calls] == ["первое", "первое", "второе"]
+    assert bot.scheduler.stats["rate_limited"] == 1
+
+
+def test_retried_document_is_uploaded_from_the_start(make_bot):
+    fake = FakeBot(fail_method="send_document", fail_times=1)
+    bot = make_bot(fake)
+    with tempfile.SpooledTemporaryFile() as file:
+        file.write(b"id;name\n1;Anna\n")
+        file.seek(0)
+        bot.send_document(10, file, visible_file_name="export.csv")
+    assert fake.uploads == [b"id;name\n1;Anna\n"] * 2
+
+
+def test_chat_rate_limit_spaces_messages(make_bot):
+    fake = FakeBot()
+    bot = make_bot(fake, chat_rate=20, chat_burst=1)
+    started = time.monotonic()
+    for future in [bot.submit("send_message", 10, str(n)) for n in range(4)]:
+        future.result(timeout=5)
+    # Первое сообщение уходит сразу, остальные три — не чаще 20 в секунду
+    assert time.monotonic() - started >= 3 / 20 * 0.9
@@ -0,0 +1,21 @@
+"""Запросы статистики и записей должны читать user_visits и records поиском по индексу, а не сканированием."""
+import pytest
+
+from benchmarks.query_plans import CHECKED_CALLS, capture_statements, find_full_scans
+
+
+@pytest.mark.parametrize(
+    "name, args, kwargs", CHECKED_CALLS,
+    ids=[f"{name}-{'-'.join(kwargs) or 'default'}" for name, _, kwargs in CHECKED_CALLS]
+)
+def test_uses_index(temp_db, name, args, kwargs):
+    temp_db.rollup_user_visits()  # Как в работающем боте: завершённые дни уже свёрнуты
+    statements = capture_statements(getattr(temp_db, name), args, kwargs)
+    assert statements, f"{name} не выполнил ни одного SELECT"
+    for sql in statements:
+        assert not find_full_scans(sql), sql
+
+
+def test_full_scan_is_detected(temp_db):
+    # Функция над столбцом в условии отключает индекс — проверка должна это заметить
+    assert find_full_scans("SELECT id FROM user_visits WHERE date(visited_at, 'unixepoch') = '2025-01-01'")
@@ -0,0 +1,66 @@
+import time
+from concurrent.futures import Future
+
+import clock
+from reminders import ReminderScheduler
+
+
+def book(db, minutes_ahead):
+    """Подтверждённая запись, начинающаяся через minutes_ahead минут (с точностью до минуты)."""
+    start = clock.to_local((int(time.time()) // 60 + minutes_ahead) * 60)
+    return db.save_appointment(1, "u", "U", None, "+7", start.strftime("%Y-%m-%d"), start.strftime("%H:%M"),
+                               clock.now(), None, "Записан")
+
+
+def run_due(db, send):
+    """Запускает напоминания, дожидается отправки просроченных и останавливает поток."""
+    scheduler = ReminderScheduler(send, offsets=[180, 1])
+    scheduler.start()
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and scheduler.pending() > 1:
+        time.sleep(0.01)
+    time.sleep(0.05)
+    scheduler.stop()
+    return scheduler
+
+
+def sent_future(error=None):
+    future = Future()
+    if error is None:
+        future.set_result(True)
+    else:
+        future.set_exception(error)
+    return future
+
+
+def test_restart_does_not_repeat_delivered_reminder(temp_db):
+    book(temp_db, 180)
+    texts = []
+
+    first = run_due(temp_db, lambda chat_id, text: texts.append(text) or sent_future())
+    second = run_due(temp_db, lambda chat_id, text: texts.append(text) or sent_future())
+
+    assert len(texts) == 1
+    assert first.stats["sent"] == 1
+    assert second.stats["sent"] == 0
+
+
+def test_failed_delivery_is_counted_and_retried_after_restart(temp_db):
+    book(temp_db, 180)
+
+    failed = run_due(temp_db, lambda chat_id, text: sent_future(RuntimeError("Bot API недоступен")))
+    retried = run_due(temp_db, lambda chat_id, text: sent_future())
+
+    assert (failed.stats["sent"], failed.stats["failed"]) == (0, 1)
+    assert retried.stats["sent"] == 1
+
+
+def test_reschedule_resets_delivered_mark(temp_db):
+    record_id = book(temp_db, 180)
+    run_due(temp_db, lambda chat_id, text: sent_future())
+
+    start = clock.to_local((int(time.time()) // 60 + 181) * 60)
+    temp_db.update_appointment(record_id, start.strftime("%Y-%m-%d"), start.strftime("%H:%M"), "Записан")
+    with temp_db.db_cursor() as cursor:
+        cursor.execute("SELECT reminded_offset FROM records WHERE id = ?;", (record_id,))
+        assert cursor.fetchone()[0] is None
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+
+from router import Router
+
+
+def message(text=None, content_type="text"):
+    return SimpleNamespace(text=text, content_type=content_type)
+
+
+def call(data):
+    return SimpleNamespace(data=data)
+
+
+@pytest.fixture
+def router():
+    router = Router()
+    router.seen = []
+
+    @router.command("start")
+    def handle_start(message):
+        router.seen.append(("start", message.text))
+
+    @router.text("✨ Виды процедур")
+    def handle_procedures(message):
+        router.seen.append(("procedures",))
+
+    @router.content("contact")
+    def handle_contact(message):
+        router.seen.append(("contact",))
+
+    @router.callback("confirm_booking", "cancel_booking")
+    def handle_confirmation(call):
+        router.seen.append(("confirmation", call.data))
+
+    @router.callback_prefix("record", int)
+    def handle_record(call, record_id):
+        router.seen.append(("record", record_id))
+
+    @router.callback_prefix("export", str, str)
+    def handle_export(call, fmt, target):
+        router.seen.append(("export", fmt, target))
+
+    @router.fallback
+    def handle_text(message):
+        router.seen.append(("fallback", message.text))
+
+    return router
+
+
+def test_command_ignores_bot_name_and_payload(router):
+    assert router.route_message(message("/start@time_bot payload"))
+    assert router.seen == [("start", "/start@time_bot payload")]
+
+
+def test_text_and_content_type(router):
+    router.route_message(message("✨ Виды процедур"))
+    router.route_message(message(content_type="contact"))
+    assert router.seen == [("procedures",), ("contact",)]
+
+
+def test_unknown_text_goes_to_fallback(router):
+    router.route_message(message("привет"))
+    router.route_message(message("/unknown"))
+    assert router.seen == [("fallback", "привет"), ("fallback", "/unknown")]
+
+
+def test_guard_runs_before_tables(router):
+    @router.guard(lambda message: message.text != "/start")
+    def handle_step(message):
+        router.seen.append(("step", message.text))
+
+    router.route_message(message("✨ Виды процедур"))
+    router.route_message(message("/start"))
+    assert router.seen == [("step", "✨ Виды процедур"), ("start", "/start")]
+
+
+def test_exact_callback_wins_over_prefix(router):
+    router.route_callback(call("cancel_booking"))
+    assert router.seen == [("confirmation", "cancel_booking")]
+
+
+def test_prefix_arguments_are_converted(router):
+    router.route_callback(call("record_15"))
+    router.route_callback(call("export_csv_rec_20250101_7_3"))
+    assert router.seen == [("record", 15), ("export", "csv", "rec_20250101_7_3")]
+
+
+@pytest.mark.parametrize("data", ["record_abc", "record", "unknown_1", "", None])
+def test_unroutable_callback(router, data):
+    assert not router.route_callback(call(data))
+    assert router.seen == []
+
+
+def test_duplicate_route_is_rejected(router):
+    with pytest.raises(ValueError):
+        router.text("✨ Виды процедур")(lambda message: None)
+    with pytest.raises(ValueError):
+        router.callback_prefix("bad_prefix")
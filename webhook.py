@@ -0,0 +1,88 @@
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telebot import types
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Очередь входящих соединений: значение по умолчанию (5) не выдерживает всплесков доставок
+    request_queue_size = 128
+
+
+class WebhookServer:
+    """
+    Приём обновлений Telegram через webhook.
+    - HTTP-обработчик только проверяет секретный токен, разбирает обновление и передаёт его диспетчеру,
+      поэтому Telegram получает ответ сразу, не дожидаясь работы обработчиков бота.
+    - Обработку выполняет ChatDispatcher: чаты параллельно, обновления одного чата по порядку.
+    - Если очередь чата или диспетчера переполнена, отвечаем 503 — Telegram повторит доставку позже.
+    """
+    def __init__(self, dispatcher, host, port, path, secret_token=""):
+        self.dispatcher = dispatcher
+        self.path = path
+        self.secret_token = secret_token
+        self.stats = {"received": 0, "rejected": 0, "overflow": 0}
+        self._stats_lock = threading.Lock()
+        self.httpd = _HTTPServer((host, port), self._make_request_handler())
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _make_request_handler(self):
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self.send_error(404)
+                    return
+
+                token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+                if server.secret_token and not hmac.compare_digest(token, server.secret_token):
+                    server._count("rejected")
+                    self.send_error(403)
+                    return
+
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    update = types.Update.de_json(self.rfile.read(length).decode("utf-8"))
+                except (ValueError, json.JSONDecodeError) as e:
+                    logging.warning(f"Некорректное обновление от webhook: {e}")
+                    self.send_error(400)
+                    return
+
+                if not server.dispatcher.submit(update, block=False):
+                    server._count("overflow")
+                    self.send_error(503)
+                    return
+
+                server._count("received")
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # Не пишем в лог каждую доставку обновления
+                pass
+
+        return RequestHandler
+
+    def serve_forever(self):
+        """
+        Запускает диспетчер и HTTP-сервер. Блокирует вызывающий поток до shutdown() (или KeyboardInterrupt).
+        Принятые обновления дорабатывает dispatcher.stop() при завершении бота.
+        """
+        self.dispatcher.start()
+        logging.info(f"Webhook слушает {self.httpd.server_address} {self.path}")
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self):
+        """Останавливает приём обновлений (вызывать из другого потока, не из serve_forever)."""
+        self.httpd.shutdown()